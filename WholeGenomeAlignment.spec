@@ -4,13 +4,87 @@ A KBase module: WholeGenomeAlignment
 
 module WholeGenomeAlignment {
 
+    /*
+        A part of one contig to align.  start and end are 1-based and
+        inclusive; leaving them out selects the whole contig.
+
+        @optional start
+        @optional end
+    */
+    typedef structure {
+        string contig_id;
+        int start;
+        int end;
+    } Region;
+
+    /*
+        Clean-up applied to every input before alignment.  Output
+        coordinates are lifted back to the original contigs.
+
+        min_contig_length - drop contigs (and pieces left after splitting)
+                   shorter than this (bp), default 300
+        max_n_run - split contigs at runs of more Ns than this, default 100
+        mask_low_complexity - soft-mask (lower-case) low complexity windows,
+                   default 0
+
+        @optional min_contig_length
+        @optional max_n_run
+        @optional mask_low_complexity
+    */
+    typedef structure {
+        int min_contig_length;
+        int max_n_run;
+        int mask_low_complexity;
+    } ConditioningParams;
+
     /*
         Run Mugsy.
 
         workspace_name - the name of the workspace for input/output
         input_genomeset_ref - optional input reference to genome set
         input_genome_refs - optional input list of references to genome objects
+        input_fasta_files - optional list of paths of FASTA files (optionally gzipped)
+                   in the caller's own directory (<root>/<user id>) under the
+                   service's input-file-roots; regions of a file are
+                   keyed by its path, and conditioning and duplicate detection
+                   apply to files as to genomes
         output_alignment_name - the name of the output alignment
+        input_alignment_ref - optional reference to an existing WholeGenomeAlignment
+                   to extend; only the genomes listed above are aligned, against
+                   a consensus of each existing block, and merged into it
+        regions - optional map from genome reference (or input file path) to the
+                   contigs or intervals of that genome to align; genomes not
+                   listed are aligned in full.
+                   Output coordinates always refer to the original contigs.
+        conditioning - optional clean-up of draft assemblies before alignment
+        extract_core - optionally (1) write the core alignment (columns present in
+                   every genome), a concatenated core FASTA and per-genome
+                   accessory intervals next to the alignment, default 0
+        call_variants - optionally (1) write the SNPs and indels of every genome
+                   against variant_reference as VCF, default 0
+        variant_reference - genome reference (one of the inputs) whose coordinates
+                   the VCF uses, default the first genome aligned
+        compute_tree - optionally (1) compute pairwise distances over the aligned
+                   columns and a neighbor-joining tree (Newick), default 0
+        distance_model - "p" (proportion of differing columns) or "jc"
+                   (Jukes-Cantor corrected), default "jc"
+        sketch_guide_tree - optionally (1) build a neighbor-joining tree from MinHash
+                   sketches of the inputs (cached across jobs); Mauve gets it as its
+                   guide tree and Mugsy gets the inputs in tree order, default 0
+        compact_rows - optionally (1) save each row as its ungapped sequence plus a
+                   'gaps' list of (residues before, run length) pairs instead of
+                   the gapped text, default 0
+        resume - optionally (1) work in a directory kept for these exact params and
+                   input object versions, so that running the job again after a
+                   failure skips the stages it already completed; a run of the
+                   same job while one is in progress fails, default 0
+        timeout - wall-clock limit in seconds for the aligner, after which it is
+                   stopped and the job fails, default from the service config
+        auto_params - optionally (1) estimate the divergence and sizes of the inputs
+                   from MinHash sketches and choose minlength/distance (Mugsy) or
+                   hmm_identity and the distance scales (Mauve) for those left
+                   unset (0 counts as set), from hand-chosen relatedness tiers
+                   that are heuristics rather than tuned values, default 0
 
         minlength - minimum span of an aligned region in a colinear block (bp), default 30
         distance - maximum distance along a single sequence (bp) for chaining
@@ -18,6 +92,20 @@ module WholeGenomeAlignment {
 
         @optional input_genomeset
         @optional input_genome_names
+        @optional input_fasta_files
+        @optional input_alignment_ref
+        @optional regions
+        @optional conditioning
+        @optional extract_core
+        @optional call_variants
+        @optional variant_reference
+        @optional compute_tree
+        @optional distance_model
+        @optional sketch_guide_tree
+        @optional compact_rows
+        @optional resume
+        @optional timeout
+        @optional auto_params
         @optional minlength
         @optional distance
     */
@@ -25,7 +113,21 @@ module WholeGenomeAlignment {
         string workspace_name;
         string input_genomeset;
         list<string> input_genome_names;
+        list<string> input_fasta_files;
         string output_alignment_name;
+        string input_alignment_ref;
+        mapping<string, list<Region>> regions;
+        ConditioningParams conditioning;
+        int extract_core;
+        int call_variants;
+        string variant_reference;
+        int compute_tree;
+        string distance_model;
+        int sketch_guide_tree;
+        int compact_rows;
+        int resume;
+        int timeout;
+        int auto_params;
 
         int minlength;
         int distance;
@@ -43,4 +145,122 @@ module WholeGenomeAlignment {
 
     funcdef run_mauve(MauveParams params) returns (WGAOutput output)
         authentication required;
+
+    /*
+        Get the part of a saved alignment that covers a window of one genome.
+
+        alignment_ref - reference to a ComparativeGenomics.WholeGenomeAlignment
+        genome - the genome number used in the alignment row ids, e.g. "3"
+        contig - optional contig id, for alignments whose rows name contigs
+        start, end - the window on the genome, 1-based and inclusive
+        page_size - optional number of alignment columns per page
+        page - optional 0-based page to return, default 0; it must be less
+               than the number of pages
+
+        @optional contig
+        @optional page_size
+        @optional page
+    */
+    typedef structure {
+        string alignment_ref;
+        string genome;
+        string contig;
+        int start;
+        int end;
+        int page_size;
+        int page;
+    } AlignmentRegionParams;
+
+    /*
+        One row of an alignment slice; start and end are 1-based and inclusive,
+        or both 0 for a row saved without coordinates in its id.
+    */
+    typedef structure {
+        string genome;
+        string contig;
+        int start;
+        int end;
+        string strand;
+        string sequence;
+    } AlignedSegment;
+
+    typedef structure {
+        int columns;
+        list<AlignedSegment> rows;
+    } AlignedBlock;
+
+    /*
+        blocks - the aligned blocks overlapping the window, cut down to the
+                 window and to the requested page, in genome order
+        total_columns - the number of alignment columns over all pages
+    */
+    typedef structure {
+        string alignment_ref;
+        list<AlignedBlock> blocks;
+        int total_columns;
+        int page;
+        int pages;
+    } AlignmentRegion;
+
+    funcdef get_alignment_region(AlignmentRegionParams params) returns (AlignmentRegion region)
+        authentication required;
+
+    /*
+        One alignment of a batch: method is "mugsy" or "mauve" and params
+        are the parameters that method takes on its own.
+    */
+    typedef structure {
+        string method;
+        MugsyParams params;
+    } AlignmentJob;
+
+    /*
+        Run several alignments that share input genomes.
+
+        jobs - the alignments to run
+        max_concurrent - optional number of alignments run at once, default
+                   from the batch-max-concurrent setting of the service
+
+        @optional max_concurrent
+    */
+    typedef structure {
+        list<AlignmentJob> jobs;
+        int max_concurrent;
+    } AlignmentBatchParams;
+
+    /*
+        Outcome of one job: output when it succeeded, error otherwise.
+        elapsed is in seconds.
+
+        @optional output
+        @optional error
+    */
+    typedef structure {
+        string method;
+        string output_alignment_name;
+        WGAOutput output;
+        string error;
+        float elapsed;
+    } AlignmentJobResult;
+
+    /*
+        results - one per job, in the order given
+        genome_inputs, unique_genomes - genome references over all jobs, and
+                   how many of them were distinct (each is fetched once)
+        prepared_inputs, reused_inputs - input FASTA files written, and how
+                   many times one was reused by another job
+        timings - seconds spent on fetch, alignment and total, plus
+                   jobs_total, the sum of the job times
+    */
+    typedef structure {
+        list<AlignmentJobResult> results;
+        int genome_inputs;
+        int unique_genomes;
+        int prepared_inputs;
+        int reused_inputs;
+        mapping<string, float> timings;
+    } AlignmentBatchOutput;
+
+    funcdef run_alignment_batch(AlignmentBatchParams params) returns (AlignmentBatchOutput output)
+        authentication required;
 };
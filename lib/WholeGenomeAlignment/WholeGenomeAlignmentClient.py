@@ -177,4 +177,25 @@ class WholeGenomeAlignment(object):
         resp = self._call('WholeGenomeAlignment.run_mugsy',
                           [params], json_rpc_context)
         return resp[0]
- 
\ No newline at end of file
+ 
+
+    def run_mauve(self, params, json_rpc_context = None):
+        if json_rpc_context and type(json_rpc_context) is not dict:
+            raise ValueError('Method run_mauve: argument json_rpc_context is not type dict as required.')
+        resp = self._call('WholeGenomeAlignment.run_mauve',
+                          [params], json_rpc_context)
+        return resp[0]
+
+    def get_alignment_region(self, params, json_rpc_context = None):
+        if json_rpc_context and type(json_rpc_context) is not dict:
+            raise ValueError('Method get_alignment_region: argument json_rpc_context is not type dict as required.')
+        resp = self._call('WholeGenomeAlignment.get_alignment_region',
+                          [params], json_rpc_context)
+        return resp[0]
+
+    def run_alignment_batch(self, params, json_rpc_context = None):
+        if json_rpc_context and type(json_rpc_context) is not dict:
+            raise ValueError('Method run_alignment_batch: argument json_rpc_context is not type dict as required.')
+        resp = self._call('WholeGenomeAlignment.run_alignment_batch',
+                          [params], json_rpc_context)
+        return resp[0]
@@ -4,10 +4,12 @@ import sys
 import traceback
 import json
 import logging
+import shutil
 import subprocess
 import tempfile
+import time
 import uuid
-import hashlib
+import multiprocessing
 
 from datetime import datetime
 
@@ -17,6 +19,31 @@ from Bio.SeqRecord import SeqRecord
 
 from biokbase.workspace.client import Workspace as workspaceService
 
+from WholeGenomeAlignment import alignment_io
+from WholeGenomeAlignment.alignment_merge import IncrementalMerge, CONSENSUS_GENOME, block_description, make_contig
+from WholeGenomeAlignment.coordinates import CoordinateMap, extract_regions, lift_maf, lift_xmfa, lift_backbone
+from WholeGenomeAlignment.dedup import GenomeDeduplicator, expand_rows, sequence_md5
+from WholeGenomeAlignment.conditioning import Conditioner
+from WholeGenomeAlignment.alignment_index import AlignmentIndex, INDEX_SUFFIX
+from WholeGenomeAlignment.region_query import RegionCache, query_region, write_local_copy
+from WholeGenomeAlignment.backbone import Backbone, summary_report, summary_meta
+from WholeGenomeAlignment.core_genome import extract_core
+from WholeGenomeAlignment.variants import write_vcf
+from WholeGenomeAlignment.distance import MODELS as DISTANCE_MODELS, alignment_distances, distance_report
+from WholeGenomeAlignment.cache import FileCache, file_md5
+from WholeGenomeAlignment.sketch import SketchCache, leaf_order, distance_matrix
+from WholeGenomeAlignment.auto_params import (choose as choose_params, default_seed_weight, fasta_size,
+                                              seed_weight)
+from WholeGenomeAlignment.mugsy_mapping import PairwiseMapper, chain_command, concatenate
+from WholeGenomeAlignment.gap_encoding import encode_contigs, decode_contigs
+from WholeGenomeAlignment.batch import SharedInputs, genome_refs_of, run_jobs, job_context
+from WholeGenomeAlignment import resources
+from WholeGenomeAlignment.supervisor import Supervisor
+from WholeGenomeAlignment.checkpoint import JobCheckpoint, JobLock, job_dir, load_json, save_json
+from WholeGenomeAlignment.fasta_input import stage_fasta, user_roots
+from WholeGenomeAlignment import stream_fetch
+from WholeGenomeAlignment.subset_fetch import CONTIGSET_PATHS, fetch_inputs, type_name
+
 
 logging.basicConfig(format="[%(asctime)s %(levelname)s %(name)s] %(message)s",
                     level=logging.INFO)
@@ -52,12 +79,230 @@ class WholeGenomeAlignment:
         sys.stdout.flush()
         # logger.debug(message)
 
-    def contigset_to_fasta(self, contigset, fasta_file):
-        records = []
-        for contig in contigset['contigs']:
-            record = SeqRecord(Seq(contig['sequence']), id=contig['id'], description='')
-            records.append(record)
+    # with regions or a conditioner, only parts of the contigs are written
+    # and the returned CoordinateMap says where each written record came from
+    def contigset_to_fasta(self, contigset, fasta_file, regions=None, conditioner=None):
+        coord_map = None
+        if regions or conditioner is not None:
+            coord_map, pieces = extract_regions(contigset['contigs'], regions, conditioner)
+            records = (SeqRecord(Seq(seq), id=record_id, description='')
+                       for record_id, seq in pieces)
+        else:
+            records = (SeqRecord(Seq(contig['sequence']), id=contig['id'], description='')
+                       for contig in contigset['contigs'])
         SeqIO.write(records, fasta_file, "fasta")
+        return coord_map
+
+    # FASTA files given by path go to the aligner as they are; see
+    # fasta_input.  Only the caller's own staging directory is readable.
+    # Regions and conditioning need the contigs, so such files are read
+    # back and written out again as a ContigSet would be.  Returns what
+    # stage_contigset does, with no 'info'
+    def stage_input_file(self, ctx, path, regions, conditioning, output_dir):
+        roots = user_roots(self.input_file_roots, ctx.get('user_id'))
+        fd, staged = tempfile.mkstemp(suffix='.fa', prefix='file.', dir=output_dir)
+        os.close(fd)
+        records = stage_fasta(path, staged, roots)
+        logger.info("Staged {} as {}: {} records, {} bp".format(
+            path, staged, len(records), sum(record[1] for record in records)))
+        prepared = (None, None)
+        if regions or conditioning:
+            contigset = {'contigs': [{'id': record.id, 'sequence': str(record.seq)}
+                                     for record in SeqIO.parse(staged, 'fasta')]}
+            # staged may be a link to the caller's file, so it is replaced
+            # rather than written over
+            fd, prepared_fasta = tempfile.mkstemp(suffix='.fa', prefix='file.', dir=output_dir)
+            os.close(fd)
+            prepared = self.prepare_fasta(contigset, prepared_fasta, regions, conditioning)
+            os.rename(prepared_fasta, staged)
+        return {'info': None, 'data': None, 'streamed_fasta': staged,
+                'sequence_md5s': [record[2] for record in records], 'prepared': prepared}
+
+    # every genome fetched, prepared and written to output_dir as <key>.fa,
+    # duplicates skipped (see dedup) and given the keys after the aligned
+    # ones.  This is the 'fetch' stage of a resumable job: what it found is
+    # kept in fetch.json, and a resumed run with the staged files intact
+    # reads that instead of fetching again.  Returns (genome_names,
+    # fasta_files, key_of, dedup, coord_maps, conditioning_notes, wsid)
+    def stage_genomes(self, ctx, ws, params, genome_refs, input_files, inputs,
+                      base_alignment, output_dir, checkpoint, wsid):
+        state_file = os.path.join(output_dir, 'fetch.json')
+        if checkpoint.done('fetch'):
+            logger.info("Inputs already staged in {}, resuming after them".format(output_dir))
+            state = load_json(state_file)
+            return (state['genome_names'], state['fasta_files'],
+                    dict((pos, key) for pos, key in state['key_of']),
+                    GenomeDeduplicator(dict((pos, primary) for pos, primary in state['duplicates'])),
+                    dict((key, CoordinateMap.from_json(value))
+                         for key, value in state['coord_maps'].items()),
+                    state['conditioning_notes'], wsid or state['wsid'])
+
+        genome_names = []
+        fasta_files = []
+        regions = params.get("regions") or {}
+        coord_maps = {}
+        conditioning_notes = {}
+        dedup = GenomeDeduplicator()
+        key_of = {}
+        genome_keys = [str(pos+1) for pos in range(len(genome_refs))]
+        if base_alignment is not None:
+            # new genomes are aligned against one consensus sequence per
+            # existing block instead of against every genome already aligned
+            genome_keys = base_alignment.new_genome_keys(len(genome_refs))
+            consensus_fasta = os.path.join(output_dir, "{}.fa".format(CONSENSUS_GENOME))
+            base_alignment.write_consensus_fasta(consensus_fasta)
+            fasta_files.append(consensus_fasta)
+
+        for pos, ref in enumerate(genome_refs):
+            if pos >= len(genome_refs) - len(input_files):
+                genome_names.append("{} (file)".format(ref))
+                obj = self.stage_input_file(ctx, ref, regions.get(ref), params.get("conditioning"), output_dir)
+            else:
+                logger.info("Loading Genome object from workspace for ref: ".format(ref))
+
+                obj = inputs[ref]
+                data = obj["data"]
+                info = obj["info"]
+                wsid = wsid or info[6]
+                logger.info("type_name = {}".format(type_name(info)))
+
+                # if KBaseGenomes.ContigSet
+                if type_name(info) == 'Genome':
+                    # logger.debug("genome = {}".format(json.dumps(data)))
+                    genome_names.append(data.get("scientific_name", "") + " ({})".format(ref))
+                    contigset_ref = data["contigset_ref"]
+                    # distinct Genome objects often share one ContigSet
+                    if dedup.check_ref(pos, contigset_ref, regions.get(ref)) is not None:
+                        continue
+                    obj = self.fetch_contigset(ctx, ws, contigset_ref, params, regions.get(ref), output_dir)
+                    data = obj["data"]
+                    info = obj["info"]
+                    # logger.debug("data = {}".format(json.dumps(data)))
+                else:
+                    genome_names.append(ref.split('/')[1] + " ({})".format(ref.split('/')[0]))
+                    resolved_ref = "{}/{}/{}".format(info[6], info[0], info[4])
+                    if dedup.check_ref(pos, resolved_ref, regions.get(ref)) is not None:
+                        continue
+                    obj = self.fetch_contigset(ctx, ws, resolved_ref, params, regions.get(ref), output_dir)
+                    data = obj["data"]
+
+            if 'streamed_fasta' in obj:
+                duplicate = dedup.check_sequence_md5s(pos, obj['sequence_md5s'], regions.get(ref))
+            else:
+                duplicate = dedup.check_sequence(pos, data["contigs"], regions.get(ref))
+            if duplicate is not None:
+                if 'streamed_fasta' in obj:
+                    os.remove(obj['streamed_fasta'])
+                continue
+
+            # aligned genomes take the first keys so that Mauve's sequence
+            # numbers match the FASTA names; duplicates are numbered after
+            key_of[pos] = genome_keys[len(key_of)]
+            fasta_name = os.path.join(output_dir, "{}.fa".format(key_of[pos]))
+            if 'streamed_fasta' in obj:
+                os.rename(obj['streamed_fasta'], fasta_name)
+                coord_map, conditioning_note = obj.get('prepared', (None, None))
+            else:
+                coord_map, conditioning_note = self.prepare_fasta(data, fasta_name,
+                                                                  regions.get(ref), params.get("conditioning"))
+            if coord_map is not None:
+                if len(coord_map) == 0:
+                    raise ValueError("No sequence left to align for {}".format(ref))
+                logger.info("Aligning {} of {} bp of {}".format(
+                    len(coord_map), sum(coord_map.contig_lengths.values()), ref))
+                coord_maps[key_of[pos]] = coord_map
+            if conditioning_note is not None:
+                conditioning_notes[key_of[pos]] = conditioning_note
+            fasta_files.append(fasta_name)
+
+            # data_ref = str(info[6]) + "/" + str(info[0]) + "/" + str(info[4])
+
+            # logger.info("info = {}".format(json.dumps(info)))
+            # logger.info("data = <<<<<<{}>>>>>>".format(json.dumps(data)))
+
+        for pos in sorted(dedup.duplicates):
+            key_of[pos] = genome_keys[len(key_of)]
+            logger.info("{} duplicates {}, it will not be aligned separately".format(
+                genome_refs[pos], genome_refs[dedup.duplicates[pos]]))
+
+        save_json(state_file, {
+            'genome_names': genome_names, 'fasta_files': fasta_files,
+            'key_of': sorted(key_of.items()), 'duplicates': sorted(dedup.duplicates.items()),
+            'coord_maps': dict((key, coord_map.to_json()) for key, coord_map in coord_maps.items()),
+            'conditioning_notes': conditioning_notes, 'wsid': wsid})
+        checkpoint.complete('fetch', fasta_files + [state_file])
+        return genome_names, fasta_files, key_of, dedup, coord_maps, conditioning_notes, wsid
+
+    # input objects by ref: Genomes cut down to the fields read from them,
+    # all in one call, and ContigSets as info only, for fetch_contigset
+    def fetch_inputs(self, ctx, ws, refs):
+        shared = ctx.get('shared_inputs')
+        if shared is not None:
+            return dict((ref, shared.get_object(ws, ref)) for ref in refs)
+        return dict(zip(refs, fetch_inputs(ws, refs)))
+
+    # only contig ids and sequences, streamed where possible; ref is
+    # resolved (a Genome's contigset_ref is saved as an absolute ref)
+    def fetch_contigset(self, ctx, ws, ref, params, regions, output_dir):
+        if ctx.get('shared_inputs') is not None:
+            return self.stage_contigset(ctx, ws, ref, params, regions, output_dir)
+        if self.can_stream(params, regions):
+            return self.stream_contigset(ctx, ref, output_dir)
+        return ws.get_object_subset([{'ref': ref, 'included': CONTIGSET_PATHS}])[0]
+
+    # ContigSets used whole are streamed to FASTA rather than decoded into
+    # memory; regions and conditioning need the contigs
+    def can_stream(self, params, regions):
+        return self.stream_fetch and not regions and not params.get("conditioning")
+
+    # returns an object with 'info', the 'streamed_fasta' written and the
+    # dedup.sequence_md5 of each contig in place of 'data'
+    def stream_contigset(self, ctx, ref, output_dir):
+        fd, fasta_file = tempfile.mkstemp(suffix='.fa', prefix='stream.', dir=output_dir)
+        os.close(fd)
+        info, md5s = stream_fetch.stream_contigset_fasta(self.workspaceURL, ctx['token'], ref, fasta_file)
+        logger.info("Streamed {} contigs of {} to {}".format(len(md5s), ref, fasta_file))
+        return {'info': info, 'data': None, 'streamed_fasta': fasta_file, 'sequence_md5s': md5s}
+
+    # jobs of run_alignment_batch share the input FASTA of each (ContigSet,
+    # regions, conditioning): the first job to need one streams or fetches
+    # the ContigSet and writes it, and the others link the file.  Returns
+    # what stream_contigset does, with the (coord_map, conditioning
+    # summary) of the FASTA as 'prepared'
+    def stage_contigset(self, ctx, ws, ref, params, regions, output_dir):
+        conditioning = params.get("conditioning")
+
+        def stage(path):
+            if self.can_stream(params, regions):
+                info, md5s = stream_fetch.stream_contigset_fasta(self.workspaceURL, ctx['token'], ref, path)
+                logger.info("Streamed {} contigs of {} to {}".format(len(md5s), ref, path))
+                return info, md5s, (None, None)
+            obj = ws.get_object_subset([{'ref': ref, 'included': CONTIGSET_PATHS}])[0]
+            md5s = [sequence_md5(contig['sequence']) for contig in obj['data']['contigs']]
+            return obj['info'], md5s, self.prepare_fasta(obj['data'], path, regions, conditioning)
+
+        fd, fasta_file = tempfile.mkstemp(suffix='.fa', prefix='staged.', dir=output_dir)
+        os.close(fd)
+        info, md5s, prepared = ctx['shared_inputs'].prepare_fasta(
+            [ref, regions, conditioning], fasta_file, stage)
+        return {'info': info, 'data': None, 'streamed_fasta': fasta_file, 'sequence_md5s': md5s,
+                'prepared': prepared}
+
+    # jobs of run_alignment_batch get the batch's SharedInputs in their
+    # context, so that inputs common to several jobs are fetched once
+    def get_object(self, ctx, ws, ref):
+        shared = ctx.get('shared_inputs')
+        if shared is not None:
+            return shared.get_object(ws, ref)
+        return ws.get_objects([{"ref": ref}])[0]
+
+    # returns (coord_map, conditioning summary or None)
+    def prepare_fasta(self, contigset, fasta_file, regions=None, conditioning=None):
+        conditioner = None
+        if conditioning is not None:
+            conditioner = Conditioner(conditioning)
+        coord_map = self.contigset_to_fasta(contigset, fasta_file, regions, conditioner)
+        return coord_map, conditioner.summary() if conditioner is not None else None
 
     def create_temp_json(self, attrs):
         f = tempfile.NamedTemporaryFile(delete=False)
@@ -65,6 +310,220 @@ class WholeGenomeAlignment:
         f.write(json.dumps(attrs))
         f.close()
         return outjson
+
+    def load_base_alignment(self, ws, alignment_ref):
+        logger.info("Loading WholeGenomeAlignment object to extend: {}".format(alignment_ref))
+        obj = ws.get_objects([{"ref": alignment_ref}])[0]
+        return IncrementalMerge(decode_contigs(obj["data"]["contigs"])), obj["info"]
+
+    # saved rows of the aligner output, each tagged with its block
+    def aligned_contigs(self, aln_fasta):
+        contigs = []
+        for block, header, sequence in alignment_io.read_fasta_blocks(aln_fasta):
+            contigs.append(make_contig(header.split()[0], sequence, block_description(header, block)))
+        return contigs
+
+    def extend_alignment(self, merge, alignment_file, genome_keys):
+        # only the rows of the new genomes are projected, so this is linear
+        # in the size of the aligner output rather than the whole alignment
+        new_genomes = set(genome_keys)
+        for block in alignment_io.read_alignment(alignment_file):
+            merge.add_block(block, new_genomes)
+        return merge.merged_contigs(genome_keys)
+
+    # an extended alignment only exists as contigs; core and variant
+    # extraction read it back from a MAF copy written here.  The copy is
+    # also written when inputs were deduplicated, with the rows of every
+    # duplicate (see dedup.expand_rows), so that duplicates are samples of
+    # the VCF, rows of the core outputs and leaves of the tree like any
+    # other input
+    def analysis_alignment(self, alignment_file, genomes, output_dir, base_alignment, merged_contigs, copies):
+        duplicates = [key for primary in genomes for key in copies.get(primary, [])]
+        if base_alignment is None and not duplicates:
+            return alignment_file, genomes
+        merged_file = os.path.join(output_dir, 'merged.maf')
+        write_local_copy(expand_rows(merged_contigs, copies), merged_file)
+        genomes = genomes + duplicates
+        if base_alignment is not None:
+            genomes = base_alignment.genomes + genomes
+        return merged_file, genomes
+
+    # writes core.xmfa, core.fasta and accessory.tsv to output_dir
+    def extract_core_genome(self, alignment_file, genomes, output_dir, sizes=None):
+        extractor, accessory_bp = extract_core(alignment_io.read_alignment(alignment_file),
+                                               genomes, output_dir, sizes)
+        report = '\nCore genome: {} alignment columns in {} blocks\n'.format(
+            extractor.core_columns, extractor.core_blocks)
+        for genome in genomes:
+            report += '  {}: {} bp accessory\n'.format(genome, accessory_bp[genome])
+        report += 'Core alignment, core FASTA and accessory intervals written to {}\n'.format(output_dir)
+        logger.info(report)
+        return report
+
+    # writes distances.tsv and tree.nwk to output_dir
+    def distance_tree(self, alignment_file, genomes, output_dir, model):
+        d, newick, counter = alignment_distances(alignment_io.read_alignment(alignment_file),
+                                                 genomes, model)
+        distances = distance_report(d, genomes, model)
+        with open(os.path.join(output_dir, 'distances.tsv'), 'w') as f:
+            f.write(distances)
+        with open(os.path.join(output_dir, 'tree.nwk'), 'w') as f:
+            f.write(newick + '\n')
+        report = '\nPairwise distances over aligned columns:\n\n' + distances
+        report += '\nNeighbor-joining tree:\n{}\n'.format(newick)
+        logger.info(report)
+        return report
+
+    # variant_reference is one of the input genome refs, or a genome key of
+    # the alignment being extended; defaults to the first genome aligned
+    def variant_reference(self, params, genome_refs, key_of, dedup, aligned_keys):
+        reference = params.get('variant_reference')
+        if not reference:
+            return aligned_keys[0]
+        if reference in genome_refs:
+            pos = genome_refs.index(reference)
+            return key_of[dedup.duplicates.get(pos, pos)]
+        return reference
+
+    # writes variants.vcf to output_dir with positions on reference
+    def call_variants(self, alignment_file, reference, genomes, output_dir, contig_offsets=None):
+        if os.path.exists(alignment_file + INDEX_SUFFIX):
+            alignment_index = AlignmentIndex.load(alignment_file)
+        else:
+            alignment_index = AlignmentIndex.build(alignment_file)
+        if reference not in alignment_index.genomes():
+            raise ValueError("Variant reference {} is not in the alignment".format(reference))
+        vcf_file = os.path.join(output_dir, 'variants.vcf')
+        writer = write_vcf(alignment_index.ordered_blocks(reference), vcf_file,
+                           reference, genomes, contig_offsets)
+        report = '\nVariants against {}: {} SNPs, {} indels ({} blocks without {})\n'.format(
+            reference, writer.snps, writer.indels, writer.skipped_blocks, reference)
+        if writer.unanchored_indels:
+            report += '{} indels at the start of a block skipped: no reference base before them\n'.format(
+                writer.unanchored_indels)
+        report += 'VCF written to {}\n'.format(vcf_file)
+        logger.info(report)
+        return report, writer
+
+    # checked before anything is fetched or aligned: compute_tree only
+    # reads distance_model once the aligner has finished
+    def check_distance_model(self, params):
+        model = params.get('distance_model')
+        if model and model not in DISTANCE_MODELS:
+            raise ValueError("Unknown distance_model {}, expected one of {}".format(
+                model, ', '.join(DISTANCE_MODELS)))
+
+    # NJ tree of the MinHash distances between the input files, written
+    # to output_dir/guide.nwk; sketches are cached across jobs
+    def sketch_guide_tree(self, fasta_files, labels, output_dir):
+        d, newick, hits, misses = self.sketch_cache.guide_tree(fasta_files, labels)
+        tree_file = os.path.join(output_dir, 'guide.nwk')
+        with open(tree_file, 'w') as f:
+            f.write(newick + '\n')
+        note = '\nGuide tree from MinHash sketches ({} cached, {} computed):\n{}\n'.format(
+            hits, misses, newick)
+        logger.info(note)
+        return newick, tree_file, note
+
+    # fills in the aligner parameters the caller left unset; see auto_params
+    def select_params(self, method, params, fasta_files):
+        sizes = [fasta_size(f) for f in fasta_files]
+        d = distance_matrix([self.sketch_cache.sketch(f) for f in fasta_files],
+                            self.sketch_cache.k, self.sketch_cache.size)
+        chosen, note = choose_params(method, params, sizes, d)
+        logger.info(note)
+        params = dict(params)
+        params.update(chosen)
+        return params, note
+
+    # progressiveMauve keeps its sorted seed list next to each input as
+    # <fasta>.sslist; the list depends on the sequence and the seed weight,
+    # and the default weight follows the sizes of every input of the job, so
+    # the weight used (given, or Mauve's default) is part of the key
+    def seed_index_keys(self, fasta_files, weight):
+        return dict((fasta_file, 'sslist_{}_w{}'.format(file_md5(fasta_file), weight))
+                    for fasta_file in fasta_files)
+
+    def link_seed_indexes(self, seed_keys):
+        linked = set()
+        for fasta_file, key in seed_keys.items():
+            if self.seed_cache.link(key, fasta_file + '.sslist', verify=True):
+                linked.add(fasta_file)
+        logger.info("Reused {} of {} cached seed indexes".format(len(linked), len(seed_keys)))
+        return linked
+
+    def store_seed_indexes(self, seed_keys, linked):
+        for fasta_file, key in seed_keys.items():
+            sslist = fasta_file + '.sslist'
+            if fasta_file not in linked and os.path.exists(sslist):
+                self.seed_cache.put_file(key, sslist)
+
+    # rows are saved as residues plus gap runs; see gap_encoding
+    def compact_rows(self, contigset_data):
+        gapped = sum(len(contig['sequence']) for contig in contigset_data['contigs'])
+        contigset_data['contigs'] = encode_contigs(contigset_data['contigs'])
+        compact = sum(len(contig['sequence']) + 2 * len(contig['gaps'])
+                      for contig in contigset_data['contigs'])
+        return '\nRows stored gap run-length encoded: {} residues and runs instead of {} columns\n'.format(
+            compact, gapped)
+
+    # runs an aligner under a Supervisor: wall-clock limit, process-group
+    # kill and early abort on fatal output, all driven by the process-wide
+    # supervisor loop rather than a thread blocked on the aligner
+    def run_aligner(self, cmd, label, params, console, usages):
+        supervisor = Supervisor(params.get('timeout') or self.aligner_timeout)
+        returncode, usage = supervisor.run(cmd, label, lambda line: self.log(console, line),
+                                           cwd=self.scratch)
+        logger.info("Resource usage of {}".format(usage.describe()))
+        usages.append(usage)
+        logger.debug('return code: {}'.format(returncode))
+        if returncode != 0:
+            raise ValueError('Error running {}, return code: {}\n\n{}'.format(
+                label, returncode, '\n'.join(console)))
+
+    # resumable jobs keep one directory per params and resolved inputs,
+    # locked while they run; see checkpoint.  Returns (output_dir, JobLock
+    # or None)
+    def job_output_dir(self, method, params, timestamp, input_infos, input_files):
+        if params.get('resume'):
+            inputs = (["{}/{}/{}".format(info[6], info[0], info[4]) for info in input_infos] +
+                      [file_md5(path) for path in input_files])
+            output_dir = job_dir(self.scratch, method, params, inputs)
+            job_lock = JobLock(output_dir)
+            logger.info("Working in retained job directory {}".format(output_dir))
+            return output_dir, job_lock
+        # jobs of a batch can start in the same millisecond
+        return tempfile.mkdtemp(prefix='output.{}.'.format(timestamp), dir=self.scratch), None
+
+    def check_call_measured(self, cmdstr, label, usages):
+        usage = resources.check_call(cmdstr, label, shell=True)
+        logger.info("Resource usage of {}".format(usage.describe()))
+        usages.append(usage)
+
+    # one line per tool, totalled over every process of that tool
+    def usage_report(self, usages):
+        by_label = {}
+        for usage in usages:
+            by_label.setdefault(usage.label, []).append(usage)
+        report = '\nResource usage of external processes:\n'
+        for label in sorted(by_label):
+            tool_total = resources.total(by_label[label], label)
+            report += '  {} ({} processes)\n'.format(tool_total.describe(), tool_total.processes)
+        report += '  {}\n'.format(resources.total(usages).describe())
+        return report
+
+    def usage_description(self, usages):
+        usage = resources.total(usages)
+        return '{:.1f} s CPU in {} external processes, peak RSS {}'.format(
+            usage.user + usage.sys, usage.processes, resources.format_bytes(usage.peak_rss))
+
+    # the index is written next to the alignment file as <file>.idx.npz
+    def index_alignment(self, alignment_file):
+        alignment_index = AlignmentIndex.build(alignment_file)
+        index_file = alignment_index.save()
+        logger.info("Indexed {} aligned segments of {} genomes in {}".format(
+            len(alignment_index), len(alignment_index.genomes()), index_file))
+        return alignment_index
     #END_CLASS_HEADER
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -75,6 +534,23 @@ class WholeGenomeAlignment:
         self.scratch = os.path.abspath(config['scratch'])
         if not os.path.exists(self.scratch):
             os.makedirs(self.scratch)
+        self.region_cache = RegionCache(os.path.join(self.scratch, 'alignment_cache'),
+                                        int(config.get('alignment-cache-max-bytes', 20 << 30)))
+        self.sketch_cache = SketchCache(FileCache(os.path.join(self.scratch, 'sketch_cache')))
+        self.mapping_processes = int(config.get('mugsy-mapping-processes') or multiprocessing.cpu_count())
+        self.batch_max_concurrent = int(config.get('batch-max-concurrent') or 4)
+        self.mapping_cache = FileCache(os.path.join(self.scratch, 'nucmer_cache'),
+                                       int(config.get('nucmer-cache-max-bytes', 20 << 30)))
+        self.seed_cache = FileCache(os.path.join(self.scratch, 'sslist_cache'),
+                                    int(config.get('sslist-cache-max-bytes', 20 << 30)))
+        self.aligner_timeout = int(config.get('aligner-timeout-seconds') or 0) or None
+        self.stream_fetch = config.get('stream-fetch', 'true').lower() in ('1', 'true', 'yes')
+        if self.stream_fetch and not stream_fetch.available():
+            logger.info("ijson is not installed; ContigSets will be fetched whole")
+            self.stream_fetch = False
+        self.input_file_roots = [root.strip() for root in
+                                 (config.get('input-file-roots') or '/staging').split(',')
+                                 if root.strip()]
         #END_CONSTRUCTOR
         pass
 
@@ -84,6 +560,7 @@ class WholeGenomeAlignment:
         #BEGIN run_mugsy
 
         logger.info("Running Mugsy with params = {}".format(json.dumps(params)))
+        self.check_distance_model(params)
 
         token = ctx["token"]
         ws = workspaceService(self.workspaceURL, token=token)
@@ -92,9 +569,9 @@ class WholeGenomeAlignment:
         genomeset = None
         if "input_genomeset_ref" in params and params["input_genomeset_ref"] is not None:
             logger.info("Loading GenomeSet object from workspace")
-            objects = ws.get_objects([{"ref": params["input_genomeset_ref"]}])
-            genomeset = objects[0]["data"]
-            wsid = objects[0]['info'][6]
+            genomeset_obj = self.get_object(ctx, ws, params["input_genomeset_ref"])
+            genomeset = genomeset_obj["data"]
+            wsid = genomeset_obj['info'][6]
 
         genome_refs = []
         if genomeset is not None:
@@ -107,188 +584,244 @@ class WholeGenomeAlignment:
                 if genome_ref is not None:
                     genome_refs.append(genome_ref)
 
+        # FASTA files given by path follow the workspace inputs
+        input_files = params.get("input_fasta_files") or []
+        genome_refs += input_files
+
+        base_alignment = None
+        if params.get("input_alignment_ref"):
+            base_alignment, base_info = self.load_base_alignment(ws, params["input_alignment_ref"])
+            wsid = wsid or base_info[6]
+
         logger.info("Final list of genome references: {}".format(genome_refs))
-        if len(genome_refs) < 2:
+        if base_alignment is not None:
+            if len(genome_refs) < 1:
+                raise ValueError("At least one new genome is required to extend an alignment")
+        elif len(genome_refs) < 2:
             raise ValueError("Number of genomes should be more than 1")
         if len(genome_refs) > 10:
             raise ValueError("Number of genomes exceeds 10, which is too many for mugsy")
 
         timestamp = int((datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()*1000)
-        output_dir = os.path.join(self.scratch, 'output.'+str(timestamp))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        inputs = self.fetch_inputs(ctx, ws, genome_refs[:len(genome_refs) - len(input_files)])
+        input_infos = [inputs[ref]['info'] for ref in genome_refs[:len(genome_refs) - len(input_files)]]
+        if genomeset is not None:
+            input_infos.append(genomeset_obj['info'])
+        if base_alignment is not None:
+            input_infos.append(base_info)
+        output_dir, job_lock = self.job_output_dir('run_mugsy', params, timestamp, input_infos, input_files)
+        try:
+            checkpoint = JobCheckpoint(output_dir)
+
+            genome_names, fasta_files, key_of, dedup, coord_maps, conditioning_notes, wsid = \
+                self.stage_genomes(ctx, ws, params, genome_refs, input_files, inputs,
+                                   base_alignment, output_dir, checkpoint, wsid)
+            aligned_keys = [key_of[pos] for pos in sorted(key_of) if pos not in dedup.duplicates]
+
+            if base_alignment is None and len(genome_refs) - len(dedup.duplicates) < 2:
+                raise ValueError("Number of distinct genomes should be more than 1")
+
+            logger.info("fasta_files = {}".format(fasta_files))
+
+            logger.info("Run Mugsy:")
+
+            auto_note = ''
+            if params.get('auto_params'):
+                params, auto_note = self.select_params('mugsy', params, fasta_files)
+
+            maf_file = os.path.join(output_dir, 'out.maf')
+            usages = []
+            guide_note = ''
+            mapping_note = ''
+            if checkpoint.done('align'):
+                logger.info("Alignment already completed in {}, resuming after it".format(output_dir))
+                guide_note = 'Resumed after the completed alignment in {}\n'.format(output_dir)
+            else:
+                # Mugsy aligns better and faster when similar genomes are adjacent
+                mugsy_inputs = fasta_files
+                if params.get('sketch_guide_tree') and len(fasta_files) > 2:
+                    labels = [os.path.basename(f)[:-len('.fa')] for f in fasta_files]
+                    newick, tree_file, guide_note = self.sketch_guide_tree(fasta_files, labels, output_dir)
+                    mugsy_inputs = [fasta_files[labels.index(label)] for label in leaf_order(newick)]
+
+                # the pairwise mapping mugsy would run is done here, through a cache
+                # shared by all jobs, and only the chaining stage is left to mugsyWGA
+                mapping_dir = os.path.join(output_dir, 'mapping')
+                if not os.path.exists(mapping_dir):
+                    os.makedirs(mapping_dir)
+                mapper = PairwiseMapper(self.mapping_cache, mapping_dir,
+                                        ctx.get('mapping_processes', self.mapping_processes),
+                                        Supervisor(params.get('timeout') or self.aligner_timeout))
+                labelled_files, pair_mafs = mapper.map_all(
+                    [(os.path.basename(f)[:-len('.fa')], f) for f in mugsy_inputs])
+                logger.info("Pairwise mappings: {} cached, {} computed on {} processes, {} retried".format(
+                    mapper.hits, mapper.misses, mapper.processes, mapper.retried))
+                usages += mapper.usages
+                mapping_note = 'Pairwise mappings reused from cache: {} of {} ({:.0%})\n'.format(
+                    mapper.hits, mapper.hits + mapper.misses, mapper.hit_rate())
+                cmd = chain_command(output_dir, 'out',
+                                    concatenate(labelled_files, os.path.join(mapping_dir, 'all.fasta')),
+                                    concatenate(pair_mafs, os.path.join(mapping_dir, 'pairwise.maf')),
+                                    params.get('minlength'), params.get('distance'))
+
+                logger.info("CMD: {}".format(' '.join(cmd)))
+                console = []
+                self.run_aligner(cmd, 'mugsyWGA', params, console, usages)
+
+                if coord_maps:
+                    lift_maf(maf_file, coord_maps)
+                checkpoint.complete('align', [maf_file])
+
+            alignment_index = self.index_alignment(maf_file)
+
+
+            report = 'Genomes/ContigSets aligned with Mugsy:\n'
+            if base_alignment is not None:
+                report += '  {} genomes from existing alignment {}\n'.format(
+                    len(base_alignment.genomes), params['input_alignment_ref'])
+            for pos, name in enumerate(genome_names):
+                report += '  {}: {}\n'.format(key_of[pos], name)
+                if key_of[pos] in conditioning_notes:
+                    report += '      conditioned: {}\n'.format(conditioning_notes[key_of[pos]])
+                elif key_of[pos] in coord_maps:
+                    report += '      regions only: {} bp\n'.format(len(coord_maps[key_of[pos]]))
+                if pos in dedup.duplicates:
+                    report += '      identical to {}, rows copied\n'.format(key_of[dedup.duplicates[pos]])
+
+            report += guide_note
+            report += auto_note
+            report += mapping_note
+            report += '\nIndexed {} aligned segments for region lookup\n'.format(len(alignment_index))
+            report += '\n\n============= MAF output =============\n\n'
+            with open(maf_file, 'r') as f:
+                for line in f:
+                    line = line.replace('\n', '')
+                    if len(line) > 80:
+                        report += line[:80]+"...\n"
+                    else:
+                        report += line+"\n"
+
+            print(report)
+
+            # Warning: this reads everything into memory!  Will not work if
+            # the contigset is very large!
+            contigset_data = {
+                'id': 'mugsy.aln',
+                'source': 'User assembled contigs from reads in KBase',
+                'source_id':'none',
+                'md5': 'md5 of what? concat seq? concat md5s?',
+                'contigs':[]
+            }
 
-        genome_names = []
-        fasta_files = []
-        for pos, ref in enumerate(genome_refs):
-            logger.info("Loading Genome object from workspace for ref: ".format(ref))
-
-            obj = ws.get_objects([{"ref": ref}])[0]
-            data = obj["data"]
-            info = obj["info"]
-            wsid = wsid or info[6]
-            type_name = info[2].split('.')[1].split('-')[0]
-            logger.info("type_name = {}".format(type_name))
-
-            # if KBaseGenomes.ContigSet
-            if type_name == 'Genome':
-                # logger.debug("genome = {}".format(json.dumps(data)))
-                genome_names.append(data.get("scientific_name", "") + " ({})".format(ref))
-                contigset_ref = data["contigset_ref"]
-                obj = ws.get_objects([{"ref": contigset_ref}])[0]
-                data = obj["data"]
-                info = obj["info"]
-                # logger.debug("data = {}".format(json.dumps(data)))
+            lengths = []
+            if base_alignment is not None:
+                contigset_data['contigs'] = self.extend_alignment(base_alignment, maf_file, aligned_keys)
+                lengths = [contig['length'] for contig in contigset_data['contigs']]
+            else:
+                aln_fasta = os.path.join(output_dir, 'aln.fasta')
+                # the '=' lines that end each block are kept to tag the rows
+                if not checkpoint.done('fasta_blocks'):
+                    cmdstr = 'maf2fasta.pl < {} > {}'.format(maf_file, aln_fasta)
+                    logger.debug('CMD: {}'.format(cmdstr))
+                    self.check_call_measured(cmdstr, 'maf2fasta.pl', usages)
+                    checkpoint.complete('fasta_blocks', [aln_fasta])
+
+                contigset_data['contigs'] = self.aligned_contigs(aln_fasta)
+                lengths = [contig['length'] for contig in contigset_data['contigs']]
+
+            aln_meta = {}
+            if params.get('extract_core') or params.get('call_variants') or params.get('compute_tree'):
+                analysis_file, analysis_genomes = self.analysis_alignment(
+                    maf_file, aligned_keys, output_dir, base_alignment, contigset_data['contigs'],
+                    dedup.copies(key_of))
+            if params.get('extract_core'):
+                report += self.extract_core_genome(analysis_file, analysis_genomes, output_dir)
+            if params.get('call_variants'):
+                reference = self.variant_reference(params, genome_refs, key_of, dedup, aligned_keys)
+                variant_report, writer = self.call_variants(analysis_file, reference, analysis_genomes, output_dir)
+                report += variant_report
+                aln_meta.update({'variant_reference': reference, 'snps': str(writer.snps),
+                                 'indels': str(writer.indels)})
+            if params.get('compute_tree'):
+                report += self.distance_tree(analysis_file, analysis_genomes, output_dir,
+                                             params.get('distance_model') or 'jc')
+
+            contigset_data['contigs'] = expand_rows(contigset_data['contigs'], dedup.copies(key_of))
+            if params.get('compact_rows'):
+                report += self.compact_rows(contigset_data)
+                aln_meta['row_encoding'] = 'gap_rle'
+            report += self.usage_report(usages)
+
+
+            # provenance
+            input_ws_objects = []
+            if "input_genomeset_ref" in params and params["input_genomeset_ref"] is not None:
+                input_ws_objects.append(params["input_genomeset_ref"])
+            if "input_genome_refs" in params and params["input_genome_refs"] is not None:
+                for genome_ref in params["input_genome_refs"]:
+                    if genome_ref is not None:
+                        input_ws_objects.append(genome_ref)
+            if params.get("input_alignment_ref"):
+                input_ws_objects.append(params["input_alignment_ref"])
+
+            provenance = None
+            if "provenance" in ctx:
+                provenance = ctx["provenance"]
             else:
-                genome_names.append(ref.split('/')[1] + " ({})".format(ref.split('/')[0]))
+                logger.info("Creating provenance data")
+                provenance = [{"service": "WholeGenomeAlignment",
+                               "method": "run_mugsy",
+                               "method_params": [params]}]
 
+            provenance[0]["input_ws_objects"] = input_ws_objects
+            provenance[0]["description"] = "whole genome alignment using mugsy ({})".format(
+                self.usage_description(usages))
 
-            fasta_name = os.path.join(output_dir, "{}.fa".format(pos+1))
-            self.contigset_to_fasta(data, fasta_name)
-            fasta_files.append(fasta_name)
 
-            # data_ref = str(info[6]) + "/" + str(info[0]) + "/" + str(info[4])
+            if wsid is None:
+                # every input was a file; save to the named workspace
+                wsid = ws.get_workspace_info({'workspace': params['workspace_name']})[0]
 
-            # logger.info("info = {}".format(json.dumps(info)))
-            # logger.info("data = <<<<<<{}>>>>>>".format(json.dumps(data)))
+            # save the alignment object
+            aln_obj_info = ws.save_objects({
+                'id': wsid, # set the output workspace ID
+                'objects':[{'type': 'ComparativeGenomics.WholeGenomeAlignment',
+                            'data': contigset_data,
+                            'name': params['output_alignment_name'],
+                            'meta': aln_meta,
+                            'provenance': provenance}]})
 
-        logger.info("fasta_files = {}".format(fasta_files))
-
-        logger.info("Run Mugsy:")
-
-        cmd = ['mugsy', '-p', 'out', '--directory', output_dir ]
-
-        if 'minlength' in params:
-            if params['minlength']:
-                cmd.append('--minlength')
-                cmd.append(str(params['minlength']))
-        if 'distance' in params:
-            if params['distance']:
-                cmd.append('--distance')
-                cmd.append(str(params['distance']))
-
-        cmd += fasta_files
-
-        logger.info("CMD: {}".format(' '.join(cmd)))
-        p = subprocess.Popen(cmd,
-                             cwd = self.scratch,
-                             stdout = subprocess.PIPE,
-                             stderr = subprocess.STDOUT, shell = False)
-
-        console = []
-        while True:
-            line = p.stdout.readline()
-            if not line: break
-            self.log(console, line.replace('\n', ''))
-
-        p.stdout.close()
-        p.wait()
-        logger.debug('return code: {}'.format(p.returncode))
-        if p.returncode != 0:
-            raise ValueError('Error running mugsy, return code: {}\n\n{}'.format(p.returncode, '\n'.join(console)))
-
-
-        report = 'Genomes/ContigSets aligned with Mugsy:\n'
-        for pos, name in enumerate(genome_names):
-            report += '  {}: {}\n'.format(pos+1, name)
-
-        report += '\n\n============= MAF output =============\n\n'
-        maf_file = os.path.join(output_dir, 'out.maf')
-        with open(maf_file, 'r') as f:
-            for line in f:
-                line = line.replace('\n', '')
-                if len(line) > 80:
-                    report += line[:80]+"...\n"
-                else:
-                    report += line+"\n"
-
-        print(report)
-
-        aln_fasta = os.path.join(output_dir, 'aln.fasta')
-        cmdstr = 'maf2fasta.pl < {} | sed "s/=//g" > {}'.format(maf_file, aln_fasta)
-        logger.debug('CMD: {}'.format(cmdstr))
-        subprocess.check_call(cmdstr, shell=True)
-
-        # Warning: this reads everything into memory!  Will not work if
-        # the contigset is very large!
-        contigset_data = {
-            'id': 'mugsy.aln',
-            'source': 'User assembled contigs from reads in KBase',
-            'source_id':'none',
-            'md5': 'md5 of what? concat seq? concat md5s?',
-            'contigs':[]
-        }
 
-        lengths = []
-        for seq_record in SeqIO.parse(aln_fasta, 'fasta'):
-            contig = {
-                'id': seq_record.id,
-                'name': seq_record.name,
-                'description': seq_record.description,
-                'length': len(seq_record.seq),
-                'sequence': str(seq_record.seq),
-                'md5': hashlib.md5(str(seq_record.seq)).hexdigest()
+            reportObj = {
+                'objects_created':[{'ref':params['workspace_name']+'/'+params['output_alignment_name'], 'description':'Mugsy whole genome alignment'}],
+                'text_message': report
             }
-            lengths.append(contig['length'])
-            contigset_data['contigs'].append(contig)
-
-
-        # provenance
-        input_ws_objects = []
-        if "input_genomeset_ref" in params and params["input_genomeset_ref"] is not None:
-            input_ws_objects.append(params["input_genomeset_ref"])
-        if "input_genome_refs" in params and params["input_genome_refs"] is not None:
-            for genome_ref in params["input_genome_refs"]:
-                if genome_ref is not None:
-                    input_ws_objects.append(genome_ref)
-
-        provenance = None
-        if "provenance" in ctx:
-            provenance = ctx["provenance"]
-        else:
-            logger.info("Creating provenance data")
-            provenance = [{"service": "WholeGenomeAlignment",
-                           "method": "run_mugsy",
-                           "method_params": [params]}]
-
-        provenance[0]["input_ws_objects"] = input_ws_objects
-        provenance[0]["description"] = "whole genome alignment using mugsy"
 
-
-        # save the alignment object
-        aln_obj_info = ws.save_objects({
-            'id': wsid, # set the output workspace ID
-            'objects':[{'type': 'ComparativeGenomics.WholeGenomeAlignment',
-                        'data': contigset_data,
-                        'name': params['output_alignment_name'],
+            reportName = '{}.report.{}'.format('run_mugsy', hex(uuid.getnode()))
+            report_obj_info = ws.save_objects({
+                    # 'workspace': params["workspace_name"],
+                'id': wsid,
+                'objects': [
+                    {
+                        'type': 'KBaseReport.Report',
+                        'data': reportObj,
+                        'name': reportName,
                         'meta': {},
-                        'provenance': provenance}]})
-
-
-        reportObj = {
-            'objects_created':[{'ref':params['workspace_name']+'/'+params['output_alignment_name'], 'description':'Mugsy whole genome alignment'}],
-            'text_message': report
-        }
+                        'hidden': 1,
+                        'provenance': provenance
+                    }
+                ]})[0]
 
-        reportName = '{}.report.{}'.format('run_mugsy', hex(uuid.getnode()))
-        report_obj_info = ws.save_objects({
-                # 'workspace': params["workspace_name"],
-            'id': wsid,
-            'objects': [
-                {
-                    'type': 'KBaseReport.Report',
-                    'data': reportObj,
-                    'name': reportName,
-                    'meta': {},
-                    'hidden': 1,
-                    'provenance': provenance
-                }
-            ]})[0]
 
+            # shutil.rmtree(output_dir)
 
-        # shutil.rmtree(output_dir)
-
-        output = {"report_name": reportName, 'report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]) }
+            output = {"report_name": reportName, 'report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]) }
+        finally:
+            if job_lock is not None:
+                job_lock.release()
+            elif ctx.get('remove_output_dir'):
+                # batch jobs share the scratch of one container
+                shutil.rmtree(output_dir, ignore_errors=True)
 
         #END run_mugsy
 
@@ -307,6 +840,7 @@ class WholeGenomeAlignment:
         #BEGIN run_mauve
 
         logger.info("Running progressiveMauve with params = {}".format(json.dumps(params)))
+        self.check_distance_model(params)
 
         token = ctx["token"]
         ws = workspaceService(self.workspaceURL, token=token)
@@ -315,9 +849,9 @@ class WholeGenomeAlignment:
         genomeset = None
         if "input_genomeset_ref" in params and params["input_genomeset_ref"] is not None:
             logger.info("Loading GenomeSet object from workspace")
-            objects = ws.get_objects([{"ref": params["input_genomeset_ref"]}])
-            genomeset = objects[0]["data"]
-            wsid = objects[0]['info'][6]
+            genomeset_obj = self.get_object(ctx, ws, params["input_genomeset_ref"])
+            genomeset = genomeset_obj["data"]
+            wsid = genomeset_obj['info'][6]
 
         genome_refs = []
         if genomeset is not None:
@@ -330,194 +864,273 @@ class WholeGenomeAlignment:
                 if genome_ref is not None:
                     genome_refs.append(genome_ref)
 
+        # FASTA files given by path follow the workspace inputs
+        input_files = params.get("input_fasta_files") or []
+        genome_refs += input_files
+
+        base_alignment = None
+        if params.get("input_alignment_ref"):
+            base_alignment, base_info = self.load_base_alignment(ws, params["input_alignment_ref"])
+            wsid = wsid or base_info[6]
+
         logger.info("Final list of genome references: {}".format(genome_refs))
-        if len(genome_refs) < 2:
+        if base_alignment is not None:
+            if len(genome_refs) < 1:
+                raise ValueError("At least one new genome is required to extend an alignment")
+        elif len(genome_refs) < 2:
             raise ValueError("Number of genomes should be more than 1")
         if len(genome_refs) > 10:
             raise ValueError("Number of genomes exceeds 10, which is too many for mauve")
 
         timestamp = int((datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()*1000)
-        output_dir = os.path.join(self.scratch, 'output.'+str(timestamp))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        inputs = self.fetch_inputs(ctx, ws, genome_refs[:len(genome_refs) - len(input_files)])
+        input_infos = [inputs[ref]['info'] for ref in genome_refs[:len(genome_refs) - len(input_files)]]
+        if genomeset is not None:
+            input_infos.append(genomeset_obj['info'])
+        if base_alignment is not None:
+            input_infos.append(base_info)
+        output_dir, job_lock = self.job_output_dir('run_mauve', params, timestamp, input_infos, input_files)
+        try:
+            checkpoint = JobCheckpoint(output_dir)
 
-        genome_names = []
-        fasta_files = []
-        for pos, ref in enumerate(genome_refs):
-            logger.info("Loading Genome object from workspace for ref: ".format(ref))
-
-            obj = ws.get_objects([{"ref": ref}])[0]
-            data = obj["data"]
-            info = obj["info"]
-            wsid = wsid or info[6]
-            type_name = info[2].split('.')[1].split('-')[0]
-            logger.info("type_name = {}".format(type_name))
-
-            # if KBaseGenomes.ContigSet
-            if type_name == 'Genome':
-                # logger.debug("genome = {}".format(json.dumps(data)))
-                genome_names.append(data.get("scientific_name", "") + " ({})".format(ref))
-                contigset_ref = data["contigset_ref"]
-                obj = ws.get_objects([{"ref": contigset_ref}])[0]
-                data = obj["data"]
-                info = obj["info"]
-                # logger.debug("data = {}".format(json.dumps(data)))
-            else:
-                genome_names.append(ref.split('/')[1] + " ({})".format(ref.split('/')[0]))
+            genome_names, fasta_files, key_of, dedup, coord_maps, conditioning_notes, wsid = \
+                self.stage_genomes(ctx, ws, params, genome_refs, input_files, inputs,
+                                   base_alignment, output_dir, checkpoint, wsid)
+            aligned_keys = [key_of[pos] for pos in sorted(key_of) if pos not in dedup.duplicates]
 
+            if base_alignment is None and len(genome_refs) - len(dedup.duplicates) < 2:
+                raise ValueError("Number of distinct genomes should be more than 1")
 
-            fasta_name = os.path.join(output_dir, "{}.fa".format(pos+1))
-            self.contigset_to_fasta(data, fasta_name)
-            fasta_files.append(fasta_name)
+            logger.info("fasta_files = {}".format(fasta_files))
 
-            # data_ref = str(info[6]) + "/" + str(info[0]) + "/" + str(info[4])
+            logger.info("Run progressiveMauve:")
 
-            # logger.info("info = {}".format(json.dumps(info)))
-            # logger.info("data = <<<<<<{}>>>>>>".format(json.dumps(data)))
+            auto_note = ''
+            if params.get('auto_params'):
+                params, auto_note = self.select_params('mauve', params, fasta_files)
 
-        logger.info("fasta_files = {}".format(fasta_files))
-
-        logger.info("Run progressiveMauve:")
-
-        xmfa_file = os.path.join(output_dir, 'out.xmfa')
-
-        cmd = ['progressiveMauve', '--output={}'.format(xmfa_file)]
-
-        if 'max_breakpoint_distance_scale' in params:
-            if params['max_breakpoint_distance_scale']:
-                cmd.append('--max-breakpoint-distance-scale')
-                cmd.append(str(params['max_breakpoint_distance_scale']))
-        if 'conservation_distance_scale' in params:
-            if params['conservation_distance_scale']:
-                cmd.append('--conservation-distance-scale')
-                cmd.append(str(params['conservation_distance_scale']))
-        if 'hmm_identity' in params:
-            if params['hmm_identity']:
-                cmd.append('--hmm-identity')
-                cmd.append(str(params['hmm_identity']))
-
-        cmd += fasta_files
-
-        logger.info("CMD: {}".format(' '.join(cmd)))
-        p = subprocess.Popen(cmd,
-                             cwd = self.scratch,
-                             stdout = subprocess.PIPE,
-                             stderr = subprocess.STDOUT, shell = False)
-
-        console = []
-        while True:
-            line = p.stdout.readline()
-            if not line: break
-            self.log(console, line.replace('\n', ''))
-
-        p.stdout.close()
-        p.wait()
-        logger.debug('return code: {}'.format(p.returncode))
-        if p.returncode != 0:
-            raise ValueError('Error running progressiveMauve, return code: {}\n\n{}'.format(p.returncode, '\n'.join(console)))
-
-
-        report = 'Genomes/ContigSets aligned with Mauve:\n'
-        for pos, name in enumerate(genome_names):
-            report += '  {}: {}\n'.format(pos+1, name)
-
-        report += '\n\n============= XMFA.backbone output =============\n\n'
-        backbone_file =  os.path.join(output_dir, 'out.xmfa.backbone')
-        with open(backbone_file, 'r') as f:
-            for line in f:
-                line = line.replace('\n', '')
-                if len(line) > 80:
-                    report += line[:80]+"...\n"
-                else:
-                    report += line+"\n"
-
-        print(report)
-
-        aln_fasta = os.path.join(output_dir, 'aln.fasta')
-        cmdstr = 'cat {} | sed "s/^#.*//g; s/=//g" > {}'.format(xmfa_file, aln_fasta)
-        logger.debug('CMD: {}'.format(cmdstr))
-        subprocess.check_call(cmdstr, shell=True)
-
-        # Warning: this reads everything into memory!  Will not work if
-        # the contigset is very large!
-        contigset_data = {
-            'id': 'mauve.aln',
-            'source': 'User assembled contigs from reads in KBase',
-            'source_id':'none',
-            'md5': 'md5 of what? concat seq? concat md5s?',
-            'contigs':[]
-        }
+            xmfa_file = os.path.join(output_dir, 'out.xmfa')
 
-        lengths = []
-        for seq_record in SeqIO.parse(aln_fasta, 'fasta'):
-            contig = {
-                'id': seq_record.id,
-                'name': seq_record.name,
-                'description': seq_record.description,
-                'length': len(seq_record.seq),
-                'sequence': str(seq_record.seq),
-                'md5': hashlib.md5(str(seq_record.seq)).hexdigest()
+            usages = []
+            guide_note = ''
+            seed_note = ''
+            if checkpoint.done('align'):
+                logger.info("Alignment already completed in {}, resuming after it".format(output_dir))
+                guide_note = 'Resumed after the completed alignment in {}\n'.format(output_dir)
+            else:
+                cmd = ['progressiveMauve', '--output={}'.format(xmfa_file)]
+
+                if 'max_breakpoint_distance_scale' in params:
+                    if params['max_breakpoint_distance_scale']:
+                        cmd.append('--max-breakpoint-distance-scale')
+                        cmd.append(str(params['max_breakpoint_distance_scale']))
+                if 'conservation_distance_scale' in params:
+                    if params['conservation_distance_scale']:
+                        cmd.append('--conservation-distance-scale')
+                        cmd.append(str(params['conservation_distance_scale']))
+                if 'hmm_identity' in params:
+                    if params['hmm_identity']:
+                        cmd.append('--hmm-identity')
+                        cmd.append(str(params['hmm_identity']))
+
+                # progressiveMauve names the leaves of its guide trees seq1..seqN in
+                # input order; supplying one skips its own pairwise seed-match pass
+                if params.get('sketch_guide_tree') and len(fasta_files) > 2:
+                    labels = ['seq{}'.format(i + 1) for i in range(len(fasta_files))]
+                    newick, tree_file, guide_note = self.sketch_guide_tree(fasta_files, labels, output_dir)
+                    cmd.append('--input-guide-tree={}'.format(tree_file))
+
+                # Mauve's own weight unless the caller or auto_params sets one
+                sizes = [fasta_size(fasta_file) for fasta_file in fasta_files]
+                weight = params.get('seed_weight')
+                if not weight and params.get('auto_params'):
+                    weight = seed_weight(sizes)
+                if weight:
+                    cmd.append('--seed-weight={}'.format(weight))
+                    weight_note = str(weight)
+                else:
+                    weight = default_seed_weight(sizes)
+                    weight_note = "{} (progressiveMauve's default)".format(weight)
+
+                cmd += fasta_files
+
+                seed_keys = self.seed_index_keys(fasta_files, weight)
+                cached_seed_indexes = self.link_seed_indexes(seed_keys)
+
+                logger.info("CMD: {}".format(' '.join(cmd)))
+                console = []
+                self.run_aligner(cmd, 'progressiveMauve', params, console, usages)
+                self.store_seed_indexes(seed_keys, cached_seed_indexes)
+                seed_note = 'Seed weight {}, seed indexes reused from cache: {} of {}\n'.format(
+                    weight_note, len(cached_seed_indexes), len(seed_keys))
+
+                if coord_maps:
+                    xmfa_names = alignment_io.read_xmfa_names(xmfa_file)
+                    cuts = lift_xmfa(xmfa_file, coord_maps, xmfa_names)
+                    lift_backbone(xmfa_file + '.backbone', coord_maps, xmfa_names, cuts)
+                checkpoint.complete('align', [xmfa_file, xmfa_file + '.backbone'])
+
+            alignment_index = self.index_alignment(xmfa_file)
+
+
+            report = 'Genomes/ContigSets aligned with Mauve:\n'
+            if base_alignment is not None:
+                report += '  {} genomes from existing alignment {}\n'.format(
+                    len(base_alignment.genomes), params['input_alignment_ref'])
+            for pos, name in enumerate(genome_names):
+                report += '  {}: {}\n'.format(key_of[pos], name)
+                if key_of[pos] in conditioning_notes:
+                    report += '      conditioned: {}\n'.format(conditioning_notes[key_of[pos]])
+                elif key_of[pos] in coord_maps:
+                    report += '      regions only: {} bp\n'.format(len(coord_maps[key_of[pos]]))
+                if pos in dedup.duplicates:
+                    report += '      identical to {}, rows copied\n'.format(key_of[dedup.duplicates[pos]])
+
+            report += guide_note
+            report += auto_note
+            report += seed_note
+            report += '\nIndexed {} aligned segments for region lookup\n'.format(len(alignment_index))
+            report += '\n\n============= XMFA.backbone summary =============\n\n'
+            backbone_file =  os.path.join(output_dir, 'out.xmfa.backbone')
+            backbone_summary = Backbone.load(backbone_file).summary()
+            xmfa_names = alignment_io.read_xmfa_names(xmfa_file)
+            labels = [xmfa_names.get(str(i+1), str(i+1)) for i in range(len(backbone_summary['core_bp']))]
+            report += summary_report(backbone_summary, labels)
+
+            print(report)
+
+            # Warning: this reads everything into memory!  Will not work if
+            # the contigset is very large!
+            contigset_data = {
+                'id': 'mauve.aln',
+                'source': 'User assembled contigs from reads in KBase',
+                'source_id':'none',
+                'md5': 'md5 of what? concat seq? concat md5s?',
+                'contigs':[]
             }
-            lengths.append(contig['length'])
-            contigset_data['contigs'].append(contig)
-
 
-        # provenance
-        input_ws_objects = []
-        if "input_genomeset_ref" in params and params["input_genomeset_ref"] is not None:
-            input_ws_objects.append(params["input_genomeset_ref"])
-        if "input_genome_refs" in params and params["input_genome_refs"] is not None:
-            for genome_ref in params["input_genome_refs"]:
-                if genome_ref is not None:
-                    input_ws_objects.append(genome_ref)
+            lengths = []
+            if base_alignment is not None:
+                contigset_data['contigs'] = self.extend_alignment(base_alignment, xmfa_file, aligned_keys)
+                lengths = [contig['length'] for contig in contigset_data['contigs']]
+            else:
+                aln_fasta = os.path.join(output_dir, 'aln.fasta')
+                # the '=' lines that end each block are kept to tag the rows
+                if not checkpoint.done('fasta_blocks'):
+                    cmdstr = 'sed "/^#/d" {} > {}'.format(xmfa_file, aln_fasta)
+                    logger.debug('CMD: {}'.format(cmdstr))
+                    self.check_call_measured(cmdstr, 'xmfa2fasta', usages)
+                    checkpoint.complete('fasta_blocks', [aln_fasta])
+
+                contigset_data['contigs'] = self.aligned_contigs(aln_fasta)
+                lengths = [contig['length'] for contig in contigset_data['contigs']]
+
+            aln_meta = summary_meta(backbone_summary)
+            if params.get('extract_core') or params.get('call_variants') or params.get('compute_tree'):
+                analysis_file, analysis_genomes = self.analysis_alignment(
+                    xmfa_file, aligned_keys, output_dir, base_alignment, contigset_data['contigs'],
+                    dedup.copies(key_of))
+                # XMFA coordinates are on the whole (concatenated) genome
+                contig_offsets = {}
+                if base_alignment is None:
+                    for key, fasta_file in zip(aligned_keys, fasta_files):
+                        if key in coord_maps:
+                            contig_offsets[key] = coord_maps[key].original
+                        else:
+                            contig_offsets[key] = alignment_io.ContigOffsets.from_fasta(fasta_file)
+                    for key, copy_keys in dedup.copies(key_of).items():
+                        for copy_key in copy_keys:
+                            contig_offsets[copy_key] = contig_offsets[key]
+            if params.get('extract_core'):
+                sizes = dict(((key, ''), offsets.total) for key, offsets in contig_offsets.items())
+                report += self.extract_core_genome(analysis_file, analysis_genomes, output_dir, sizes=sizes)
+            if params.get('call_variants'):
+                reference = self.variant_reference(params, genome_refs, key_of, dedup, aligned_keys)
+                variant_report, writer = self.call_variants(analysis_file, reference, analysis_genomes,
+                                                            output_dir, contig_offsets.get(reference))
+                report += variant_report
+                aln_meta.update({'variant_reference': reference, 'snps': str(writer.snps),
+                                 'indels': str(writer.indels)})
+            if params.get('compute_tree'):
+                report += self.distance_tree(analysis_file, analysis_genomes, output_dir,
+                                             params.get('distance_model') or 'jc')
+
+            contigset_data['contigs'] = expand_rows(contigset_data['contigs'], dedup.copies(key_of))
+            if params.get('compact_rows'):
+                report += self.compact_rows(contigset_data)
+                aln_meta['row_encoding'] = 'gap_rle'
+            report += self.usage_report(usages)
+
+
+            # provenance
+            input_ws_objects = []
+            if "input_genomeset_ref" in params and params["input_genomeset_ref"] is not None:
+                input_ws_objects.append(params["input_genomeset_ref"])
+            if "input_genome_refs" in params and params["input_genome_refs"] is not None:
+                for genome_ref in params["input_genome_refs"]:
+                    if genome_ref is not None:
+                        input_ws_objects.append(genome_ref)
+            if params.get("input_alignment_ref"):
+                input_ws_objects.append(params["input_alignment_ref"])
+
+            provenance = None
+            if "provenance" in ctx:
+                provenance = ctx["provenance"]
+            else:
+                logger.info("Creating provenance data")
+                provenance = [{"service": "WholeGenomeAlignment",
+                               "method": "run_mauve",
+                               "method_params": [params]}]
 
-        provenance = None
-        if "provenance" in ctx:
-            provenance = ctx["provenance"]
-        else:
-            logger.info("Creating provenance data")
-            provenance = [{"service": "WholeGenomeAlignment",
-                           "method": "run_mauve",
-                           "method_params": [params]}]
+            provenance[0]["input_ws_objects"] = input_ws_objects
+            provenance[0]["description"] = "whole genome alignment using mauve ({})".format(
+                self.usage_description(usages))
 
-        provenance[0]["input_ws_objects"] = input_ws_objects
-        provenance[0]["description"] = "whole genome alignment using mauve"
 
+            if wsid is None:
+                # every input was a file; save to the named workspace
+                wsid = ws.get_workspace_info({'workspace': params['workspace_name']})[0]
 
-        # save the alignment object
-        aln_obj_info = ws.save_objects({
-            'id': wsid, # set the output workspace ID
-            'objects':[{'type': 'ComparativeGenomics.WholeGenomeAlignment',
-                        'data': contigset_data,
-                        'name': params['output_alignment_name'],
-                        'meta': {},
-                        'provenance': provenance}]})
+            # save the alignment object
+            aln_obj_info = ws.save_objects({
+                'id': wsid, # set the output workspace ID
+                'objects':[{'type': 'ComparativeGenomics.WholeGenomeAlignment',
+                            'data': contigset_data,
+                            'name': params['output_alignment_name'],
+                            'meta': aln_meta,
+                            'provenance': provenance}]})
 
 
-        reportObj = {
-            'objects_created':[{'ref':params['workspace_name']+'/'+params['output_alignment_name'], 'description':'Mauve whole genome alignment'}],
-            'text_message': report
-        }
+            reportObj = {
+                'objects_created':[{'ref':params['workspace_name']+'/'+params['output_alignment_name'], 'description':'Mauve whole genome alignment'}],
+                'text_message': report
+            }
 
-        reportName = '{}.report.{}'.format('run_mauve', hex(uuid.getnode()))
-        report_obj_info = ws.save_objects({
-                # 'workspace': params["workspace_name"],
-            'id': wsid,
-            'objects': [
-                {
-                    'type': 'KBaseReport.Report',
-                    'data': reportObj,
-                    'name': reportName,
-                    'meta': {},
-                    'hidden': 1,
-                    'provenance': provenance
-                }
-            ]})[0]
+            reportName = '{}.report.{}'.format('run_mauve', hex(uuid.getnode()))
+            report_obj_info = ws.save_objects({
+                    # 'workspace': params["workspace_name"],
+                'id': wsid,
+                'objects': [
+                    {
+                        'type': 'KBaseReport.Report',
+                        'data': reportObj,
+                        'name': reportName,
+                        'meta': {},
+                        'hidden': 1,
+                        'provenance': provenance
+                    }
+                ]})[0]
 
 
-        # shutil.rmtree(output_dir)
+            # shutil.rmtree(output_dir)
 
-        output = {"report_name": reportName, 'report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]) }
+            output = {"report_name": reportName, 'report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]) }
+        finally:
+            if job_lock is not None:
+                job_lock.release()
+            elif ctx.get('remove_output_dir'):
+                # batch jobs share the scratch of one container
+                shutil.rmtree(output_dir, ignore_errors=True)
 
         #END run_mauve
 
@@ -527,3 +1140,126 @@ class WholeGenomeAlignment:
                              'output is not type dict as required.')
         # return the results
         return [output]
+
+    def get_alignment_region(self, ctx, params):
+        # ctx is the context object
+        # return variables are: region
+        #BEGIN get_alignment_region
+
+        logger.info("Getting alignment region with params = {}".format(json.dumps(params)))
+
+        for name in ('alignment_ref', 'genome', 'start', 'end'):
+            if params.get(name) is None:
+                raise ValueError("Parameter {} is required".format(name))
+        start = int(params['start'])
+        end = int(params['end'])
+        if start < 1 or end < start:
+            raise ValueError("Invalid region {}-{}".format(start, end))
+        page_size = params.get('page_size')
+        if page_size is not None and page_size < 1:
+            raise ValueError("page_size must be positive")
+        page = params.get('page') or 0
+        if page < 0:
+            raise ValueError("page must not be negative")
+
+        token = ctx["token"]
+        ws = workspaceService(self.workspaceURL, token=token)
+        info = ws.get_object_info_new({'objects': [{'ref': params['alignment_ref']}]})[0]
+        resolved_ref = "{}/{}/{}".format(info[6], info[0], info[4])
+
+        def fetch_contigs():
+            logger.info("Caching a local copy of alignment {}".format(resolved_ref))
+            return decode_contigs(ws.get_objects([{"ref": resolved_ref}])[0]["data"]["contigs"])
+
+        index = self.region_cache.index_for(info, fetch_contigs)
+        region = query_region(index, str(params['genome']), start - 1, end,
+                              contig=params.get('contig'), page_size=page_size,
+                              page=page)
+        region['alignment_ref'] = resolved_ref
+
+        #END get_alignment_region
+
+        # At some point might do deeper type checking...
+        if not isinstance(region, dict):
+            raise ValueError('Method get_alignment_region return value ' +
+                             'region is not type dict as required.')
+        # return the results
+        return [region]
+
+    def run_alignment_batch(self, ctx, params):
+        # ctx is the context object
+        # return variables are: output
+        #BEGIN run_alignment_batch
+
+        logger.info("Running alignment batch with params = {}".format(json.dumps(params)))
+
+        jobs = params.get('jobs') or []
+        if len(jobs) == 0:
+            raise ValueError("At least one job is required")
+        for job in jobs:
+            if job.get('method') not in ('mugsy', 'mauve'):
+                raise ValueError("Unknown alignment method {}, expected mugsy or mauve".format(job.get('method')))
+            if not isinstance(job.get('params'), dict):
+                raise ValueError("Every job needs params")
+            self.check_distance_model(job['params'])
+        max_concurrent = int(params.get('max_concurrent') or self.batch_max_concurrent)
+
+        batch_start = time.time()
+        token = ctx["token"]
+        ws = workspaceService(self.workspaceURL, token=token)
+        timestamp = int((datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()*1000)
+        shared = SharedInputs(tempfile.mkdtemp(prefix='batch.{}.'.format(timestamp), dir=self.scratch))
+
+        # the union of the inputs is fetched up front, one call per level
+        set_refs = [job['params']['input_genomeset_ref'] for job in jobs
+                    if job['params'].get('input_genomeset_ref')]
+        genomesets = dict(zip(set_refs, shared.prefetch(ws, set_refs)))
+        genome_refs = []
+        for job in jobs:
+            genome_refs += genome_refs_of(job['params'], genomesets)
+        # ContigSets are left to the jobs, which share the FASTA written
+        # from each
+        shared.prefetch(ws, genome_refs, subset=True)
+        fetch_time = time.time() - batch_start
+        logger.info("Fetched {} objects for {} genome inputs in {:.1f} s".format(
+            len(shared.objects), len(genome_refs), fetch_time))
+
+        # concurrent Mugsy jobs split the mapping processes between them
+        processes = max(1, self.mapping_processes // max_concurrent)
+
+        def run_job(job):
+            job_ctx = job_context(ctx, shared_inputs=shared, mapping_processes=processes,
+                                  remove_output_dir=True)
+            if job['method'] == 'mugsy':
+                return self.run_mugsy(job_ctx, job['params'])[0]
+            return self.run_mauve(job_ctx, job['params'])[0]
+
+        try:
+            results = run_jobs(jobs, run_job, max_concurrent)
+        finally:
+            shutil.rmtree(shared.work_dir, ignore_errors=True)
+        total_time = time.time() - batch_start
+        output = {
+            'results': results,
+            'genome_inputs': len(genome_refs),
+            'unique_genomes': len(set(genome_refs)),
+            'prepared_inputs': len(shared.prepared),
+            'reused_inputs': shared.reused,
+            'timings': {
+                'fetch': fetch_time,
+                'alignment': total_time - fetch_time,
+                'total': total_time,
+                'jobs_total': sum(result['elapsed'] for result in results)
+            }
+        }
+        logger.info("Batch of {} jobs done in {:.1f} s, {} failed".format(
+            len(jobs), total_time, len([r for r in results if 'error' in r])))
+
+        #END run_alignment_batch
+
+        # At some point might do deeper type checking...
+        if not isinstance(output, dict):
+            raise ValueError('Method run_alignment_batch return value ' +
+                             'output is not type dict as required.')
+        # return the results
+        return [output]
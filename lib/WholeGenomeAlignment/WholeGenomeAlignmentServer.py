@@ -63,6 +63,15 @@ async_check_methods = {}
 async_run_methods['WholeGenomeAlignment.run_mugsy_async'] = ['WholeGenomeAlignment', 'run_mugsy']
 async_check_methods['WholeGenomeAlignment.run_mugsy_check'] = ['WholeGenomeAlignment', 'run_mugsy']
 sync_methods['WholeGenomeAlignment.run_mugsy'] = True
+async_run_methods['WholeGenomeAlignment.run_mauve_async'] = ['WholeGenomeAlignment', 'run_mauve']
+async_check_methods['WholeGenomeAlignment.run_mauve_check'] = ['WholeGenomeAlignment', 'run_mauve']
+sync_methods['WholeGenomeAlignment.run_mauve'] = True
+async_run_methods['WholeGenomeAlignment.get_alignment_region_async'] = ['WholeGenomeAlignment', 'get_alignment_region']
+async_check_methods['WholeGenomeAlignment.get_alignment_region_check'] = ['WholeGenomeAlignment', 'get_alignment_region']
+sync_methods['WholeGenomeAlignment.get_alignment_region'] = True
+async_run_methods['WholeGenomeAlignment.run_alignment_batch_async'] = ['WholeGenomeAlignment', 'run_alignment_batch']
+async_check_methods['WholeGenomeAlignment.run_alignment_batch_check'] = ['WholeGenomeAlignment', 'run_alignment_batch']
+sync_methods['WholeGenomeAlignment.run_alignment_batch'] = True
 
 class AsyncJobServiceClient(object):
 
@@ -338,6 +347,18 @@ class Application(object):
                              name='WholeGenomeAlignment.run_mugsy',
                              types=[dict])
         self.method_authentication['WholeGenomeAlignment.run_mugsy'] = 'required'
+        self.rpc_service.add(impl_WholeGenomeAlignment.run_mauve,
+                             name='WholeGenomeAlignment.run_mauve',
+                             types=[dict])
+        self.method_authentication['WholeGenomeAlignment.run_mauve'] = 'required'
+        self.rpc_service.add(impl_WholeGenomeAlignment.get_alignment_region,
+                             name='WholeGenomeAlignment.get_alignment_region',
+                             types=[dict])
+        self.method_authentication['WholeGenomeAlignment.get_alignment_region'] = 'required'
+        self.rpc_service.add(impl_WholeGenomeAlignment.run_alignment_batch,
+                             name='WholeGenomeAlignment.run_alignment_batch',
+                             types=[dict])
+        self.method_authentication['WholeGenomeAlignment.run_alignment_batch'] = 'required'
         self.auth_client = biokbase.nexus.Client(
             config={'server': 'nexus.api.globusonline.org',
                     'verify_ssl': True,
@@ -0,0 +1,125 @@
+"""
+Random-access coordinate index over a MAF or XMFA alignment file.
+
+For every (genome, contig) the index keeps the aligned intervals sorted by
+start, with the byte offset and length of the block each one belongs to, and
+a running maximum of interval ends.  An overlap query is then two binary
+searches plus a vectorised filter of the candidates, after which only the
+matching blocks are read back from the alignment file.
+
+XMFA rows have no contig (progressiveMauve works on concatenated genomes),
+so they are indexed under the empty contig name.
+"""
+import numpy as np
+
+from WholeGenomeAlignment import alignment_io
+
+
+INDEX_SUFFIX = '.idx.npz'
+
+
+class AlignmentIndex(object):
+
+    def __init__(self, alignment_file, keys, bounds, starts, ends, offsets, lengths):
+        self.alignment_file = alignment_file
+        self.keys = [tuple(k.split('\t', 1)) for k in keys]
+        self.bounds = bounds
+        self.starts = starts
+        self.ends = ends
+        self.offsets = offsets
+        self.lengths = lengths
+        self.max_ends = np.empty_like(ends)
+        for i in range(len(self.keys)):
+            lo, hi = bounds[i], bounds[i + 1]
+            self.max_ends[lo:hi] = np.maximum.accumulate(ends[lo:hi])
+        self._names = None
+
+    @classmethod
+    def build(cls, alignment_file, blocks=None):
+        """Index alignment_file; pass blocks if they are already being read."""
+        if blocks is None:
+            blocks = alignment_io.read_alignment(alignment_file)
+        rows = {}
+        for block in blocks:
+            for row in block.rows:
+                # rows written without coordinates (see region_query)
+                if row.src_size == 0:
+                    continue
+                key = '{}\t{}'.format(row.genome, row.contig or '')
+                rows.setdefault(key, []).append((row.start, row.end, block.offset, block.length))
+
+        keys = sorted(rows)
+        bounds = [0]
+        columns = [[], [], [], []]
+        for key in keys:
+            for values in sorted(rows[key]):
+                for column, value in zip(columns, values):
+                    column.append(value)
+            bounds.append(len(columns[0]))
+        return cls(alignment_file, keys, np.array(bounds, dtype=np.int64),
+                   *[np.array(c, dtype=np.int64) for c in columns])
+
+    def save(self, index_file=None):
+        index_file = index_file or self.alignment_file + INDEX_SUFFIX
+        np.savez_compressed(index_file,
+                            keys=np.array(['\t'.join(k) for k in self.keys]),
+                            bounds=self.bounds, starts=self.starts, ends=self.ends,
+                            offsets=self.offsets, lengths=self.lengths)
+        return index_file
+
+    @classmethod
+    def load(cls, alignment_file, index_file=None):
+        index_file = index_file or alignment_file + INDEX_SUFFIX
+        data = np.load(index_file)
+        return cls(alignment_file, [str(k) for k in data['keys']], data['bounds'],
+                   data['starts'], data['ends'], data['offsets'], data['lengths'])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def genomes(self):
+        return sorted(set(genome for genome, _ in self.keys))
+
+    def contigs(self, genome):
+        return [contig for g, contig in self.keys if g == genome]
+
+    def query(self, genome, start, end, contig=None):
+        """
+        (offset, length) of the blocks with a row of genome overlapping the
+        0-based, half-open [start, end), in file order without repeats.
+        """
+        found = set()
+        for i, (g, c) in enumerate(self.keys):
+            if g != genome or (contig is not None and c != contig):
+                continue
+            lo_bound, hi_bound = self.bounds[i], self.bounds[i + 1]
+            hi = lo_bound + np.searchsorted(self.starts[lo_bound:hi_bound], end, 'left')
+            lo = lo_bound + np.searchsorted(self.max_ends[lo_bound:hi], start, 'right')
+            hits = lo + np.flatnonzero(self.ends[lo:hi] > start)
+            for h in hits:
+                found.add((int(self.offsets[h]), int(self.lengths[h])))
+        return sorted(found)
+
+    def read_blocks(self, genome, start, end, contig=None):
+        """Seek to and parse only the blocks overlapping the query."""
+        if self._names is None and self.alignment_file.endswith('.xmfa'):
+            self._names = alignment_io.read_xmfa_names(self.alignment_file)
+        for offset, length in self.query(genome, start, end, contig):
+            yield alignment_io.read_block(self.alignment_file, offset, length, self._names)
+
+    def ordered_blocks(self, genome):
+        """
+        Every block with a row of genome, ordered by contig and then start
+        on it; blocks with several rows of genome come once, at the first.
+        """
+        if self._names is None and self.alignment_file.endswith('.xmfa'):
+            self._names = alignment_io.read_xmfa_names(self.alignment_file)
+        seen = set()
+        for i, (g, _) in enumerate(self.keys):
+            if g != genome:
+                continue
+            for h in range(self.bounds[i], self.bounds[i + 1]):
+                block = (int(self.offsets[h]), int(self.lengths[h]))
+                if block not in seen:
+                    seen.add(block)
+                    yield alignment_io.read_block(self.alignment_file, block[0], block[1], self._names)
@@ -0,0 +1,297 @@
+"""
+Streaming readers for the block alignment formats written by the aligners
+wrapped in this module: MAF (Mugsy) and XMFA (progressiveMauve).
+
+Rows are normalised so that start/end are 0-based, half-open coordinates on
+the forward strand of the source sequence, whatever the input format uses.
+Every block also carries the byte offset and length of its text in the file
+so callers can come back for it later with read_block().
+"""
+import bisect
+import os
+import string
+
+from StringIO import StringIO
+
+import numpy as np
+
+
+_COMPLEMENT = string.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+
+def reverse_complement(text):
+    return text.translate(_COMPLEMENT)[::-1]
+
+
+def column_positions(row, text=None):
+    """Forward-strand genome position of every column of a row, -1 for gaps."""
+    chars = np.frombuffer(str(row.text if text is None else text), dtype=np.uint8)
+    filled = chars != ord('-')
+    rank = np.cumsum(filled) - 1
+    if row.strand == '-':
+        pos = row.end - 1 - rank
+    else:
+        pos = row.start + rank
+    return np.where(filled, pos, -1)
+
+
+def mask_runs(mask):
+    """(start, end) index ranges where a boolean array is True."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return zip(edges[::2], edges[1::2])
+
+
+def genome_key(name):
+    """The genome part of a sequence name, e.g. '3' for '3.contig_12'."""
+    for sep in ('.', ':'):
+        name = name.split(sep, 1)[0]
+    return name
+
+
+class AlignedRow(object):
+    __slots__ = ('genome', 'contig', 'start', 'end', 'strand', 'src_size', 'text')
+
+    def __init__(self, genome, contig, start, end, strand, src_size, text):
+        self.genome = genome
+        self.contig = contig
+        self.start = start
+        self.end = end
+        self.strand = strand
+        self.src_size = src_size
+        self.text = text
+
+    def __repr__(self):
+        return 'AlignedRow({}:{}:{}-{}{})'.format(self.genome, self.contig,
+                                                 self.start, self.end, self.strand)
+
+
+class AlignmentBlock(object):
+    __slots__ = ('rows', 'offset', 'length')
+
+    def __init__(self, rows, offset, length):
+        self.rows = rows
+        self.offset = offset
+        self.length = length
+
+    @property
+    def columns(self):
+        return len(self.rows[0].text) if self.rows else 0
+
+    def row_for(self, genome):
+        for row in self.rows:
+            if row.genome == genome:
+                return row
+        return None
+
+
+class ContigOffsets(object):
+    """
+    Maps coordinates on a concatenation of contigs back to (contig, offset).
+    progressiveMauve treats each multi-FASTA input as one sequence, so XMFA
+    coordinates have to be split back into contigs with this.
+    """
+
+    def __init__(self, contig_ids, lengths):
+        self.contig_ids = list(contig_ids)
+        self.starts = []
+        total = 0
+        for length in lengths:
+            self.starts.append(total)
+            total += length
+        self.total = total
+
+    def locate(self, pos):
+        index = bisect.bisect_right(self.starts, pos) - 1
+        if index < 0 or pos >= self.total:
+            raise ValueError('Position {} is outside the concatenated sequence'.format(pos))
+        return index, pos - self.starts[index]
+
+    @classmethod
+    def from_fasta(cls, fasta_file):
+        ids = []
+        lengths = []
+        with open(fasta_file, 'r') as f:
+            for line in f:
+                if line.startswith('>'):
+                    ids.append(line[1:].split()[0])
+                    lengths.append(0)
+                elif ids:
+                    lengths[-1] += len(line.strip())
+        return cls(ids, lengths)
+
+
+def read_maf(maf_file):
+    """Yield AlignmentBlocks from a MAF file as they are read."""
+    with open(maf_file, 'r') as f:
+        for block in _maf_blocks(f, 0):
+            yield block
+
+
+def _maf_blocks(f, offset):
+    rows = []
+    block_offset = None
+    block_end = None
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        line_offset = offset
+        offset += len(line)
+        if line.startswith('a'):
+            if rows:
+                yield AlignmentBlock(rows, block_offset, block_end - block_offset)
+            rows = []
+            block_offset = line_offset
+            block_end = offset
+        elif line.startswith('s') and block_offset is not None:
+            _, src, start, size, strand, src_size, text = line.split()
+            start, size, src_size = int(start), int(size), int(src_size)
+            if strand == '-':
+                start = src_size - start - size
+            parts = src.split('.', 1)
+            contig = parts[1] if len(parts) > 1 else None
+            rows.append(AlignedRow(parts[0], contig, start, start + size,
+                                   strand, src_size, text))
+            block_end = offset
+        elif not line.strip():
+            if rows:
+                yield AlignmentBlock(rows, block_offset, block_end - block_offset)
+            rows = []
+            block_offset = None
+        elif block_offset is not None:
+            # i, e and q lines belong to the block but are not needed here
+            block_end = offset
+    if rows:
+        yield AlignmentBlock(rows, block_offset, block_end - block_offset)
+
+
+def read_fasta_blocks(fasta_file):
+    """
+    Yield (block number, header, sequence) for every record of an aligned
+    FASTA in which a line starting with '=' ends each block, as written by
+    maf2fasta.pl and by stripping the comments from XMFA.
+    """
+    block = 0
+    header = None
+    chunks = []
+    in_block = False
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                if header is not None:
+                    yield block, header, ''.join(chunks)
+                header = line[1:].strip()
+                chunks = []
+                in_block = True
+            elif line.startswith('='):
+                if header is not None:
+                    yield block, header, ''.join(chunks)
+                header = None
+                if in_block:
+                    block += 1
+                in_block = False
+            elif header is not None:
+                chunks.append(line.strip())
+    if header is not None:
+        yield block, header, ''.join(chunks)
+
+
+def read_xmfa_names(xmfa_file):
+    """Map XMFA sequence numbers to input FASTA base names from the header."""
+    names = {}
+    with open(xmfa_file, 'r') as f:
+        for line in f:
+            if not line.startswith('#'):
+                break
+            fields = line[1:].rstrip('\n').split('\t')
+            if len(fields) == 2 and fields[0].startswith('Sequence') \
+                    and fields[0].endswith('File'):
+                seq_id = fields[0][len('Sequence'):-len('File')]
+                base = os.path.basename(fields[1])
+                names[seq_id] = os.path.splitext(base)[0]
+    return names
+
+
+def read_xmfa(xmfa_file):
+    """
+    Yield AlignmentBlocks from an XMFA file as they are read.  Rows that do
+    not cover any sequence (Mauve writes these as '> n:0-0') are dropped.
+    Row genomes are the input FASTA base names when the header lists them.
+    """
+    names = read_xmfa_names(xmfa_file)
+    with open(xmfa_file, 'r') as f:
+        for block in _xmfa_blocks(f, 0, names):
+            yield block
+
+
+def _xmfa_blocks(f, offset, names):
+    rows = []
+    header = None
+    chunks = []
+    block_offset = None
+
+    def finish_row():
+        seq_id, span, strand = header
+        start, end = [int(x) for x in span.split('-')]
+        if start > 0 and end > 0:
+            rows.append(AlignedRow(names.get(seq_id, seq_id), None, start - 1, end,
+                                   strand, None, ''.join(chunks)))
+
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        line_offset = offset
+        offset += len(line)
+        if line.startswith('#'):
+            continue
+        elif line.startswith('>'):
+            if header is not None:
+                finish_row()
+            if block_offset is None:
+                block_offset = line_offset
+            fields = line[1:].split()
+            seq_id, span = fields[0].split(':')
+            header = (seq_id, span, fields[1])
+            chunks = []
+        elif line.startswith('='):
+            if header is not None:
+                finish_row()
+            if rows:
+                yield AlignmentBlock(rows, block_offset, offset - block_offset)
+            rows = []
+            header = None
+            block_offset = None
+        elif header is not None:
+            chunks.append(line.strip())
+    if header is not None:
+        finish_row()
+    if rows:
+        yield AlignmentBlock(rows, block_offset, offset - block_offset)
+
+
+def read_alignment(path):
+    """Dispatch on the output file names used by run_mugsy/run_mauve."""
+    if path.endswith('.xmfa'):
+        return read_xmfa(path)
+    return read_maf(path)
+
+
+def read_block(path, offset, length, names=None):
+    """
+    Parse only the block stored at offset in path.  For XMFA, pass the
+    result of read_xmfa_names() to avoid rereading the header every time.
+    """
+    with open(path, 'r') as f:
+        f.seek(offset)
+        text = StringIO(f.read(length))
+    if path.endswith('.xmfa'):
+        if names is None:
+            names = read_xmfa_names(path)
+        blocks = _xmfa_blocks(text, offset, names)
+    else:
+        blocks = _maf_blocks(text, offset)
+    for block in blocks:
+        return block
+    return None
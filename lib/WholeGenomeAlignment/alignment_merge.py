@@ -0,0 +1,291 @@
+"""
+Incremental extension of a saved WholeGenomeAlignment.
+
+The saved object only keeps the gapped rows of every block, in block order,
+each tagged with its block number ("block=N") in the description.  Objects
+saved before the tag was written are regrouped as well as can be done from
+the rows alone: consecutive rows of equal aligned length in which no genome
+repeats.  Each block is reduced to a consensus sequence; new genomes are
+aligned against those consensus sequences only, and their rows are then
+projected back onto the columns of the original blocks.
+"""
+import hashlib
+import itertools
+import re
+
+from collections import OrderedDict
+
+import numpy as np
+
+from WholeGenomeAlignment.alignment_io import ContigOffsets, genome_key, reverse_complement
+
+
+CONSENSUS_GENOME = 'consensus'
+
+_GAP = ord('-')
+_ALPHABET = np.frombuffer(b'ACGTN', dtype=np.uint8)
+_BLOCK_TAG = re.compile(r'(?:^| )block=(\d+)$')
+
+
+def make_contig(contig_id, sequence, description=None):
+    return {
+        'id': contig_id,
+        'name': contig_id,
+        'description': description or contig_id,
+        'length': len(sequence),
+        'sequence': sequence,
+        'md5': hashlib.md5(sequence).hexdigest()
+    }
+
+
+def block_description(description, block):
+    """description with its block tag set to block."""
+    description = _BLOCK_TAG.sub('', description or '')
+    return '{} block={}'.format(description, block) if description else 'block={}'.format(block)
+
+
+def block_of(contig):
+    """Block number a saved row is tagged with, or None."""
+    match = _BLOCK_TAG.search(contig.get('description') or '')
+    return int(match.group(1)) if match else None
+
+
+def blocks_from_contigs(contigs):
+    """Group the rows of a saved alignment back into blocks."""
+    tags = [block_of(contig) for contig in contigs]
+    if contigs and None not in tags:
+        return [[contig for contig, _ in group]
+                for _, group in itertools.groupby(zip(contigs, tags), key=lambda pair: pair[1])]
+    # untagged rows of an older object
+    blocks = []
+    current = []
+    seen = set()
+    for contig in contigs:
+        key = genome_key(contig['id'])
+        if current and (len(contig['sequence']) != len(current[0]['sequence'])
+                        or key in seen):
+            blocks.append(current)
+            current = []
+            seen = set()
+        current.append(contig)
+        seen.add(key)
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def block_consensus(texts):
+    """
+    Majority residue of every column that is not all gaps.  Returns the
+    consensus string and the alignment column of each consensus position.
+    """
+    matrix = np.array([np.frombuffer(str(t).upper(), dtype=np.uint8) for t in texts])
+    counts = np.array([(matrix == c).sum(axis=0) for c in _ALPHABET])
+    occupied = (matrix != _GAP).any(axis=0)
+    columns = np.nonzero(occupied)[0]
+    # anything outside ACGT (IUPAC codes, N) falls through to N
+    residues = _ALPHABET[np.argmax(counts[:4], axis=0)]
+    residues[counts[:4].sum(axis=0) == 0] = ord('N')
+    return residues[columns].tostring(), columns
+
+
+def row_name(genome, contig, start, end):
+    """Row id as the aligners' rows are saved: '3.contig:101-200', or '3:101-200' without a contig."""
+    src = genome if contig is None else '{}.{}'.format(genome, contig)
+    return '{}:{}-{}'.format(src, start, end)
+
+
+def row_description(contig_id, strand, block):
+    return block_description('{} {}'.format(contig_id, strand), block)
+
+
+class _NewRow(object):
+    """
+    Residues of one contig and strand of a new genome placed on the columns
+    of one old block, with the strand relative to the block's rows.
+    insertions maps a consensus position p to the residues inserted after
+    it; p = -1 holds those inserted before the first position.
+    """
+
+    def __init__(self, size):
+        self.placed = np.full(size, _GAP, dtype=np.uint8)
+        self.insertions = {}
+        self.low = None
+        self.high = None
+
+    def cover(self, pos):
+        if self.low is None or pos < self.low:
+            self.low = pos
+        if self.high is None or pos > self.high:
+            self.high = pos
+
+
+class IncrementalMerge(object):
+    """
+    Holds the blocks of an existing alignment and merges the output of an
+    alignment of their consensus sequences against new genomes into them.
+    """
+
+    def __init__(self, contigs):
+        self.blocks = blocks_from_contigs(contigs)
+        self.genomes = []
+        for contig in contigs:
+            key = genome_key(contig['id'])
+            if key not in self.genomes:
+                self.genomes.append(key)
+        self.consensus = [block_consensus([c['sequence'] for c in block])
+                          for block in self.blocks]
+        self.offsets = ContigOffsets(['block{}'.format(i) for i in range(len(self.blocks))],
+                                     [len(seq) for seq, _ in self.consensus])
+        self.new_rows = {}
+        self.extra_blocks = []
+
+    def new_genome_keys(self, count):
+        """Genome keys (and so FASTA base names) that do not clash with old rows."""
+        keys = []
+        n = len(self.genomes)
+        while len(keys) < count:
+            n += 1
+            if str(n) not in self.genomes:
+                keys.append(str(n))
+        return keys
+
+    def write_consensus_fasta(self, fasta_file):
+        with open(fasta_file, 'w') as f:
+            for contig_id, (seq, _) in zip(self.offsets.contig_ids, self.consensus):
+                f.write('>{}\n'.format(contig_id))
+                for i in range(0, len(seq), 80):
+                    f.write(seq[i:i + 80] + '\n')
+
+    def _locate(self, row, positions):
+        """(block, consensus position) arrays of anchor positions."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if row.contig is not None:
+            return np.full(len(positions), int(row.contig[len('block'):]), dtype=np.int64), positions
+        starts = np.asarray(self.offsets.starts, dtype=np.int64)
+        if len(positions) and (positions.min() < 0 or positions.max() >= self.offsets.total):
+            raise ValueError('Anchor positions outside the consensus sequence')
+        blocks = np.searchsorted(starts, positions, 'right') - 1
+        return blocks, positions - starts[blocks]
+
+    def _new_row(self, genome, contig, strand, b):
+        # each (contig, strand) of a genome is a row of its own, in the
+        # order first seen
+        runs = self.new_rows.setdefault(genome, OrderedDict())
+        placed = runs.setdefault((contig, strand), {})
+        if b not in placed:
+            placed[b] = _NewRow(len(self.consensus[b][0]))
+        return placed[b]
+
+    def add_block(self, block, new_genomes):
+        """Project the new-genome rows of one aligner output block."""
+        new = [row for row in block.rows if row.genome in new_genomes]
+        if not new:
+            return
+        anchor = block.row_for(CONSENSUS_GENOME)
+        if anchor is None:
+            self.extra_blocks.append(new)
+            return
+
+        texts = [row.text for row in new]
+        strands = [row.strand for row in new]
+        anchor_text = anchor.text
+        if anchor.strand == '-':
+            texts = [reverse_complement(t) for t in texts]
+            strands = ['-' if s == '+' else '+' for s in strands]
+            anchor_text = reverse_complement(anchor_text)
+
+        anchor_chars = np.frombuffer(str(anchor_text), dtype=np.uint8)
+        anchored = anchor_chars != _GAP
+        if not anchored.any():
+            self.extra_blocks.append(new)
+            return
+        # anchor position of every column: the residue in it, or for a gap
+        # column the residue before it (insertions follow their position)
+        rank = np.cumsum(anchored) - 1
+        first = np.flatnonzero(anchored)[0]
+        blocks, positions = self._locate(anchor, anchor.start + np.maximum(rank, 0))
+        # columns before the first anchor residue insert before its position
+        leading = np.arange(len(anchor_chars)) < first
+        positions = np.where(leading, positions - 1, positions)
+
+        for row, text, strand in zip(new, texts, strands):
+            chars = np.frombuffer(str(text), dtype=np.uint8)
+            filled = chars != _GAP
+            if not filled.any():
+                continue
+            row_rank = np.cumsum(filled) - 1
+            genome_pos = row.start + row_rank if strand == '+' else row.end - 1 - row_rank
+            match = filled & anchored
+            for b in np.unique(blocks[match]).tolist():
+                cols = np.flatnonzero(match & (blocks == b))
+                new_row = self._new_row(row.genome, row.contig, strand, b)
+                free = new_row.placed[positions[cols]] == _GAP
+                new_row.placed[positions[cols[free]]] = chars[cols[free]]
+            inserted = np.flatnonzero(filled & ~anchored)
+            if len(inserted):
+                keys = np.stack([blocks[inserted], positions[inserted]], axis=1)
+                breaks = np.flatnonzero((keys[1:] != keys[:-1]).any(axis=1)) + 1
+                for run in np.split(inserted, breaks):
+                    b, p = int(blocks[run[0]]), int(positions[run[0]])
+                    new_row = self._new_row(row.genome, row.contig, strand, b)
+                    new_row.insertions[p] = new_row.insertions.get(p, '') + chars[run].tostring()
+            for b in np.unique(blocks[filled]).tolist():
+                covered = genome_pos[filled & (blocks == b)]
+                new_row = self._new_row(row.genome, row.contig, strand, b)
+                new_row.cover(int(covered.min()))
+                new_row.cover(int(covered.max()))
+
+    def merged_contigs(self, new_genomes):
+        contigs = []
+        for b, block in enumerate(self.blocks):
+            _, columns = self.consensus[b]
+            rows = [(g, contig, strand, placed[b]) for g in new_genomes
+                    for (contig, strand), placed in self.new_rows.get(g, {}).items()
+                    if b in placed]
+            widths = {}
+            for _, _, _, new_row in rows:
+                for p, chars in new_row.insertions.items():
+                    widths[p] = max(widths.get(p, 0), len(chars))
+            cuts = sorted((_cut(columns, p), w) for p, w in widths.items())
+
+            for contig in block:
+                seq = _expand(contig['sequence'], cuts, lambda p, w: '-' * w)
+                contigs.append(make_contig(contig['id'], seq,
+                                           block_description(contig.get('description'), b)))
+
+            size = len(block[0]['sequence'])
+            for g, contig, strand, new_row in rows:
+                base = np.full(size, _GAP, dtype=np.uint8)
+                base[columns] = new_row.placed
+                by_cut = dict((_cut(columns, p), chars.ljust(widths[p], '-'))
+                              for p, chars in new_row.insertions.items())
+                seq = _expand(base.tostring(), cuts,
+                              lambda cut, w: by_cut.get(cut, '-' * w))
+                contig_id = row_name(g, contig, new_row.low + 1, new_row.high + 1)
+                contigs.append(make_contig(contig_id, seq, row_description(contig_id, strand, b)))
+
+        for b, rows in enumerate(self.extra_blocks, len(self.blocks)):
+            for row in rows:
+                contig_id = row_name(row.genome, row.contig, row.start + 1, row.end)
+                contigs.append(make_contig(contig_id, row.text, row_description(contig_id, row.strand, b)))
+        return contigs
+
+
+def _cut(columns, p):
+    """Column after which insertions at consensus position p go; 0 for p = -1."""
+    return columns[p] + 1 if p >= 0 else 0
+
+
+def _expand(seq, cuts, filler):
+    """Insert filler(cut, width) into seq after every cut column."""
+    if not cuts:
+        return seq
+    pieces = []
+    prev = 0
+    for cut, width in cuts:
+        pieces.append(seq[prev:cut])
+        pieces.append(filler(cut, width))
+        prev = cut
+    pieces.append(seq[prev:])
+    return ''.join(pieces)
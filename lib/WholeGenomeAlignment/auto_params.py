@@ -0,0 +1,121 @@
+"""
+Automatic aligner parameters from MinHash sketches of the inputs.
+
+The defaults of both aligners are a compromise between closely related
+strains and divergent genera.  With auto_params set, the largest Mash
+distance between any two inputs picks a relatedness tier, and the tier's
+values are used for every parameter the caller left unset (absent or null;
+an explicit 0 is kept).  The tiers are heuristics: their distance limits
+and values were chosen by hand to move each default in the direction below,
+not fitted by a measured sweep of alignment quality against divergence, and
+the note logged with a choice says so:
+
+  - Mugsy: closely related genomes are colinear over long stretches, so
+    a larger minlength drops the many short spurious blocks at no loss,
+    while divergent genomes need a longer chaining distance to bridge
+    their more frequent indels.
+  - Mauve: hmm_identity follows the expected identity of homologous
+    regions, so closely related genomes are not searched at a level only
+    divergent ones need, and the breakpoint and conservation distance
+    scales are lowered as rearrangements become more frequent.
+
+The Mbp compared logged with the choice is the sequence the aligner has
+to compare: every pair for Mugsy (each is mapped with nucmer), every input
+against the others once for Mauve.  It is a relative measure of the work
+for comparing jobs, not a predicted time.
+"""
+import numpy as np
+
+
+# (largest Mash distance, name, Mugsy values, Mauve values)
+TIERS = [
+    (0.02, 'closely related strains',
+     {'minlength': 100, 'distance': 1000},
+     {'hmm_identity': 0.9, 'max_breakpoint_distance_scale': 0.5, 'conservation_distance_scale': 0.5}),
+    (0.08, 'same species',
+     {'minlength': 50, 'distance': 1000},
+     {'hmm_identity': 0.8, 'max_breakpoint_distance_scale': 0.5, 'conservation_distance_scale': 0.5}),
+    (0.2, 'same genus',
+     {'minlength': 30, 'distance': 1500},
+     {'hmm_identity': 0.7, 'max_breakpoint_distance_scale': 0.4, 'conservation_distance_scale': 0.4}),
+    (None, 'divergent',
+     {'minlength': 30, 'distance': 2500},
+     {'hmm_identity': 0.6, 'max_breakpoint_distance_scale': 0.3, 'conservation_distance_scale': 0.3})
+]
+
+
+def fasta_size(fasta_file):
+    """Number of residues in a FASTA file."""
+    size = 0
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            if not line.startswith('>'):
+                size += len(line.strip())
+    return size
+
+
+MIN_SEED_WEIGHT = 5
+MAX_SEED_WEIGHT = 31
+
+
+def default_seed_weight(sizes):
+    """
+    The seed weight progressiveMauve picks itself when none is given, from
+    the mean length of its inputs (libMems getDefaultSeedWeight): the bits
+    in that length over 1.5, rounded up.
+    """
+    mean = max(2.0, float(sum(sizes)) / max(1, len(sizes)))
+    weight = int(np.ceil(np.ceil(np.log2(mean)) / 1.5))
+    return min(MAX_SEED_WEIGHT, max(MIN_SEED_WEIGHT, weight))
+
+
+def seed_weight(sizes):
+    """
+    progressiveMauve seed weight chosen with auto_params for inputs of the
+    given sizes: about two thirds of log2 of their mean length, made odd
+    and kept within 9 to 21.
+    """
+    mean = max(1.0, float(sum(sizes)) / max(1, len(sizes)))
+    weight = int(np.log2(mean) * 2 / 3)
+    if weight % 2 == 0:
+        weight += 1
+    return min(21, max(9, weight))
+
+
+def tier_for(max_distance):
+    for limit, name, mugsy, mauve in TIERS:
+        if limit is None or max_distance <= limit:
+            return name, mugsy, mauve
+
+
+def mbp_compared(method, sizes):
+    """Megabases the aligner compares, given the input sizes."""
+    sizes = np.asarray(sizes, dtype=np.float64)
+    n = len(sizes)
+    if method == 'mugsy':
+        # every input is in n - 1 pairs
+        return (n - 1) * sizes.sum() / 1e6
+    return sizes.sum() * max(1, np.log2(n)) / 1e6
+
+
+def choose(method, params, sizes, d):
+    """
+    (values for the parameters params leaves unset, note) for 'mugsy' or
+    'mauve', given the input sizes and their Mash distance matrix.
+    """
+    max_distance = float(d.max()) if len(d) else 0.0
+    mean_distance = float(d[np.triu_indices(len(d), 1)].mean()) if len(d) > 1 else 0.0
+    name, mugsy, mauve = tier_for(max_distance)
+    tier = mugsy if method == 'mugsy' else mauve
+    chosen = dict((key, value) for key, value in tier.items()
+                  if key not in params or params[key] is None)
+    kept = sorted(key for key in tier if key not in chosen)
+    note = '\nAutomatic parameters: {} inputs, {:.1f} Mbp in total, Mash distance max {:.3f}, mean {:.3f}\n'.format(
+        len(sizes), sum(sizes) / 1e6, max_distance, mean_distance)
+    note += '  tier (heuristic): {}\n'.format(name)
+    for key in sorted(chosen):
+        note += '  {} = {}\n'.format(key, chosen[key])
+    if kept:
+        note += '  set by the caller: {}\n'.format(', '.join(kept))
+    note += '  Mbp compared: {:.1f}\n'.format(mbp_compared(method, sizes))
+    return chosen, note
@@ -0,0 +1,119 @@
+"""
+Columnar view of a progressiveMauve .backbone file and synteny summaries.
+
+The file has a header line and then one row per backbone segment with a
+left/right end pair per genome; negative ends mean the reverse strand and
+0 means the genome is absent from the segment.  Everything below works on
+whole (segments x genomes) arrays.
+"""
+import numpy as np
+
+
+class Backbone(object):
+
+    def __init__(self, left, right):
+        self.left = np.abs(left)
+        self.right = np.abs(right)
+        self.strand = np.sign(left)
+        self.present = self.left != 0
+        self.lengths = np.where(self.present, self.right - self.left + 1, 0)
+
+    @classmethod
+    def load(cls, backbone_file):
+        with open(backbone_file, 'r') as f:
+            header = f.readline().split()
+            values = np.loadtxt(f, dtype=np.int64, ndmin=2)
+        if values.size == 0:
+            values = np.zeros((0, len(header)), dtype=np.int64)
+        return cls(values[:, 0::2], values[:, 1::2])
+
+    @property
+    def segments(self):
+        return self.left.shape[0]
+
+    @property
+    def genomes(self):
+        return self.left.shape[1]
+
+    def core(self):
+        return self.present.all(axis=1)
+
+    def shared_bp(self):
+        """genomes x genomes: bp in segments both genomes share (shorter side)."""
+        both = self.present[:, :, None] & self.present[:, None, :]
+        shortest = np.minimum(self.lengths[:, :, None], self.lengths[:, None, :])
+        return (both * shortest).sum(axis=0)
+
+    def lcbs(self):
+        """
+        Group core segments into locally collinear blocks.  Returns the LCB
+        number of each core segment, ordered along the first genome, and the
+        core segment indices in that order.
+        """
+        core = np.flatnonzero(self.core())
+        if len(core) == 0:
+            return np.zeros(0, dtype=np.int64), core
+        core = core[np.argsort(self.left[core, 0])]
+        # orientation relative to the first genome, and order along each genome
+        signs = self.strand[core] * self.strand[core, :1]
+        ranks = np.argsort(np.argsort(self.left[core], axis=0), axis=0)
+        steps = np.diff(ranks, axis=0)
+        collinear = (signs[1:] == signs[:-1]) & (steps == signs[1:])
+        breaks = ~collinear.all(axis=1)
+        return np.concatenate(([0], np.cumsum(breaks))), core
+
+    def summary(self):
+        core = self.core()
+        lcb_ids, core_order = self.lcbs()
+        count = int(lcb_ids[-1]) + 1 if len(lcb_ids) else 0
+        weights = np.zeros(count, dtype=np.int64)
+        signs = np.zeros((count, self.genomes), dtype=np.int64)
+        if count:
+            np.add.at(weights, lcb_ids, self.lengths[core_order].min(axis=1))
+            relative = self.strand[core_order] * self.strand[core_order, :1]
+            signs[lcb_ids] = relative
+        inversions = (signs[:, :, None] != signs[:, None, :]).sum(axis=0)
+        return {
+            'segments': self.segments,
+            'core_segments': int(core.sum()),
+            'lcb_count': count,
+            'lcb_weights': weights,
+            'core_bp': self.lengths[core].sum(axis=0),
+            'accessory_bp': self.lengths[~core].sum(axis=0),
+            'shared_bp': self.shared_bp(),
+            'inversions': inversions
+        }
+
+
+def summary_report(summary, labels):
+    lines = ['Backbone segments: {} ({} shared by all genomes)'.format(
+        summary['segments'], summary['core_segments'])]
+    weights = summary['lcb_weights']
+    if len(weights):
+        lines.append('Locally collinear blocks: {}, weight min/median/max {}/{}/{} bp'.format(
+            summary['lcb_count'], weights.min(), int(np.median(weights)), weights.max()))
+    else:
+        lines.append('Locally collinear blocks: 0')
+    lines.append('')
+    lines.append('Genome\tcore bp\taccessory bp\tLCBs inverted vs {}'.format(labels[0]))
+    for i, label in enumerate(labels):
+        lines.append('{}\t{}\t{}\t{}'.format(label, summary['core_bp'][i],
+                                             summary['accessory_bp'][i],
+                                             summary['inversions'][0, i]))
+    lines.append('')
+    lines.append('Shared bp\t' + '\t'.join(labels))
+    for i, label in enumerate(labels):
+        lines.append(label + '\t' + '\t'.join(str(v) for v in summary['shared_bp'][i]))
+    return '\n'.join(lines) + '\n'
+
+
+def summary_meta(summary):
+    """Compact string metadata for the saved alignment object."""
+    return {
+        'backbone_segments': str(summary['segments']),
+        'core_segments': str(summary['core_segments']),
+        'lcb_count': str(summary['lcb_count']),
+        'core_bp': ','.join(str(v) for v in summary['core_bp']),
+        'accessory_bp': ','.join(str(v) for v in summary['accessory_bp']),
+        'inverted_lcbs': ','.join(str(v) for v in summary['inversions'][0])
+    }
@@ -0,0 +1,136 @@
+"""
+Shared inputs and scheduling for run_alignment_batch.
+
+Jobs in a batch usually overlap in their genomes.  SharedInputs holds the
+GenomeSets and Genomes the batch needs, fetched with one call per level up
+front, and each input FASTA, written once per (resolved ContigSet ref,
+regions, conditioning) and linked into every job that uses it.  ContigSets
+are never held: each is streamed or fetched only when its FASTA is first
+written, and dropped as soon as it is.
+
+The jobs themselves run on a bounded thread pool; the aligners are separate
+processes, so threads are enough to keep them all busy.  All of a batch
+shares one scratch directory, so each job's working directory is removed
+when the job ends (unless it is resumable), and the shared FASTA files when
+the batch does.  Cache hit counts are kept by each job's own mapper and
+guide tree call, not by the caches the jobs share.
+"""
+import copy
+import json
+import os
+import threading
+import time
+import traceback
+
+from multiprocessing.pool import ThreadPool
+
+from WholeGenomeAlignment.cache import link_or_copy
+from WholeGenomeAlignment.subset_fetch import fetch_inputs
+
+
+class SharedInputs(object):
+
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        self.objects = {}
+        self.prepared = {}
+        self.fetches = 0
+        self.reused = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def prefetch(self, ws, refs, subset=False):
+        """
+        Fetch the refs not already held, in one call.  With subset, they
+        are fetched as subset_fetch.fetch_inputs does: Genomes cut down to
+        the fields the pipeline reads and ContigSets as their info only.
+        """
+        missing = sorted(set(ref for ref in refs if ref not in self.objects))
+        if missing:
+            if subset:
+                objects = fetch_inputs(ws, missing)
+            else:
+                objects = ws.get_objects([{'ref': ref} for ref in missing])
+            for ref, obj in zip(missing, objects):
+                self.objects[ref] = obj
+            self.fetches += 1
+        return [self.objects[ref] for ref in refs]
+
+    def get_object(self, ws, ref):
+        if ref in self.objects:
+            return self.objects[ref]
+        with self._lock_for(('object', ref)):
+            if ref not in self.objects:
+                self.objects[ref] = ws.get_objects([{'ref': ref}])[0]
+                self.fetches += 1
+        return self.objects[ref]
+
+    def _lock_for(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def prepare_fasta(self, key, fasta_file, prepare):
+        """
+        Link the prepared FASTA for key to fasta_file, calling
+        prepare(path) -> result only the first time key is seen.  Only the
+        path and the result are kept, so whatever prepare fetched to write
+        the FASTA is freed when it returns.
+        """
+        key = json.dumps(key, sort_keys=True)
+        with self._lock_for(('fasta', key)):
+            if key in self.prepared:
+                self.reused += 1
+            else:
+                with self._lock:
+                    self._count += 1
+                    path = os.path.join(self.work_dir, '{}.fa'.format(self._count))
+                self.prepared[key] = (path, prepare(path))
+        path, result = self.prepared[key]
+        link_or_copy(path, fasta_file)
+        return result
+
+
+def genome_refs_of(params, genomesets):
+    """Input genome refs of one job's params, given the fetched GenomeSets."""
+    refs = []
+    if params.get('input_genomeset_ref'):
+        elements = genomesets[params['input_genomeset_ref']]['data']['elements']
+        refs += [elements[name]['ref'] for name in elements]
+    refs += [ref for ref in params.get('input_genome_refs') or [] if ref is not None]
+    return refs
+
+
+def run_jobs(jobs, run_job, max_concurrent):
+    """
+    Run run_job(job) for every job on max_concurrent threads.  Returns one
+    result per job, in order, with the output or the error and the time taken.
+    """
+    def timed(job):
+        start = time.time()
+        result = {'method': job.get('method'),
+                  'output_alignment_name': job.get('params', {}).get('output_alignment_name')}
+        try:
+            result['output'] = run_job(job)
+        except Exception:
+            result['error'] = traceback.format_exc()
+        result['elapsed'] = time.time() - start
+        return result
+
+    pool = ThreadPool(max(1, min(max_concurrent, len(jobs))))
+    try:
+        return pool.map(timed, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def job_context(ctx, **extra):
+    """Per-job copy of the call context; run methods mutate the provenance."""
+    job_ctx = dict(ctx)
+    if 'provenance' in job_ctx:
+        job_ctx['provenance'] = copy.deepcopy(job_ctx['provenance'])
+    job_ctx.update(extra)
+    return job_ctx
@@ -0,0 +1,127 @@
+"""
+Small content-addressed file cache in scratch.
+
+Entries are single files named by a key the caller derives from content
+(sequence md5 plus whatever settings the cached result depends on), so an
+entry never has to be invalidated, only evicted.  Writes go to a temporary
+name and are renamed into place, which keeps concurrent jobs from seeing
+half-written entries.  Reads touch the entry, and once the cache grows past
+max_bytes the least recently used entries are removed.
+
+Each entry has a <key>.md5 sidecar with its checksum and size.  An entry
+whose size (or, when asked to verify, checksum) does not match is treated as
+corrupt and removed.  Entries are made read-only, so a job that is handed a
+hard link to one cannot rewrite it in place.
+"""
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+_SUM = '.md5'
+_TMP = '.tmp.'
+
+
+def file_md5(path, block_size=1 << 20):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(block_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dest):
+    """Hard link src to dest, copying when they are on different filesystems."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class FileCache(object):
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _remove(self, key):
+        for path in (self.path_for(key), self.path_for(key) + _SUM):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, key, verify=False):
+        """Path of the entry for key, or None if it is missing or corrupt."""
+        path = self.path_for(key)
+        try:
+            with open(path + _SUM, 'r') as f:
+                checksum, size = f.read().split()
+            if os.path.getsize(path) != int(size):
+                raise ValueError('size mismatch')
+            if verify and file_md5(path) != checksum:
+                raise ValueError('checksum mismatch')
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            if os.path.exists(path):
+                self._remove(key)
+            return None
+        return path
+
+    def put(self, key, writer):
+        """Create the entry for key by calling writer(path); returns its path."""
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=_TMP)
+        os.close(fd)
+        try:
+            writer(tmp)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            with open(tmp + _SUM, 'w') as f:
+                f.write('{} {}\n'.format(file_md5(tmp), os.path.getsize(tmp)))
+            os.rename(tmp + _SUM, self.path_for(key) + _SUM)
+            os.rename(tmp, self.path_for(key))
+        finally:
+            for path in (tmp, tmp + _SUM):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.evict()
+        return self.path_for(key)
+
+    def put_file(self, key, src):
+        """Store an existing file, linked rather than copied where possible."""
+        return self.put(key, lambda tmp: link_or_copy(src, tmp))
+
+    def link(self, key, dest, verify=False):
+        """Link the entry for key to dest; False if there is no valid entry."""
+        path = self.get(key, verify)
+        if path is None:
+            return False
+        link_or_copy(path, dest)
+        return True
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(_TMP) or name.endswith(_SUM):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(name)
+            total -= size
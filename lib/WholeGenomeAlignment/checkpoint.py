@@ -0,0 +1,108 @@
+"""
+Resumable job directories.
+
+A job run with resume set works in scratch/jobs/<method>.<digest of its
+params and inputs> instead of a fresh temporary directory, and the directory
+is kept when the job fails.  The inputs are the resolved ref (ws/obj/ver) of
+every input object and the md5 of every input file, so a ref by name that
+has moved on to a new version, or a file that has changed, starts a new
+directory rather than resuming from the old data.
+
+A run holds an exclusive lock on job.lock in the directory until it ends,
+and a second run of the same job fails at once instead of working in the
+directory alongside it.
+
+Each completed stage (fetching the inputs, the alignment, ...) is recorded
+in checkpoint.json with the size of every file it produced, written only
+after the files are complete.  Running the same job again skips every
+stage whose files are still there as recorded and starts from the first
+one that is not.
+"""
+import errno
+import fcntl
+import hashlib
+import json
+import os
+
+
+CHECKPOINT_FILE = 'checkpoint.json'
+LOCK_FILE = 'job.lock'
+RESUME_IGNORED_PARAMS = ('resume', 'timeout')
+
+
+def job_dir(scratch, method, params, inputs):
+    """
+    Retained directory of a job, the same for every run of the same params
+    on the same inputs (resolved refs and file md5s).
+    """
+    key = dict((k, v) for k, v in params.items() if k not in RESUME_IGNORED_PARAMS)
+    digest = hashlib.md5(json.dumps([key, inputs], sort_keys=True)).hexdigest()
+    path = os.path.join(scratch, 'jobs', '{}.{}'.format(method, digest))
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
+
+
+class JobLock(object):
+    """
+    Exclusive lock on a job directory, taken on creation; raises ValueError
+    if another run holds it.  Locks are per open file, so jobs running on
+    threads of one process exclude each other too.
+    """
+
+    def __init__(self, job_dir):
+        self.f = open(os.path.join(job_dir, LOCK_FILE), 'a')
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            self.f.close()
+            self.f = None
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise ValueError('Job directory {} is in use by another run of the same job'.format(job_dir))
+            raise
+
+    def release(self):
+        if self.f is not None:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+            self.f.close()
+            self.f = None
+
+
+class JobCheckpoint(object):
+
+    def __init__(self, job_dir):
+        self.path = os.path.join(job_dir, CHECKPOINT_FILE)
+        self.stages = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.stages = json.load(f)
+            except ValueError:
+                self.stages = {}
+
+    def done(self, stage):
+        """True if stage completed and all of its files are intact."""
+        files = self.stages.get(stage)
+        if files is None:
+            return False
+        for path, size in files.items():
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def complete(self, stage, files):
+        self.stages[stage] = dict((path, os.path.getsize(path)) for path in files)
+        save_json(self.path, self.stages)
+
+
+def save_json(path, value):
+    """Write value to path as JSON, replacing any old file only once complete."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(value, f, indent=1, sort_keys=True)
+    os.rename(tmp, path)
+
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
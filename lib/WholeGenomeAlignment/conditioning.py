@@ -0,0 +1,108 @@
+"""
+Optional clean-up of draft assemblies before they are handed to an aligner.
+
+Contigs shorter than min_contig_length are dropped, contigs are split at runs
+of more than max_n_run Ns, and with mask_low_complexity set, windows of low
+base composition entropy are soft-masked (lower-cased).  Every piece kept is
+a contiguous interval of an original contig, so the CoordinateMap built from
+the pieces lifts aligner output back exactly.
+"""
+import numpy as np
+
+
+DEFAULTS = {
+    'min_contig_length': 300,
+    'max_n_run': 100,
+    'mask_low_complexity': 0,
+    'complexity_window': 32,
+    'min_entropy': 1.3
+}
+
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _c in enumerate('ACGT'):
+    _CODES[ord(_c)] = _i
+    _CODES[ord(_c.lower())] = _i
+
+
+def encode(seq):
+    """ACGT -> 0..3, anything else -> 4."""
+    return _CODES[np.frombuffer(str(seq), dtype=np.uint8)]
+
+
+def n_runs(codes, min_run):
+    """(start, end) of every run of non-ACGT longer than min_run."""
+    is_n = np.concatenate(([False], codes == 4, [False]))
+    edges = np.flatnonzero(is_n[1:] != is_n[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    keep = (ends - starts) > min_run
+    return zip(starts[keep], ends[keep])
+
+
+def low_complexity_windows(codes, window, min_entropy):
+    """Boolean per window of `window` bases: base composition entropy below min_entropy."""
+    nwin = len(codes) // window
+    if nwin == 0:
+        return np.zeros(0, dtype=bool)
+    tiles = codes[:nwin * window].reshape(nwin, window)
+    counts = np.stack([(tiles == b).sum(axis=1) for b in range(4)], axis=1).astype(float)
+    totals = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        freqs = counts / totals[:, None]
+        entropy = -np.nansum(np.where(freqs > 0, freqs * np.log2(freqs), 0.0), axis=1)
+    # windows that are mostly N are handled by the N-run split instead
+    return (entropy < min_entropy) & (totals > window // 2)
+
+
+def soft_mask(text, codes, window, min_entropy):
+    """Lower-case the low complexity windows of text; returns (text, bases masked)."""
+    low = np.flatnonzero(low_complexity_windows(codes, window, min_entropy))
+    if len(low) == 0:
+        return text, 0
+    chars = bytearray(text)
+    for w in low:
+        start = w * window
+        chars[start:start + window] = chars[start:start + window].lower()
+    return str(chars), len(low) * window
+
+
+class Conditioner(object):
+    """Callable for coordinates.extract_regions; also keeps a tally for the report."""
+
+    def __init__(self, options):
+        self.options = dict(DEFAULTS)
+        for key, value in (options or {}).items():
+            if value is not None:
+                self.options[key] = value
+        self.input_bp = 0
+        self.kept_bp = 0
+        self.dropped_contigs = 0
+        self.masked_bp = 0
+
+    def __call__(self, seq, start, end):
+        opts = self.options
+        self.input_bp += end - start
+        if len(seq) < opts['min_contig_length']:
+            self.dropped_contigs += 1
+            return
+        codes = encode(seq[start:end])
+        cut = 0
+        spans = []
+        for run_start, run_end in n_runs(codes, opts['max_n_run']):
+            spans.append((cut, run_start))
+            cut = run_end
+        spans.append((cut, len(codes)))
+
+        for piece_start, piece_end in spans:
+            if piece_end - piece_start < opts['min_contig_length']:
+                continue
+            text = str(seq[start + piece_start:start + piece_end])
+            if opts['mask_low_complexity']:
+                text, masked = soft_mask(text, codes[piece_start:piece_end],
+                                         opts['complexity_window'], opts['min_entropy'])
+                self.masked_bp += masked
+            self.kept_bp += piece_end - piece_start
+            yield start + piece_start, start + piece_end, text
+
+    def summary(self):
+        return 'kept {} of {} bp, dropped {} short contigs, soft-masked {} bp'.format(
+            self.kept_bp, self.input_bp, self.dropped_contigs, self.masked_bp)
@@ -0,0 +1,399 @@
+"""
+Coordinate bookkeeping for aligning only part of a genome.
+
+When the FASTA handed to an aligner holds pieces cut out of the original
+contigs, a CoordinateMap records where every piece came from so that the
+aligner output can be rewritten in original contig coordinates.
+
+Mugsy keeps every written record separate, but progressiveMauve aligns the
+records of a genome as one concatenated sequence, so an XMFA row can run
+from one piece into the next.  Such blocks are split at the column where
+the row crosses into the next piece, so that every row covers a single
+piece and lifts to an exact span; the backbone segments are split at the
+same columns.
+"""
+import bisect
+import os
+
+import numpy as np
+
+from WholeGenomeAlignment.alignment_io import ContigOffsets
+
+XMFA_LINE_WIDTH = 80
+
+
+class Piece(object):
+    __slots__ = ('record_id', 'contig', 'start', 'length')
+
+    def __init__(self, record_id, contig, start, length):
+        self.record_id = record_id
+        self.contig = contig
+        self.start = start
+        self.length = length
+
+
+class CoordinateMap(object):
+    """
+    Pieces of one genome in the order they were written, each a contiguous
+    0-based interval of an original contig, plus the original contig
+    lengths in their original order.
+    """
+
+    def __init__(self, contig_ids, contig_lengths):
+        self.contig_ids = list(contig_ids)
+        self.contig_lengths = dict(zip(contig_ids, contig_lengths))
+        self.original = ContigOffsets(contig_ids, contig_lengths)
+        self.contig_index = dict((c, i) for i, c in enumerate(contig_ids))
+        self.pieces = []
+        self.by_record = {}
+        self._written = None
+
+    def add(self, contig, start, length):
+        record_id = 'r{}'.format(len(self.pieces) + 1)
+        piece = Piece(record_id, contig, start, length)
+        self.pieces.append(piece)
+        self.by_record[record_id] = piece
+        self._written = None
+        return piece
+
+    def lift(self, record_id, pos):
+        """(original contig, original position) of pos within a written record."""
+        piece = self.by_record[record_id]
+        return piece.contig, piece.start + pos
+
+    def _written_offsets(self):
+        if self._written is None:
+            self._written = ContigOffsets([p.record_id for p in self.pieces],
+                                          [p.length for p in self.pieces])
+        return self._written
+
+    def lift_concatenated(self, pos):
+        """Position on the written concatenation -> original concatenation."""
+        index, offset = self._written_offsets().locate(pos)
+        piece = self.pieces[index]
+        return self.original.starts[self.contig_index[piece.contig]] + piece.start + offset
+
+    def boundaries(self):
+        """Positions on the written concatenation where a piece other than the first starts."""
+        return self._written_offsets().starts[1:]
+
+    def crossed(self, start, end):
+        """Piece starts strictly inside [start, end) of the written concatenation."""
+        bounds = self.boundaries()
+        return bounds[bisect.bisect_right(bounds, start):bisect.bisect_left(bounds, end)]
+
+    def lift_span(self, start, end):
+        """[start, end) on the written concatenation -> original; it must lie in one piece."""
+        if self.crossed(start, end):
+            raise ValueError('Span {}-{} of the aligned sequence crosses a cut between pieces'.format(
+                start + 1, end))
+        return self.lift_concatenated(start), self.lift_concatenated(end - 1) + 1
+
+    def __len__(self):
+        return sum(p.length for p in self.pieces)
+
+    def to_json(self):
+        return {'contigs': [[c, self.contig_lengths[c]] for c in self.contig_ids],
+                'pieces': [[p.contig, p.start, p.length] for p in self.pieces]}
+
+    @classmethod
+    def from_json(cls, value):
+        coord_map = cls([c for c, _ in value['contigs']], [length for _, length in value['contigs']])
+        for contig, start, length in value['pieces']:
+            coord_map.add(contig, start, length)
+        return coord_map
+
+
+def parse_regions(contigs, regions):
+    """
+    Turn Region dicts (contig_id, optional 1-based inclusive start/end) into
+    sorted, merged 0-based half-open intervals per contig.
+    """
+    lengths = dict((c['id'], len(c['sequence'])) for c in contigs)
+    intervals = {}
+    for region in regions:
+        contig_id = region['contig_id']
+        if contig_id not in lengths:
+            raise ValueError('Region refers to unknown contig: {}'.format(contig_id))
+        start = region.get('start') or 1
+        end = region.get('end') or lengths[contig_id]
+        end = min(end, lengths[contig_id])
+        if start < 1 or start > end:
+            raise ValueError('Invalid region {}:{}-{}'.format(contig_id, start, end))
+        intervals.setdefault(contig_id, []).append((start - 1, end))
+
+    merged = {}
+    for contig_id, spans in intervals.items():
+        spans.sort()
+        out = [list(spans[0])]
+        for start, end in spans[1:]:
+            if start <= out[-1][1]:
+                out[-1][1] = max(out[-1][1], end)
+            else:
+                out.append([start, end])
+        merged[contig_id] = [tuple(s) for s in out]
+    return merged
+
+
+def extract_regions(contigs, regions=None, conditioner=None):
+    """
+    Yield (record_id, sequence) for the requested regions (whole contigs when
+    regions is None), in original contig order, and fill in the returned
+    CoordinateMap as they are produced.  A conditioner, if given, is called
+    with (sequence, start, end) and yields the (start, end, text) pieces to
+    keep from that interval.
+    """
+    intervals = parse_regions(contigs, regions) if regions else None
+    coord_map = CoordinateMap([c['id'] for c in contigs],
+                              [len(c['sequence']) for c in contigs])
+
+    def records():
+        for contig in contigs:
+            seq = contig['sequence']
+            if intervals is None:
+                spans = [(0, len(seq))]
+            else:
+                spans = intervals.get(contig['id'], [])
+            for start, end in spans:
+                if conditioner is None:
+                    pieces = [(start, end, seq[start:end])]
+                else:
+                    pieces = conditioner(seq, start, end)
+                for piece_start, piece_end, text in pieces:
+                    piece = coord_map.add(contig['id'], piece_start, piece_end - piece_start)
+                    yield piece.record_id, text
+
+    return coord_map, records()
+
+
+def lift_maf(maf_file, maps):
+    """
+    Rewrite a MAF file in place so rows of genomes in maps (keyed by FASTA
+    base name) use original contig names and coordinates.
+    """
+    tmp_file = maf_file + '.lift'
+    with open(maf_file, 'r') as src, open(tmp_file, 'w') as dst:
+        for line in src:
+            if line.startswith('s'):
+                fields = line.split()
+                genome, _, record_id = fields[1].partition('.')
+                if genome in maps and record_id in maps[genome].by_record:
+                    coord_map = maps[genome]
+                    start, size, src_size = int(fields[2]), int(fields[3]), int(fields[5])
+                    forward = start if fields[4] == '+' else src_size - start - size
+                    contig, lifted = coord_map.lift(record_id, forward)
+                    contig_size = coord_map.contig_lengths[contig]
+                    if fields[4] == '-':
+                        lifted = contig_size - lifted - size
+                    fields[1] = '{}.{}'.format(genome, contig)
+                    fields[2] = str(lifted)
+                    fields[5] = str(contig_size)
+                    line = ' '.join(fields) + '\n'
+            dst.write(line)
+    os.rename(tmp_file, maf_file)
+
+
+class _XmfaRow(object):
+    """A row of an XMFA block: header fields and (unwrapped) text."""
+
+    def __init__(self, line):
+        fields = [f for f in line[1:].split(' ') if f]
+        self.seq_id, span = fields[0].split(':')
+        self.start, self.end = [int(x) for x in span.split('-')]
+        self.strand = fields[1] if len(fields) > 1 else '+'
+        self.rest = fields[1:]
+        self.line = line
+        self.chunks = []
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = ''.join(chunk.strip() for chunk in self.chunks)
+        return self._text
+
+    def positions(self):
+        """1-based position of the residue in every column, 0 for gaps."""
+        chars = np.frombuffer(self.text, dtype=np.uint8)
+        filled = chars != ord('-')
+        rank = np.cumsum(filled) - 1
+        pos = self.start + rank if self.strand == '+' else self.end - rank
+        return np.where(filled, pos, 0)
+
+
+def _header(row, start, end):
+    return '> {}:{}-{} {}\n'.format(row.seq_id, start, end, ' '.join(row.rest).rstrip('\n'))
+
+
+def _write_row(dst, row, start, end, text):
+    dst.write(_header(row, start, end))
+    for i in range(0, len(text), XMFA_LINE_WIDTH):
+        dst.write(text[i:i + XMFA_LINE_WIDTH] + '\n')
+
+
+def _lifted(row, maps, names, start, end):
+    genome = names.get(row.seq_id, row.seq_id)
+    if genome in maps and start > 0 and end > 0:
+        start, end = maps[genome].lift_span(start - 1, end)
+        start += 1
+    return start, end
+
+
+def _write_block(dst, rows, end_line, maps, names, cuts):
+    """Write one block, split wherever a row crosses from one written piece into the next."""
+    positions = {}
+    splits = set()
+    crossings = []
+    for row in rows:
+        genome = names.get(row.seq_id, row.seq_id)
+        if genome not in maps or row.start <= 0 or row.end <= 0:
+            continue
+        crossed = maps[genome].crossed(row.start - 1, row.end)
+        if not crossed:
+            continue
+        pos = positions.setdefault(row.seq_id, row.positions())
+        for bound in crossed:
+            # the column of the first residue of the next piece along the
+            # row: bound + 1 going forward, bound going backward
+            first = bound + 1 if row.strand == '+' else bound
+            col = int(np.flatnonzero(pos == first)[0])
+            splits.add(col)
+            crossings.append((row.seq_id, bound + 1, col))
+
+    if not splits:
+        for row in rows:
+            start, end = _lifted(row, maps, names, row.start, row.end)
+            dst.write(_header(row, start, end) if (start, end) != (row.start, row.end) else row.line)
+            dst.writelines(row.chunks)
+        dst.write(end_line)
+        return
+
+    for row in rows:
+        if row.seq_id not in positions:
+            positions[row.seq_id] = row.positions()
+    # residues on either side of every split column, for lift_backbone
+    by_col = {}
+    for col in splits:
+        cut = {}
+        for row in rows:
+            pos = positions[row.seq_id]
+            before = pos[:col][pos[:col] > 0]
+            after = pos[col:][pos[col:] > 0]
+            cut[row.seq_id] = (int(before[-1]) if len(before) else None,
+                               int(after[0]) if len(after) else None)
+        by_col[col] = cut
+    for seq_id, first, col in crossings:
+        cuts[(seq_id, first)] = by_col[col]
+
+    edges = [0] + sorted(splits) + [None]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        written = False
+        for row in rows:
+            pos = positions[row.seq_id][lo:hi]
+            filled = pos[pos > 0]
+            if len(filled) == 0:
+                continue
+            start, end = _lifted(row, maps, names, int(filled.min()), int(filled.max()))
+            _write_row(dst, row, start, end, row.text[lo:hi])
+            written = True
+        if written:
+            dst.write(end_line)
+
+
+def lift_xmfa(xmfa_file, maps, names):
+    """
+    Rewrite an XMFA file in place so rows of genomes in maps use positions on
+    the original (concatenated) genome.  names maps XMFA sequence numbers to
+    FASTA base names, as returned by alignment_io.read_xmfa_names().  A block
+    in which a row crosses from one written piece into the next is split at
+    that column.  Returns the cuts made, for lift_backbone: (sequence number,
+    written position starting the next piece) -> {sequence number: (last
+    written position before the cut, first after it)}.
+    """
+    tmp_file = xmfa_file + '.lift'
+    cuts = {}
+    rows = []
+    with open(xmfa_file, 'r') as src, open(tmp_file, 'w') as dst:
+        for line in src:
+            if line.startswith('>'):
+                rows.append(_XmfaRow(line))
+            elif line.startswith('='):
+                _write_block(dst, rows, line, maps, names, cuts)
+                rows = []
+            elif rows:
+                rows[-1].chunks.append(line)
+            else:
+                dst.write(line)
+        if rows:
+            _write_block(dst, rows, '', maps, names, cuts)
+    os.rename(tmp_file, xmfa_file)
+    return cuts
+
+
+def _split_segment(ends, cut):
+    """The two parts of a backbone segment (ends as in the file) either side of a cut."""
+    left, right = [], []
+    for s in range(len(ends) // 2):
+        lo, hi = abs(ends[2 * s]), abs(ends[2 * s + 1])
+        sign = -1 if ends[2 * s] < 0 else 1
+        before, after = cut.get(str(s + 1), (None, None))
+        if lo == 0:
+            parts = [(0, 0), (0, 0)]
+        elif before is None and after is None:
+            parts = [(lo, hi), (0, 0)]
+        elif before is None:
+            parts = [(0, 0), (lo, hi)]
+        elif after is None:
+            parts = [(lo, hi), (0, 0)]
+        elif before < after:
+            parts = [(lo, min(hi, before)), (max(lo, after), hi)]
+        else:
+            parts = [(max(lo, before), hi), (lo, min(hi, after))]
+        for out, (a, b) in zip((left, right), parts):
+            if a == 0 or a > b:
+                out.extend([0, 0])
+            else:
+                out.extend([sign * a, sign * b])
+    return left, right
+
+
+def lift_backbone(backbone_file, maps, names, cuts):
+    """
+    Rewrite a progressiveMauve .backbone file in place.  Column pairs are
+    seq0_leftend/seq0_rightend, ...; negative values mark the reverse
+    strand and 0 marks a genome missing from the segment.  Segments that
+    cross from one written piece into the next are split at the cuts
+    lift_xmfa made.
+    """
+    tmp_file = backbone_file + '.lift'
+    with open(backbone_file, 'r') as src, open(tmp_file, 'w') as dst:
+        header = src.readline()
+        dst.write(header)
+        for line in src:
+            segments = [[int(value) for value in line.split()]]
+            while segments:
+                ends = segments.pop(0)
+                crossing = None
+                for s in range(len(ends) // 2):
+                    genome = names.get(str(s + 1))
+                    lo, hi = abs(ends[2 * s]), abs(ends[2 * s + 1])
+                    if genome in maps and lo != 0:
+                        crossed = maps[genome].crossed(lo - 1, hi)
+                        if crossed:
+                            crossing = (str(s + 1), crossed[0] + 1)
+                            break
+                if crossing is not None:
+                    if crossing not in cuts:
+                        raise ValueError('Backbone segment {} crosses a cut the alignment does not'.format(
+                            ' '.join(str(v) for v in ends)))
+                    segments[:0] = [part for part in _split_segment(ends, cuts[crossing]) if any(part)]
+                    continue
+                for s in range(len(ends) // 2):
+                    genome = names.get(str(s + 1))
+                    lo, hi = abs(ends[2 * s]), abs(ends[2 * s + 1])
+                    if genome in maps and lo != 0:
+                        sign = -1 if ends[2 * s] < 0 else 1
+                        lo, hi = maps[genome].lift_span(lo - 1, hi)
+                        ends[2 * s], ends[2 * s + 1] = sign * (lo + 1), sign * hi
+                dst.write('\t'.join(str(v) for v in ends) + '\n')
+    os.rename(tmp_file, backbone_file)
@@ -0,0 +1,141 @@
+"""
+Core and accessory genome extraction from an alignment file.
+
+Blocks are streamed one at a time; each is turned into a (genomes x columns)
+uint8 matrix and a column is core when every genome has a residue in it.
+Only the current block is ever in memory.  One pass writes
+
+    core.xmfa        - the runs of core columns of every block
+    core.fasta       - one record per genome, all core columns concatenated
+    accessory.tsv    - per genome intervals outside the core, either aligned
+                       without all genomes or not aligned at all
+"""
+import os
+import shutil
+
+import numpy as np
+
+from WholeGenomeAlignment.alignment_io import column_positions, mask_runs
+
+
+_GAP = ord('-')
+
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class CoreExtractor(object):
+
+    def __init__(self, genomes, output_dir, min_length=1):
+        self.genomes = list(genomes)
+        self.output_dir = output_dir
+        self.min_length = min_length
+        self.core_columns = 0
+        self.core_blocks = 0
+        self.aligned = dict((g, {}) for g in self.genomes)
+        self.accessory = dict((g, {}) for g in self.genomes)
+        self.sizes = {}
+        self.xmfa_file = os.path.join(output_dir, 'core.xmfa')
+        self.fasta_file = os.path.join(output_dir, 'core.fasta')
+        self.tsv_file = os.path.join(output_dir, 'accessory.tsv')
+        self._xmfa = open(self.xmfa_file, 'w')
+        self._xmfa.write('#FormatVersion Mauve1\n')
+        self._parts = dict((g, open(os.path.join(output_dir, 'core.{}.part'.format(g)), 'w'))
+                           for g in self.genomes)
+
+    def add_block(self, block):
+        rows = dict((row.genome, row) for row in block.rows if row.genome in self.aligned)
+        for genome, row in rows.items():
+            key = row.contig or ''
+            self.aligned[genome].setdefault(key, []).append((row.start, row.end))
+            if row.src_size:
+                self.sizes[(genome, key)] = row.src_size
+
+        order = [g for g in self.genomes if g in rows]
+        matrix = np.array([np.frombuffer(str(rows[g].text), dtype=np.uint8) for g in order])
+        present = matrix != _GAP
+        if len(order) == len(self.genomes):
+            core = present.all(axis=0)
+        else:
+            core = np.zeros(matrix.shape[1], dtype=bool)
+
+        positions = [column_positions(rows[g]) for g in order]
+        for i, genome in enumerate(order):
+            key = rows[genome].contig or ''
+            outside = present[i] & ~core
+            for a, b in mask_runs(outside):
+                pos = positions[i][a:b]
+                pos = pos[pos >= 0]
+                self.accessory[genome].setdefault(key, []).append((pos.min(), pos.max() + 1))
+
+        for a, b in mask_runs(core):
+            if b - a < self.min_length:
+                continue
+            self.core_blocks += 1
+            self.core_columns += b - a
+            for i, genome in enumerate(order):
+                text = matrix[i, a:b].tostring()
+                pos = positions[i][a:b]
+                self._xmfa.write('> {}:{}-{} {}\n{}\n'.format(
+                    genome, pos.min() + 1, pos.max() + 1, rows[genome].strand, text))
+                self._parts[genome].write(text)
+            self._xmfa.write('=\n')
+
+    def finish(self, sizes=None):
+        """
+        Close the outputs.  sizes maps (genome, contig) to its length so
+        that unaligned stretches are reported too; MAF rows provide this
+        themselves, for XMFA use the input FASTA lengths with contig ''.
+        """
+        self._xmfa.close()
+        with open(self.fasta_file, 'w') as out:
+            for genome in self.genomes:
+                self._parts[genome].close()
+                part = self._parts[genome].name
+                out.write('>{}\n'.format(genome))
+                with open(part, 'r') as f:
+                    shutil.copyfileobj(f, out)
+                out.write('\n')
+                os.remove(part)
+
+        all_sizes = dict(self.sizes)
+        all_sizes.update(sizes or {})
+        accessory_bp = dict((g, 0) for g in self.genomes)
+        with open(self.tsv_file, 'w') as out:
+            out.write('genome\tcontig\tstart\tend\ttype\n')
+            for genome in self.genomes:
+                records = []
+                for key, intervals in self.accessory[genome].items():
+                    for start, end in _merge(intervals):
+                        records.append((key, start, end, 'aligned'))
+                contigs = set(self.aligned[genome]) | set(
+                    c for g, c in all_sizes if g == genome)
+                for key in contigs:
+                    if (genome, key) not in all_sizes:
+                        continue
+                    cursor = 0
+                    for start, end in _merge(self.aligned[genome].get(key, [])):
+                        if start > cursor:
+                            records.append((key, cursor, start, 'unaligned'))
+                        cursor = max(cursor, end)
+                    if cursor < all_sizes[(genome, key)]:
+                        records.append((key, cursor, all_sizes[(genome, key)], 'unaligned'))
+                for key, start, end, kind in sorted(records):
+                    accessory_bp[genome] += end - start
+                    out.write('{}\t{}\t{}\t{}\t{}\n'.format(genome, key, start + 1, end, kind))
+        return accessory_bp
+
+
+def extract_core(blocks, genomes, output_dir, sizes=None, min_length=1):
+    extractor = CoreExtractor(genomes, output_dir, min_length)
+    for block in blocks:
+        extractor.add_block(block)
+    accessory_bp = extractor.finish(sizes)
+    return extractor, accessory_bp
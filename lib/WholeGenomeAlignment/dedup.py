@@ -0,0 +1,94 @@
+"""
+Collapsing of repeated input genomes before alignment.
+
+Inputs are considered the same when they resolve to the same ContigSet, or
+when their contig sequences are identical.  Only the first of each group is
+written out and aligned; the rows of the others are copied from it once the
+alignment is done.
+"""
+import hashlib
+import json
+
+from WholeGenomeAlignment.alignment_io import genome_key
+from WholeGenomeAlignment.alignment_merge import make_contig
+
+
+def sequence_md5(sequence):
+    return hashlib.md5(sequence.upper()).hexdigest()
+
+
+def contigset_md5(contigs, regions=None, sequence_md5s=None):
+    """
+    Order-independent digest of the contig sequences (and selected regions).
+    sequence_md5s, the sequence_md5 of each contig, replaces contigs when the
+    sequences are no longer in memory.
+    """
+    if sequence_md5s is None:
+        sequence_md5s = [sequence_md5(c['sequence']) for c in contigs]
+    digests = sorted(sequence_md5s)
+    if regions:
+        digests.append(json.dumps(regions, sort_keys=True))
+    return hashlib.md5(''.join(digests)).hexdigest()
+
+
+class GenomeDeduplicator(object):
+
+    def __init__(self, duplicates=None):
+        self.primaries = {}
+        self.duplicates = dict(duplicates or {})
+
+    def _check(self, pos, key):
+        if key in self.primaries:
+            primary = self.primaries[key]
+            # a ref registered before its sequence turned out to be a
+            # duplicate points at that duplicate; follow it to the input
+            # actually aligned
+            while primary in self.duplicates:
+                primary = self.duplicates[primary]
+            self.duplicates[pos] = primary
+            return primary
+        self.primaries[key] = pos
+        return None
+
+    def check_ref(self, pos, ref, regions=None):
+        """Position of an earlier input resolving to the same object, or None."""
+        return self._check(pos, ('ref', ref, json.dumps(regions, sort_keys=True)))
+
+    def check_sequence(self, pos, contigs, regions=None):
+        """Position of an earlier input with the same sequences, or None."""
+        return self._check(pos, ('md5', contigset_md5(contigs, regions)))
+
+    def check_sequence_md5s(self, pos, sequence_md5s, regions=None):
+        """check_sequence for an input whose contig sequence_md5s are known."""
+        return self._check(pos, ('md5', contigset_md5(None, regions, sequence_md5s)))
+
+    def copies(self, key_of):
+        """Genome key of each aligned input -> genome keys of its duplicates."""
+        copies = {}
+        for pos in sorted(self.duplicates):
+            primary = self.duplicates[pos]
+            copies.setdefault(key_of[primary], []).append(key_of[pos])
+        return copies
+
+
+def expand_rows(contigs, copies):
+    """
+    Follow every row of a duplicated genome with a copy per duplicate that
+    differs only in the genome key of its id and description, so the copy
+    keeps the row's strand and block tag.
+    """
+    if not copies:
+        return contigs
+    expanded = []
+    for contig in contigs:
+        expanded.append(contig)
+        key = genome_key(contig['id'])
+        description = contig.get('description') or contig['id']
+        for dup_key in copies.get(key, []):
+            contig_id = dup_key + contig['id'][len(key):]
+            if description.startswith(contig['id']):
+                dup_description = contig_id + description[len(contig['id']):]
+            else:
+                dup_description = description
+            expanded.append(make_contig(contig_id, contig['sequence'], dup_description))
+    return expanded
@@ -0,0 +1,115 @@
+"""
+Pairwise distances over the aligned columns and a neighbour-joining tree.
+
+Each chunk of a block is encoded once per genome as bit-packed planes, one
+per nucleotide plus one for "has a base here" (np.packbits, 8 columns per
+byte).  For a pair of genomes the columns both have a base are
+popcount(valid_i & valid_j) and the identical ones the sum over nucleotides
+of popcount(plane_i & plane_j), so a whole chunk is compared with a handful
+of byte-wise ANDs and table lookups per pair.
+"""
+import numpy as np
+
+from WholeGenomeAlignment.conditioning import encode
+
+
+CHUNK_COLUMNS = 1 << 20
+MODELS = ('p', 'jc')
+
+# p-distances at or above 3/4 have no Jukes-Cantor correction
+_MAX_P = 0.75 - 1e-6
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+def _popcount(packed):
+    return _POPCOUNT[packed].sum(axis=-1)
+
+
+class DistanceCounter(object):
+    """Accumulates compared and identical column counts for every pair."""
+
+    def __init__(self, genomes, chunk_columns=CHUNK_COLUMNS):
+        self.genomes = list(genomes)
+        self.chunk_columns = chunk_columns
+        n = len(self.genomes)
+        self.compared = np.zeros((n, n), dtype=np.int64)
+        self.identical = np.zeros((n, n), dtype=np.int64)
+
+    def add_block(self, block):
+        rows = [block.row_for(genome) for genome in self.genomes]
+        present = [i for i, row in enumerate(rows) if row is not None]
+        if len(present) < 2:
+            return
+        texts = [str(rows[i].text) for i in present]
+        width = len(texts[0])
+        for lo in range(0, width, self.chunk_columns):
+            hi = min(lo + self.chunk_columns, width)
+            codes = np.array([encode(text[lo:hi]) for text in texts])
+            valid = np.packbits(codes < 4, axis=1)
+            planes = [np.packbits(codes == base, axis=1) for base in range(4)]
+            for k in range(len(present) - 1):
+                i, others = present[k], present[k + 1:]
+                compared = _popcount(valid[k] & valid[k + 1:])
+                identical = sum(_popcount(plane[k] & plane[k + 1:]) for plane in planes)
+                self.compared[i, others] += compared
+                self.identical[i, others] += identical
+
+    def distances(self, model='jc'):
+        """Symmetric distance matrix; pairs never aligned get the largest distance seen."""
+        if model not in MODELS:
+            raise ValueError('Unknown distance model {}, expected one of {}'.format(model, MODELS))
+        compared = self.compared + self.compared.T
+        identical = self.identical + self.identical.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = 1.0 - identical / compared.astype(float)
+        p = np.minimum(p, _MAX_P)
+        if model == 'jc':
+            d = -0.75 * np.log(1.0 - p / 0.75)
+        else:
+            d = p
+        missing = np.isnan(d)
+        d[missing] = d[~missing].max() if (~missing).any() else 1.0
+        np.fill_diagonal(d, 0.0)
+        return d
+
+
+def neighbor_joining(d, labels):
+    """Newick string of the neighbour-joining tree of distance matrix d."""
+    d = np.array(d, dtype=float)
+    nodes = list(labels)
+    if len(nodes) == 1:
+        return '{};'.format(nodes[0])
+    while len(nodes) > 2:
+        n = len(nodes)
+        totals = d.sum(axis=1)
+        q = (n - 2) * d - totals[:, None] - totals[None, :]
+        np.fill_diagonal(q, np.inf)
+        i, j = np.unravel_index(np.argmin(q), q.shape)
+        if i > j:
+            i, j = j, i
+        branch_i = 0.5 * d[i, j] + (totals[i] - totals[j]) / (2.0 * (n - 2))
+        branch_j = d[i, j] - branch_i
+        joined = '({}:{:.6g},{}:{:.6g})'.format(nodes[i], max(branch_i, 0.0),
+                                                nodes[j], max(branch_j, 0.0))
+        new_row = 0.5 * (d[i] + d[j] - d[i, j])
+        keep = [k for k in range(n) if k != i and k != j]
+        d = np.vstack([np.hstack([d[np.ix_(keep, keep)], new_row[keep, None]]),
+                       np.append(new_row[keep], 0.0)])
+        nodes = [nodes[k] for k in keep] + [joined]
+    return '({}:{:.6g},{}:{:.6g});'.format(nodes[0], max(d[0, 1] / 2.0, 0.0),
+                                           nodes[1], max(d[0, 1] / 2.0, 0.0))
+
+
+def distance_report(d, labels, model):
+    lines = ['{} distance\t'.format('Jukes-Cantor' if model == 'jc' else 'p') + '\t'.join(labels)]
+    for i, label in enumerate(labels):
+        lines.append(label + '\t' + '\t'.join('{:.6f}'.format(v) for v in d[i]))
+    return '\n'.join(lines) + '\n'
+
+
+def alignment_distances(blocks, genomes, model='jc'):
+    counter = DistanceCounter(genomes)
+    for block in blocks:
+        counter.add_block(block)
+    d = counter.distances(model)
+    return d, neighbor_joining(d, genomes), counter
@@ -0,0 +1,124 @@
+"""
+FASTA files given by path as aligner inputs.
+
+Files in the caller's staging area are handed to the aligner without going
+through a workspace object: one streaming pass checks the file and takes
+the length and dedup.sequence_md5 of each record, and the file is then
+linked into the job directory (gzipped files are decompressed during the
+same pass).  Only files under the caller's own directory of a configured
+input root (user_roots) are accepted.
+"""
+import gzip
+import hashlib
+import os
+import re
+
+from WholeGenomeAlignment.cache import link_or_copy
+
+
+_GZIP_MAGIC = '\x1f\x8b'
+_RESIDUES = re.compile(r'^[ACGTURYKMSWBDHVNacgturykmswbdhvn]*$')
+
+
+def is_gzipped(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == _GZIP_MAGIC
+
+
+def user_roots(roots, user_id):
+    """The caller's own directory, root/user_id, under each of roots."""
+    if not user_id or user_id in ('.', '..') or os.sep in user_id:
+        raise ValueError("Input files need an authenticated user")
+    return [os.path.join(root, user_id) for root in roots]
+
+
+def check_path(path, roots):
+    """Real path of path, which must be a file under one of roots."""
+    real = os.path.realpath(path)
+    if not any(real.startswith(os.path.realpath(root).rstrip(os.sep) + os.sep) for root in roots):
+        raise ValueError("Input file {} is not under an allowed input directory ({})".format(
+            path, ', '.join(roots)))
+    if not os.path.isfile(real):
+        raise ValueError("Input file {} does not exist".format(path))
+    return real
+
+
+class FastaChecker(object):
+    """
+    Checks FASTA lines as they stream past and records (name, length,
+    sequence md5) per record.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.records = []
+        self.ids = set()
+        self.line_number = 0
+        self._current = None
+        self._md5 = None
+
+    def error(self, message):
+        raise ValueError("{}, line {}: {}".format(self.name, self.line_number, message))
+
+    def _finish(self):
+        if self._current is None:
+            return
+        if self._current[1] == 0:
+            self.error("record {} has no sequence".format(self._current[0]))
+        self._current[2] = self._md5.hexdigest()
+
+    def add(self, line):
+        self.line_number += 1
+        if line.startswith('>'):
+            self._finish()
+            record_id = line[1:].split(None, 1)[0] if line[1:].strip() else ''
+            if not record_id:
+                self.error("record without an id")
+            if record_id in self.ids:
+                self.error("duplicate record id {}".format(record_id))
+            self.ids.add(record_id)
+            self._current = [record_id, 0, None]
+            self._md5 = hashlib.md5()
+            self.records.append(self._current)
+        elif line.strip():
+            if self._current is None:
+                self.error("sequence before the first header")
+            residues = line.rstrip('\r\n')
+            if not _RESIDUES.match(residues):
+                self.error("invalid sequence characters")
+            self._current[1] += len(residues)
+            self._md5.update(residues.upper())
+
+    def close(self):
+        self._finish()
+        if not self.records:
+            self.error("no FASTA records")
+        return self.records
+
+
+def stage_fasta(path, dest, roots):
+    """
+    Check path and link (or, if gzipped, decompress) it to dest.  Returns
+    the (name, length, sequence md5) of each record.
+    """
+    real = check_path(path, roots)
+    checker = FastaChecker(path)
+    if is_gzipped(real):
+        tmp = dest + '.tmp'
+        try:
+            with gzip.open(real, 'rb') as f, open(tmp, 'w') as out:
+                for line in f:
+                    checker.add(line)
+                    out.write(line)
+            checker.close()
+            os.rename(tmp, dest)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    else:
+        with open(real, 'r') as f:
+            for line in f:
+                checker.add(line)
+        checker.close()
+        link_or_copy(real, dest)
+    return checker.records
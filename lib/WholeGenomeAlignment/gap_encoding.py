@@ -0,0 +1,89 @@
+"""
+Gap run-length encoding of aligned rows.
+
+A row is stored as its ungapped residues plus an (n x 2) int array of gap
+runs: (number of residues before the run, run length).  For divergent
+genomes, where rows are mostly '-', this is much smaller than the gapped
+text, and any range of alignment columns can be decoded from it without
+expanding the whole row.
+
+Saved contigs carry the runs as a flat list in a 'gaps' field next to the
+ungapped 'sequence'; rows without that field are plain gapped text.
+"""
+import numpy as np
+
+from WholeGenomeAlignment.alignment_io import mask_runs
+
+
+_GAP = ord('-')
+
+
+def encode_row(text):
+    """(ungapped residues, gap runs) of a gapped row."""
+    chars = np.frombuffer(str(text), dtype=np.uint8)
+    gaps = chars == _GAP
+    runs = np.array(mask_runs(gaps), dtype=np.int64).reshape(-1, 2)
+    lengths = runs[:, 1] - runs[:, 0]
+    before = np.cumsum(lengths) - lengths
+    encoded = np.stack([runs[:, 0] - before, lengths], axis=1) if len(runs) else runs
+    return chars[~gaps].tostring(), encoded
+
+
+def decode_row(residues, runs):
+    """Gapped text of a row from its residues and gap runs."""
+    runs = np.asarray(runs, dtype=np.int64).reshape(-1, 2)
+    chars = np.frombuffer(str(residues), dtype=np.uint8)
+    if len(runs) == 0:
+        return str(residues)
+    out = np.full(len(chars) + runs[:, 1].sum(), _GAP, dtype=np.uint8)
+    # every residue moves right by the length of the runs before it
+    shift = np.zeros(len(chars) + 1, dtype=np.int64)
+    np.add.at(shift, runs[:, 0], runs[:, 1])
+    out[np.arange(len(chars)) + np.cumsum(shift)[:len(chars)]] = chars
+    return out.tostring()
+
+
+def decode_columns(residues, runs, start, end):
+    """Columns [start, end) of the gapped row, without decoding the rest."""
+    runs = np.asarray(runs, dtype=np.int64).reshape(-1, 2)
+    lengths = runs[:, 1]
+    col_start = runs[:, 0] + np.cumsum(lengths) - lengths
+    col_end = col_start + lengths
+
+    def gaps_before(col):
+        k = np.searchsorted(col_end, col, 'right')
+        count = lengths[:k].sum()
+        if k < len(runs) and col_start[k] < col:
+            count += col - col_start[k]
+        return int(count)
+
+    first = start - gaps_before(start)
+    last = end - gaps_before(end)
+    overlap = (col_end > start) & (col_start < end)
+    clipped_start = np.maximum(col_start[overlap], start)
+    clipped_end = np.minimum(col_end[overlap], end)
+    sub_runs = np.stack([runs[overlap, 0] - first, clipped_end - clipped_start], axis=1)
+    return decode_row(str(residues)[first:last], sub_runs)
+
+
+def encode_contigs(contigs):
+    """Saved contigs with each sequence replaced by residues plus 'gaps'."""
+    encoded = []
+    for contig in contigs:
+        residues, runs = encode_row(contig['sequence'])
+        contig = dict(contig)
+        contig['sequence'] = residues
+        contig['gaps'] = [int(v) for v in runs.ravel()]
+        encoded.append(contig)
+    return encoded
+
+
+def decode_contigs(contigs):
+    """Saved contigs with every encoded row expanded back to gapped text."""
+    decoded = []
+    for contig in contigs:
+        if 'gaps' in contig:
+            contig = dict(contig)
+            contig['sequence'] = decode_row(contig['sequence'], contig.pop('gaps'))
+        decoded.append(contig)
+    return decoded
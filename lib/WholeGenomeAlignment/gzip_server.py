@@ -0,0 +1,24 @@
+"""
+WSGI entry point: the generated JSON-RPC server with gzip negotiation.
+
+WholeGenomeAlignmentServer is rewritten by kb-sdk compile, so the
+compression is added here by wrapping its application in GzipMiddleware.
+scripts/start_server.sh (built by the Makefile) serves this file.
+"""
+from WholeGenomeAlignment import WholeGenomeAlignmentServer as server
+from WholeGenomeAlignment.compression import DEFAULT_MIN_BYTES, GzipMiddleware
+
+
+def gzip_min_bytes(config):
+    return int((config or {}).get('gzip-min-bytes', DEFAULT_MIN_BYTES))
+
+
+application = GzipMiddleware(server.application, gzip_min_bytes(server.config))
+
+# The server module mounts its own application for uwsgi on import;
+# mount the wrapped one instead.
+try:
+    import uwsgi
+    uwsgi.applications = {'': application}
+except ImportError:
+    pass
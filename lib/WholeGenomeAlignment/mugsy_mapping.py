@@ -0,0 +1,214 @@
+"""
+Mugsy's pairwise mapping stage, run here so its results can be reused.
+
+The mugsy wrapper script maps every pair of inputs with nucmer, filters the
+deltas and converts them to MAF, then hands all pairwise MAFs to mugsyWGA
+for chaining into LCBs.  Running those steps from here lets each pair's MAF
+be kept in a FileCache keyed by the md5s of the two (ordered) inputs and the
+mapping options, so a job only maps the pairs it has not seen before.
+
+The command lines are those of the wrapper of Mugsy v1r2.3, the version the
+Dockerfile installs, with its default options:
+
+  nucmer -l 15 --prefix=<a>-<b> <a>.fa <b>.fa
+  delta-filter -1 <a>-<b>.delta > <a>-<b>.filtered.delta
+  delta2maf <a>-<b>.filtered.delta > <a>-<b>.maf
+  mugsyWGA --outfile <prefix> --seq <all>.fasta --aln <all>.maf --distance 1000 --minlength 30
+
+so the chained alignment is the one mugsy itself would produce;
+mugsy_mapping_test checks that against the wrapper wherever mugsy is
+installed.  The cache keys include MAPPING_VERSION and the mapping
+options, so no MAF made with other ones is reused.
+
+Sequence names in Mugsy's MAF are <genome>.<contig>, and genome keys differ
+between jobs, so cached MAFs have the genome part replaced with @1 / @2 for
+the first / second input and are renamed on the way back out.
+
+Each pair missing from the cache is mapped by one shell running the three
+commands, started under a Supervisor so that at most `processes` pairs run
+at once, rather than in a pool of forked copies of this process.  A pair
+that fails is retried once before the job gives up, and the error then
+names every pair that could not be mapped.  The resource usage of every
+pair is collected in .usages.
+"""
+import hashlib
+import os
+
+from WholeGenomeAlignment.cache import file_md5
+from WholeGenomeAlignment.resources import SAMPLE_INTERVAL
+from WholeGenomeAlignment.supervisor import Supervisor
+
+
+MAPPING_VERSION = 'mugsy-v1r2.3'
+NUCMER_OPTIONS = ['-l', '15']
+DELTA_FILTER_OPTIONS = ['-1']
+DEFAULT_DISTANCE = 1000
+DEFAULT_MINLENGTH = 30
+
+
+def write_labelled_fasta(fasta_file, key, dest):
+    """Copy of fasta_file with every record renamed to <key>.<id>, as mugsy does."""
+    with open(fasta_file, 'r') as f, open(dest, 'w') as out:
+        for line in f:
+            if line.startswith('>'):
+                line = '>{}.{}\n'.format(key, line[1:].split()[0])
+            out.write(line)
+
+
+def pair_command(fasta_a, fasta_b, prefix):
+    """Shell command running nucmer, delta-filter and delta2maf for one pair into <prefix>.maf."""
+    script = ('nucmer {} --prefix="$3" "$1" "$2" && '
+              'delta-filter {} "$3.delta" > "$3.filtered.delta" && '
+              'delta2maf "$3.filtered.delta" > "$3.maf"').format(
+                  ' '.join(NUCMER_OPTIONS), ' '.join(DELTA_FILTER_OPTIONS))
+    return ['sh', '-c', script, 'map_pair', fasta_a, fasta_b, prefix]
+
+
+def rename_maf(src, dest, names):
+    """Copy a MAF replacing the genome part of 's' line sources per names."""
+    with open(src, 'r') as f, open(dest, 'w') as out:
+        for line in f:
+            if line.startswith('s '):
+                fields = line.split(' ', 2)
+                genome, dot, contig = fields[1].partition('.')
+                if genome in names:
+                    line = 's {}{}{} {}'.format(names[genome], dot, contig, fields[2])
+            out.write(line)
+
+
+def options_digest():
+    options = '|'.join([MAPPING_VERSION, ' '.join(NUCMER_OPTIONS), ' '.join(DELTA_FILTER_OPTIONS)])
+    return hashlib.md5(options).hexdigest()[:12]
+
+
+def concatenate(files, dest):
+    """Concatenate FASTA or MAF files, keeping only the first '##' header."""
+    with open(dest, 'w') as out:
+        for i, path in enumerate(files):
+            with open(path, 'r') as f:
+                for line in f:
+                    if i and line.startswith('##'):
+                        continue
+                    out.write(line)
+    return dest
+
+
+class PairwiseMapper(object):
+    """
+    Maps every pair of (key, fasta) inputs in work_dir, through cache, at
+    most processes pairs at a time on supervisor.
+    """
+
+    def __init__(self, cache, work_dir, processes=1, supervisor=None):
+        self.cache = cache
+        self.work_dir = work_dir
+        self.processes = max(1, processes)
+        self.supervisor = supervisor or Supervisor()
+        self.hits = 0
+        self.misses = 0
+        self.retried = 0
+        self.usages = []
+
+    def pairs(self, inputs):
+        return [(inputs[i], inputs[j]) for i in range(len(inputs))
+                for j in range(i + 1, len(inputs))]
+
+    def cache_key(self, md5_a, md5_b):
+        return 'nucmer_{}_{}_{}.maf'.format(md5_a, md5_b, options_digest())
+
+    def label(self, inputs):
+        labelled = []
+        for key, fasta_file in inputs:
+            dest = os.path.join(self.work_dir, '{}.fa'.format(key))
+            write_labelled_fasta(fasta_file, key, dest)
+            labelled.append((key, dest))
+        return labelled
+
+    def map_all(self, inputs):
+        """
+        Labelled FASTA files and the MAF files of all pairs, in pair order.
+        Cache keys use the md5s of the inputs as given, before labelling.
+        """
+        md5s = dict((key, file_md5(fasta)) for key, fasta in inputs)
+        inputs = self.label(inputs)
+        maf_files = []
+        todo = []
+        for (key_a, fasta_a), (key_b, fasta_b) in self.pairs(inputs):
+            prefix = os.path.join(self.work_dir, '{}-{}'.format(key_a, key_b))
+            cache_key = self.cache_key(md5s[key_a], md5s[key_b])
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.hits += 1
+                rename_maf(cached, prefix + '.maf', {'@1': key_a, '@2': key_b})
+            else:
+                self.misses += 1
+                todo.append((cache_key, key_a, key_b, fasta_a, fasta_b, prefix))
+            maf_files.append(prefix + '.maf')
+
+        errors = self.run_pairs([job[3:] for job in todo])
+        if errors:
+            raise ValueError('Pairwise mapping failed for {} of {} pairs:\n\n{}'.format(
+                len(errors), len(maf_files), '\n\n'.join(
+                    '{}: {}'.format(os.path.basename(prefix), error)
+                    for prefix, error in sorted(errors.items()))))
+        for cache_key, key_a, key_b, _, _, prefix in todo:
+            self.cache.put(cache_key, lambda tmp: rename_maf(
+                prefix + '.maf', tmp, {key_a: '@1', key_b: '@2'}))
+        return [fasta for _, fasta in inputs], maf_files
+
+    def start_pair(self, fasta_a, fasta_b, prefix):
+        return self.supervisor.start(pair_command(fasta_a, fasta_b, prefix),
+                                     os.path.basename(prefix), lambda line: None)
+
+    def finish_pair(self, run):
+        """Error text of a finished pair, or None."""
+        try:
+            returncode, usage = run.result()
+        except ValueError as e:
+            self.usages.append(run.usage)
+            return str(e)
+        self.usages.append(usage)
+        if returncode != 0:
+            return 'return code {}\n\n{}'.format(returncode, '\n'.join(run.tail))
+        return None
+
+    def run_pairs(self, jobs):
+        """Map (fasta_a, fasta_b, prefix) jobs; prefix -> error of the pairs that failed twice."""
+        todo = [(job, 1) for job in jobs]
+        running = []
+        failed = {}
+        while todo or running:
+            while todo and len(running) < self.processes:
+                job, attempt = todo.pop(0)
+                running.append((job, attempt, self.start_pair(*job)))
+            finished = [entry for entry in running if entry[2].done.is_set()]
+            if not finished:
+                running[0][2].done.wait(SAMPLE_INTERVAL)
+                continue
+            for entry in finished:
+                running.remove(entry)
+                job, attempt, run = entry
+                error = self.finish_pair(run)
+                if error is None:
+                    continue
+                if attempt == 1:
+                    self.retried += 1
+                    todo.append((job, 2))
+                else:
+                    failed[job[2]] = error
+        return failed
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+
+def chain_command(output_dir, prefix, fasta_file, maf_file, minlength=None, distance=None):
+    """
+    mugsyWGA command line chaining the pairwise MAFs into <prefix>.maf, with
+    the wrapper's defaults for the options left unset.
+    """
+    return ['mugsyWGA', '--outfile', os.path.join(output_dir, prefix),
+            '--seq', fasta_file, '--aln', maf_file,
+            '--distance', str(DEFAULT_DISTANCE if distance is None else distance),
+            '--minlength', str(DEFAULT_MINLENGTH if minlength is None else minlength)]
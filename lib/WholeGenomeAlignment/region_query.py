@@ -0,0 +1,242 @@
+"""
+Region queries against a saved WholeGenomeAlignment.
+
+The first query for an object writes its rows to a local MAF file, with the
+coordinates recovered from the row ids, and indexes it (see alignment_index).
+Later queries only load the index and read the blocks that overlap the
+requested window, so their cost does not grow with the alignment.
+
+Rows whose ids carry no coordinates are written with a source size of 0:
+they are left out of the index, never anchor a query and are reported
+without coordinates (start and end 0).
+
+The local copies are bounded like the other scratch caches: once they take
+more than max_bytes the least recently queried are removed, and only the
+max_indexes most recently used indexes stay loaded.
+"""
+import os
+import re
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+from WholeGenomeAlignment.alignment_index import INDEX_SUFFIX, AlignmentIndex
+from WholeGenomeAlignment.cache import DEFAULT_MAX_BYTES
+from WholeGenomeAlignment.alignment_merge import blocks_from_contigs
+from WholeGenomeAlignment.alignment_io import genome_key, column_positions
+
+
+# ids written by run_mauve and by this module: "3:101-200" or "3.contig:101-200"
+_LOCATION = re.compile(r'^([^.:]+)(?:\.([^:]+))?:(\d+)-(\d+)$')
+
+
+def row_location(contig):
+    """
+    (genome, contig, start, end, strand) of a saved row, 0-based half-open;
+    start and end are None if the id carries no coordinates.
+    """
+    description = contig.get('description') or ''
+    strand = '-' if ' - ' in ' {} '.format(description) else '+'
+    match = _LOCATION.match(contig['id'])
+    if match:
+        genome, name, start, end = match.groups()
+        return genome, name, int(start) - 1, int(end), strand
+    genome = genome_key(contig['id'])
+    name = contig['id'][len(genome) + 1:] or None
+    return genome, name, None, None, strand
+
+
+def placed(row):
+    """False for rows written without coordinates."""
+    return row.src_size != 0
+
+
+def write_local_copy(contigs, maf_file):
+    """Write the saved rows as MAF blocks so they can be indexed."""
+    blocks = []
+    sizes = {}
+    for block in blocks_from_contigs(contigs):
+        rows = []
+        for contig in block:
+            genome, name, start, end, strand = row_location(contig)
+            src = genome if name is None else '{}.{}'.format(genome, name)
+            if start is not None:
+                sizes[src] = max(sizes.get(src, 0), end)
+            rows.append((src, start, end, strand, contig['sequence']))
+        blocks.append(rows)
+
+    tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(maf_file), delete=False)
+    with tmp:
+        tmp.write('##maf version=1\n')
+        for rows in blocks:
+            tmp.write('a\n')
+            for src, start, end, strand, text in rows:
+                if start is None:
+                    residues = len(text) - text.count('-')
+                    tmp.write('s {} 0 {} + 0 {}\n'.format(src, residues, text))
+                    continue
+                size = end - start
+                if strand == '-':
+                    start = sizes[src] - end
+                tmp.write('s {} {} {} {} {} {}\n'.format(src, start, size, strand,
+                                                       sizes[src], text))
+            tmp.write('\n')
+    # concurrent first queries race to here; rename keeps the file whole
+    os.rename(tmp.name, maf_file)
+
+
+def slice_block(block, genome, start, end, contig=None):
+    """
+    Cut a block down to the columns spanned by genome's residues in
+    [start, end).  Returns (row, text, positions) for every row, or None if
+    nothing overlaps.
+    """
+    anchor = None
+    for row in block.rows:
+        if row.genome == genome and (contig is None or row.contig == contig) and placed(row):
+            anchor = row
+            break
+    if anchor is None:
+        return None
+    pos = column_positions(anchor)
+    cols = np.flatnonzero((pos >= start) & (pos < end))
+    if len(cols) == 0:
+        return None
+    first, last = cols[0], cols[-1] + 1
+    return [(row, row.text[first:last], column_positions(row)[first:last])
+            for row in block.rows]
+
+
+def _format_rows(sliced):
+    rows = []
+    for row, text, pos in sliced:
+        covered = pos[pos >= 0]
+        if len(covered) == 0:
+            continue
+        rows.append({
+            'genome': row.genome,
+            'contig': row.contig or '',
+            'start': int(covered.min()) + 1 if placed(row) else 0,
+            'end': int(covered.max()) + 1 if placed(row) else 0,
+            'strand': row.strand,
+            'sequence': text
+        })
+    return rows
+
+
+class RegionCache(object):
+    """Local copies and loaded indexes of alignments, keyed by resolved ref."""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, max_indexes=16):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_indexes = max_indexes
+        self.indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path_for(self, info):
+        name = '{}_{}_{}.maf'.format(info[6], info[0], info[4])
+        return os.path.join(self.cache_dir, name)
+
+    def index_for(self, info, fetch_contigs):
+        """Index of the alignment described by info, fetching it on first use."""
+        maf_file = self.path_for(info)
+        with self._lock:
+            index = self.indexes.pop(maf_file, None)
+            # another process sharing the directory may have evicted it
+            if index is not None and os.path.exists(maf_file):
+                self.indexes[maf_file] = index
+                os.utime(maf_file, None)
+                return index
+        index_file = maf_file + INDEX_SUFFIX
+        if os.path.exists(index_file) and os.path.exists(maf_file):
+            os.utime(maf_file, None)
+        else:
+            write_local_copy(fetch_contigs(), maf_file)
+            index = AlignmentIndex.build(maf_file)
+            tmp_file = maf_file + '.{}.tmp.npz'.format(os.getpid())
+            index.save(tmp_file)
+            os.rename(tmp_file, index_file)
+        index = AlignmentIndex.load(maf_file)
+        with self._lock:
+            self.indexes[maf_file] = index
+            while len(self.indexes) > self.max_indexes:
+                self.indexes.popitem(last=False)
+        self.evict()
+        return index
+
+    def evict(self):
+        """Remove the least recently used copies not loaded here until within max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.maf'):
+                continue
+            maf_file = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(maf_file)
+                size = st.st_size + os.path.getsize(maf_file + INDEX_SUFFIX)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, size, maf_file))
+        total = sum(size for _, size, _ in entries)
+        with self._lock:
+            loaded = set(self.indexes)
+        for _, size, maf_file in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if maf_file in loaded:
+                continue
+            for path in (maf_file + INDEX_SUFFIX, maf_file):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+
+def query_region(index, genome, start, end, contig=None, page_size=None, page=0):
+    """
+    Aligned slice of [start, end) (0-based, half-open) on genome, optionally
+    cut into pages of page_size alignment columns.  Row coordinates in the
+    result are 1-based and inclusive.
+    """
+    blocks = []
+    for block in index.read_blocks(genome, start, end, contig):
+        sliced = slice_block(block, genome, start, end, contig)
+        if sliced:
+            anchor_pos = [pos for row, _, pos in sliced if row.genome == genome and placed(row)][0]
+            blocks.append((anchor_pos[anchor_pos >= 0].min(), sliced))
+    blocks.sort(key=lambda b: b[0])
+    blocks = [sliced for _, sliced in blocks]
+
+    total = sum(len(sliced[0][1]) for sliced in blocks)
+    pages = 1
+    if page_size:
+        pages = max(1, (total + page_size - 1) // page_size)
+    if page < 0 or page >= pages:
+        raise ValueError('page must be from 0 to {}'.format(pages - 1))
+    if page_size:
+        lo, hi = page * page_size, (page + 1) * page_size
+        paged = []
+        offset = 0
+        for sliced in blocks:
+            width = len(sliced[0][1])
+            a, b = max(lo - offset, 0), min(hi - offset, width)
+            if a < b:
+                paged.append([(row, text[a:b], pos[a:b]) for row, text, pos in sliced])
+            offset += width
+        blocks = paged
+
+    formatted = [_format_rows(sliced) for sliced in blocks]
+    return {
+        'blocks': [{'columns': len(rows[0]['sequence']), 'rows': rows}
+                   for rows in formatted if rows],
+        'total_columns': total,
+        'page': page,
+        'pages': pages
+    }
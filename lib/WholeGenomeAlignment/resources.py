@@ -0,0 +1,186 @@
+"""
+Resource accounting for the external processes a job runs.
+
+A ProcessMonitor is attached to a Popen as soon as it starts.  While the
+process runs, a thread samples /proc for the summed RSS of the process and
+all its descendants; nucmer and the mugsy and maf2fasta.pl pipelines are
+trees of processes, so the peak of the whole tree is what matters for
+sizing.  The process is then reaped with os.wait4, whose rusage gives its
+user and system CPU, the largest single RSS and the blocks read and written,
+all including any descendants it waited for.
+
+The resulting Usage records add up, so a job can report totals over every
+process it ran.  Without /proc (not Linux) only the rusage figures are kept.
+"""
+import errno
+import os
+import subprocess
+import threading
+import time
+
+
+SAMPLE_INTERVAL = 0.5
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_BLOCK_SIZE = 512
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            break
+        n /= 1024.0
+    return '{:.0f} {}'.format(n, unit) if unit == 'B' else '{:.1f} {}'.format(n, unit)
+
+
+class Usage(object):
+    """Wall time, CPU, peak RSS and I/O of one process, or of several added up."""
+
+    FIELDS = ('wall', 'user', 'sys', 'peak_rss', 'read_bytes', 'write_bytes')
+
+    def __init__(self, label, wall=0.0, user=0.0, sys=0.0, peak_rss=0, read_bytes=0,
+                 write_bytes=0, processes=1):
+        self.label = label
+        self.wall = wall
+        self.user = user
+        self.sys = sys
+        self.peak_rss = peak_rss
+        self.read_bytes = read_bytes
+        self.write_bytes = write_bytes
+        self.processes = processes
+
+    def add(self, other):
+        """Totals with other; peak RSS is the larger, not the sum."""
+        self.wall += other.wall
+        self.user += other.user
+        self.sys += other.sys
+        self.peak_rss = max(self.peak_rss, other.peak_rss)
+        self.read_bytes += other.read_bytes
+        self.write_bytes += other.write_bytes
+        self.processes += other.processes
+        return self
+
+    def as_dict(self):
+        d = dict((name, getattr(self, name)) for name in self.FIELDS)
+        d['label'] = self.label
+        d['processes'] = self.processes
+        return d
+
+    def describe(self):
+        return '{}: {:.1f} s wall, {:.1f} s user, {:.1f} s sys, peak RSS {}, read {}, written {}'.format(
+            self.label, self.wall, self.user, self.sys, format_bytes(self.peak_rss),
+            format_bytes(self.read_bytes), format_bytes(self.write_bytes))
+
+
+def total(usages, label='total'):
+    result = Usage(label, processes=0)
+    for usage in usages:
+        result.add(usage)
+    return result
+
+
+def parents():
+    """pid -> parent pid of every process visible in /proc."""
+    parents = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(name), 'r') as f:
+                stat = f.read()
+        except IOError:
+            continue
+        # the command name is parenthesised and may contain spaces
+        parents[int(name)] = int(stat[stat.rindex(')') + 2:].split()[1])
+    return parents
+
+
+def tree_pids(pid, parent_of=None):
+    """pid and every descendant of it, from parent_of if a parents() scan is at hand."""
+    children = {}
+    for child, parent in (parent_of if parent_of is not None else parents()).items():
+        children.setdefault(parent, []).append(child)
+    pids = [pid]
+    for p in pids:
+        pids.extend(children.get(p, []))
+    return pids
+
+
+def tree_rss(pid, parent_of=None):
+    """Summed resident set size in bytes of pid and its descendants."""
+    rss = 0
+    for p in tree_pids(pid, parent_of):
+        try:
+            with open('/proc/{}/statm'.format(p), 'r') as f:
+                rss += int(f.read().split()[1]) * _PAGE_SIZE
+        except (IOError, IndexError, ValueError):
+            pass
+    return rss
+
+
+def rusage_usage(label, wall, rusage, peak_tree_rss=0):
+    """Usage of a process reaped by os.wait4, or with rusage None if it was reaped elsewhere."""
+    usage = Usage(label, wall=wall)
+    if rusage is not None:
+        usage.user = rusage.ru_utime
+        usage.sys = rusage.ru_stime
+        usage.read_bytes = rusage.ru_inblock * _BLOCK_SIZE
+        usage.write_bytes = rusage.ru_oublock * _BLOCK_SIZE
+        # ru_maxrss is in kilobytes on Linux
+        usage.peak_rss = rusage.ru_maxrss * 1024
+    usage.peak_rss = max(usage.peak_rss, peak_tree_rss)
+    return usage
+
+
+class ProcessMonitor(object):
+    """
+    Samples a started Popen's process tree until wait() reaps it.  wait()
+    replaces p.wait(): it sets p.returncode and returns it, leaving the
+    measurements in .usage.
+    """
+
+    def __init__(self, p, label, interval=SAMPLE_INTERVAL):
+        self.p = p
+        self.label = label
+        self.interval = interval
+        self.start = time.time()
+        self.peak_tree_rss = 0
+        self.usage = None
+        self._done = threading.Event()
+        self._sampler = None
+        if os.path.isdir('/proc/{}'.format(p.pid)):
+            self._sampler = threading.Thread(target=self._sample)
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def _sample(self):
+        while not self._done.is_set():
+            self.peak_tree_rss = max(self.peak_tree_rss, tree_rss(self.p.pid))
+            self._done.wait(self.interval)
+
+    def wait(self):
+        if self.p.returncode is None:
+            while True:
+                try:
+                    _, status, rusage = os.wait4(self.p.pid, 0)
+                    break
+                except OSError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+            self.p._handle_exitstatus(status)
+        else:
+            # already reaped elsewhere; no rusage left to collect
+            rusage = None
+        self._done.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.usage = rusage_usage(self.label, time.time() - self.start, rusage, self.peak_tree_rss)
+        return self.p.returncode
+
+
+def check_call(cmd, label=None, **kwargs):
+    """subprocess.check_call that returns the Usage of the process."""
+    p = subprocess.Popen(cmd, **kwargs)
+    monitor = ProcessMonitor(p, label or (cmd if isinstance(cmd, str) else cmd[0]))
+    if monitor.wait() != 0:
+        raise subprocess.CalledProcessError(p.returncode, cmd)
+    return monitor.usage
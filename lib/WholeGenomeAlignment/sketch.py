@@ -0,0 +1,144 @@
+"""
+MinHash sketches of the input FASTA files, and guide trees built from them.
+
+A sketch is the bottom `size` hashes of a genome's canonical k-mers (k-mers
+with anything but ACGT in them are skipped).  Two sketches give a Jaccard
+estimate and from it the Mash distance, which approximates the per-base
+divergence.  Sketches only depend on the sequence, so they are cached by the
+md5 of the FASTA file together with k and size.
+"""
+import numpy as np
+
+from WholeGenomeAlignment.cache import file_md5
+from WholeGenomeAlignment.conditioning import encode
+from WholeGenomeAlignment.distance import neighbor_joining
+
+
+K = 21
+SIZE = 1000
+
+
+def _mix(x):
+    """splitmix64 finaliser, vectorised over uint64."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def kmer_hashes(seq, k=K):
+    """Hashes of the canonical k-mers of seq (k <= 31)."""
+    codes = encode(seq)
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    bad = np.zeros(n, dtype=bool)
+    bases = codes.astype(np.uint64) & np.uint64(3)
+    for t in range(k):
+        window = bases[t:t + n]
+        forward |= window << np.uint64(2 * (k - 1 - t))
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * t)
+        bad |= codes[t:t + n] == 4
+    canonical = np.minimum(forward, reverse)[~bad]
+    return _mix(canonical)
+
+
+def sketch_fasta(fasta_file, k=K, size=SIZE):
+    """Bottom-size MinHash sketch (sorted uint64) of all records of a FASTA file."""
+    sketch = np.zeros(0, dtype=np.uint64)
+    seq = []
+
+    def add(seq):
+        hashes = np.unique(kmer_hashes(''.join(seq), k))
+        return np.union1d(sketch, hashes[:size])[:size]
+
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                if seq:
+                    sketch = add(seq)
+                seq = []
+            else:
+                seq.append(line.strip())
+    if seq:
+        sketch = add(seq)
+    return sketch
+
+
+def mash_distance(a, b, k=K, size=SIZE):
+    union = np.union1d(a, b)[:size]
+    if len(union) == 0:
+        return 1.0
+    shared = np.intersect1d(np.intersect1d(a, b, assume_unique=True), union,
+                            assume_unique=True)
+    j = len(shared) / float(len(union))
+    if j == 0:
+        return 1.0
+    return min(1.0, -np.log(2 * j / (1 + j)) / k)
+
+
+def distance_matrix(sketches, k=K, size=SIZE):
+    n = len(sketches)
+    d = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            d[i, j] = d[j, i] = mash_distance(sketches[i], sketches[j], k, size)
+    return d
+
+
+def leaf_order(newick):
+    """Leaf labels in the order they appear in a Newick string."""
+    order = []
+    for token in newick.replace('(', ',').replace(')', ',').split(','):
+        label = token.split(':')[0].strip().rstrip(';')
+        if label:
+            order.append(label)
+    return order
+
+
+class SketchCache(object):
+    """Sketches of FASTA files, kept in a FileCache across jobs."""
+
+    def __init__(self, file_cache, k=K, size=SIZE):
+        self.file_cache = file_cache
+        self.k = k
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def sketch(self, fasta_file):
+        return self.lookup(fasta_file)[0]
+
+    def lookup(self, fasta_file):
+        """(sketch, True if it came from the cache) of fasta_file."""
+        key = 'sketch_{}_k{}_s{}.npy'.format(file_md5(fasta_file), self.k, self.size)
+        path = self.file_cache.get(key)
+        if path is not None:
+            try:
+                sketch = np.load(path)
+                self.hits += 1
+                return sketch, True
+            except (IOError, ValueError):
+                pass
+        self.misses += 1
+        sketch = sketch_fasta(fasta_file, self.k, self.size)
+
+        def write(tmp):
+            with open(tmp, 'wb') as f:
+                np.save(f, sketch)
+        self.file_cache.put(key, write)
+        return sketch, False
+
+    def guide_tree(self, fasta_files, labels):
+        """
+        (distance matrix, NJ tree as Newick, hits, misses) over fasta_files,
+        leaves named by labels.  hits and misses count this call only; the
+        cache is shared by concurrent jobs.
+        """
+        found = [self.lookup(f) for f in fasta_files]
+        d = distance_matrix([sketch for sketch, _ in found], self.k, self.size)
+        hits = sum(1 for _, cached in found if cached)
+        return d, neighbor_joining(d, labels), hits, len(found) - hits
@@ -0,0 +1,115 @@
+"""
+Streaming fetch of ContigSets straight to FASTA.
+
+ws.get_objects holds the whole response text and the whole decoded object
+at once, several times the size of the sequence.  Here the response to a
+get_object_subset call for just the contig ids and sequences is read
+through ijson's incremental parser instead, and each contig is written out
+as soon as its map closes, so no more than one contig is in memory at a
+time.  The FASTA is formatted as SeqIO writes it, so the
+files (and every cache keyed by their md5) are the same either way.
+
+ijson is optional; without it available() is False and the caller fetches
+objects whole as before.
+"""
+import json
+import random
+import urllib2
+
+try:
+    # the C backend, where built, is many times faster on long strings
+    import ijson.backends.yajl2_c as ijson
+except ImportError:
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+from WholeGenomeAlignment.dedup import sequence_md5
+from WholeGenomeAlignment.subset_fetch import CONTIGSET_PATHS
+
+
+LINE_WIDTH = 60
+TIMEOUT = 30 * 60
+
+_OBJECT = 'result.item.item'
+_INFO = _OBJECT + '.info.item'
+_CONTIG = _OBJECT + '.data.contigs.item'
+
+
+def available():
+    return ijson is not None
+
+
+def write_record(out, record_id, sequence):
+    out.write('>{}\n'.format(record_id))
+    for i in range(0, len(sequence), LINE_WIDTH):
+        out.write(sequence[i:i + LINE_WIDTH] + '\n')
+
+
+def post(url, token, method, params, timeout=TIMEOUT):
+    """Open a JSON-RPC 1.1 call; returns the response, unread."""
+    body = json.dumps({'version': '1.1', 'method': method, 'params': params,
+                       'id': str(random.random())[2:]})
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['AUTHORIZATION'] = token
+    try:
+        return urllib2.urlopen(urllib2.Request(url, body, headers), timeout=timeout)
+    except urllib2.HTTPError as e:
+        text = e.read()
+        try:
+            error = json.loads(text)['error']
+            message = error.get('message') or error.get('error')
+        except (ValueError, KeyError, TypeError, AttributeError):
+            message = text[:1000]
+        raise ValueError('{} failed: {}'.format(method, message))
+
+
+def _scalar(value):
+    # ijson gives Decimal for non-integers
+    return float(value) if type(value).__name__ == 'Decimal' else value
+
+
+def stream_contigset_fasta(url, token, ref, fasta_file):
+    """
+    Fetch ContigSet ref, writing its contigs to fasta_file as they are
+    parsed.  Returns (object info, sequence_md5 of each contig).
+    """
+    if ijson is None:
+        raise ValueError('Streaming fetch needs the ijson package')
+    response = post(url, token, 'Workspace.get_object_subset',
+                    [[{'ref': ref, 'included': CONTIGSET_PATHS}]])
+    info = []
+    md5s = []
+    contig = None
+    meta_key = None
+    error = None
+    with open(fasta_file, 'w') as out:
+        for prefix, event, value in ijson.parse(response):
+            if prefix == _CONTIG:
+                if event == 'start_map':
+                    contig = {}
+                elif event == 'end_map':
+                    write_record(out, contig['id'], contig['sequence'])
+                    md5s.append(sequence_md5(contig['sequence']))
+                    contig = None
+            elif contig is not None and prefix in (_CONTIG + '.id', _CONTIG + '.sequence'):
+                contig[prefix[len(_CONTIG) + 1:]] = value
+            elif prefix == _INFO:
+                if event == 'start_map':
+                    info.append({})
+                elif event == 'map_key':
+                    meta_key = value
+                elif event not in ('end_map', 'start_array', 'end_array'):
+                    info.append(_scalar(value))
+            elif prefix.startswith(_INFO + '.') and meta_key is not None:
+                info[-1][meta_key] = _scalar(value)
+            elif prefix == 'error.message':
+                error = value
+    response.close()
+    if error is not None:
+        raise ValueError('Workspace.get_object_subset failed: {}'.format(error))
+    if not info:
+        raise ValueError('No object returned for {}'.format(ref))
+    return info, md5s
@@ -0,0 +1,64 @@
+"""
+Fetching only the parts of input objects the pipeline reads.
+
+A Genome is read for its scientific_name and contigset_ref and a ContigSet
+for the id and sequence of each contig, so those are the only paths
+requested with get_object_subset; features, proteins and annotations never
+leave the workspace.  Which paths apply depends on the type, so the types
+are looked up first with one get_object_info_new call for all refs.
+"""
+
+
+GENOME_PATHS = ['scientific_name', 'contigset_ref']
+CONTIGSET_PATHS = ['contigs/[*]/id', 'contigs/[*]/sequence']
+
+_INCLUDED = {
+    'Genome': GENOME_PATHS,
+    'ContigSet': CONTIGSET_PATHS
+}
+
+
+def type_name(info):
+    """'Genome' for KBaseGenomes.Genome-8.0 and so on."""
+    return info[2].split('.')[1].split('-')[0]
+
+
+def subset_spec(ref, info):
+    """SubObjectIdentity for ref: its included paths, or the whole object for other types."""
+    spec = {'ref': ref}
+    included = _INCLUDED.get(type_name(info))
+    if included is not None:
+        spec['included'] = list(included)
+    return spec
+
+
+def get_subsets(ws, refs, infos):
+    """Objects of refs, whose infos are known, in one get_object_subset call."""
+    if not refs:
+        return []
+    return ws.get_object_subset([subset_spec(ref, info) for ref, info in zip(refs, infos)])
+
+
+def fetch_subsets(ws, refs):
+    """Objects of refs with only the included paths of their types."""
+    if not refs:
+        return []
+    infos = ws.get_object_info_new({'objects': [{'ref': ref} for ref in refs]})
+    return get_subsets(ws, refs, infos)
+
+
+def fetch_inputs(ws, refs):
+    """
+    Input objects of refs: Genomes with only their included paths, in one
+    call, and every other object as its info with data None; ContigSets
+    are fetched later, when their FASTA is written.
+    """
+    if not refs:
+        return []
+    infos = ws.get_object_info_new({'objects': [{'ref': ref} for ref in refs]})
+    objects = [{'info': info, 'data': None} for info in infos]
+    genomes = [pos for pos, info in enumerate(infos) if type_name(info) == 'Genome']
+    for pos, obj in zip(genomes, get_subsets(ws, [refs[pos] for pos in genomes],
+                                             [infos[pos] for pos in genomes])):
+        objects[pos] = obj
+    return objects
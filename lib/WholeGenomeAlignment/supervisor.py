@@ -0,0 +1,389 @@
+"""
+Supervised runs of the aligners.
+
+The aligner is started in its own process group so that on failure the
+whole tree (mugsy is a perl script driving several binaries) can be stopped
+together: SIGTERM first, then SIGKILL after a grace period.  Each line of its
+merged stdout/stderr is checked against patterns that mean the run cannot
+succeed, so that a crash deep inside a long run is reported at once rather
+than after the wrapper script gives up, and the run is stopped when its
+wall-clock limit passes even while the aligner prints nothing.
+
+Every run of a process is driven by one EventLoop, which waits on the
+non-blocking output pipes of all its runs with a single select and reaps
+them with os.wait4(WNOHANG), so no thread is held per aligner: a Supervisor
+only hands its command to the loop and waits for the result.  By default
+that is the process-wide shared_loop(), served from one daemon thread; when
+the server runs with gevent_monkeypatch_all that thread is a greenlet and
+select, the waits and the sleeps all yield to the hub, so a worker serving
+*_check and other calls can supervise any number of aligners at once.
+
+The output handlers passed with each command are not called on the loop:
+each loop hands the lines to a LogDispatcher thread, so a handler that
+blocks (on a lock, a full disk or a remote log) delays only later lines,
+never the timers and pipes of every other run.
+"""
+import Queue
+import errno
+import fcntl
+import os
+import re
+import select
+import signal
+import subprocess
+import threading
+import time
+
+from WholeGenomeAlignment.resources import SAMPLE_INTERVAL, parents, rusage_usage, tree_rss
+
+
+FATAL_PATTERNS = [
+    r'Segmentation fault',
+    r'std::bad_alloc',
+    r'terminate called',
+    r'[Oo]ut of memory',
+    r'Cannot allocate memory',
+    r'No space left on device'
+]
+
+KILL_GRACE = 10
+TAIL_LINES = 50
+READ_SIZE = 65536
+
+
+def _signal_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except OSError:
+        pass
+
+
+def _set_nonblocking(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+
+class LogDispatcher(object):
+    """
+    Calls the output handlers of runs from one daemon thread, in the order
+    the loop read the lines.  A run is only marked done once every line
+    read before it finished has been handed to its handler.
+    """
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+        thread = threading.Thread(target=self.serve_forever, name='aligner-log-dispatcher')
+        thread.daemon = True
+        thread.start()
+
+    def line(self, run, line):
+        self.queue.put((run, line))
+
+    def done(self, run):
+        self.queue.put((run, None))
+
+    def flush(self):
+        """Block until every line queued so far has been handled."""
+        self.queue.join()
+
+    def serve_forever(self):
+        while True:
+            run, line = self.queue.get()
+            try:
+                if line is None:
+                    if run.handler_error is not None and run.failure is None:
+                        # the process ended before the loop saw the error
+                        run.failure = 'stopped, output handler failed: {}'.format(run.handler_error)
+                    run.done.set()
+                elif run.handler_error is None:
+                    try:
+                        run.log_line(line)
+                    except Exception as e:
+                        # the loop stops the run on its next step
+                        run.handler_error = e
+            finally:
+                self.queue.task_done()
+
+
+class Run(object):
+    """
+    One process under an EventLoop.  Only the loop changes it, apart from
+    its LogDispatcher recording a failed handler; other threads call
+    result(), which blocks.
+    """
+
+    def __init__(self, p, label, log_line, timeout, fatal_patterns, kill_grace, dispatcher):
+        self.p = p
+        self.label = label
+        self.log_line = log_line
+        self.dispatcher = dispatcher
+        self.handler_error = None
+        self.timeout = timeout
+        self.fatal_patterns = fatal_patterns
+        self.kill_grace = kill_grace
+        self.fd = p.stdout.fileno()
+        _set_nonblocking(self.fd)
+        self.start = time.time()
+        self.deadline = self.start + timeout if timeout else None
+        self.kill_at = None
+        self.buffer = ''
+        self.tail = []
+        self.failure = None
+        self.reaped = False
+        self.rusage = None
+        self.peak_tree_rss = 0
+        self.usage = None
+        self.finished = False
+        self.done = threading.Event()
+
+    def fatal(self, line):
+        """The fatal pattern line matches, or None."""
+        for pattern in self.fatal_patterns:
+            if pattern.search(line):
+                return pattern.pattern
+        return None
+
+    def line(self, line):
+        self.tail = (self.tail + [line])[-TAIL_LINES:]
+        self.dispatcher.line(self, line)
+        pattern = self.fatal(line)
+        if pattern is not None:
+            self.fail('stopped on fatal output matching "{}"'.format(pattern))
+
+    def feed(self, data):
+        lines = (self.buffer + data).split('\n')
+        self.buffer = lines.pop()
+        for line in lines:
+            if self.failure is None:
+                self.line(line)
+
+    def end_of_output(self):
+        self.p.stdout.close()
+        self.fd = None
+        if self.buffer and self.failure is None:
+            self.line(self.buffer)
+        self.buffer = ''
+
+    def fail(self, failure):
+        """Record failure and SIGTERM the process group; the loop SIGKILLs it after the grace period."""
+        if self.failure is None:
+            self.failure = failure
+            self.kill_at = time.time() + self.kill_grace
+            _signal_group(self.p.pid, signal.SIGTERM)
+
+    def reap(self):
+        """True once the process has exited; its rusage is kept for the Usage."""
+        if self.reaped:
+            return True
+        try:
+            pid, status, rusage = os.wait4(self.p.pid, os.WNOHANG)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                return False
+            if e.errno != errno.ECHILD:
+                raise
+            # gevent's child watcher reaps children itself; only the exit
+            # status is left to collect
+            if self.p.poll() is None:
+                return False
+        else:
+            if pid == 0:
+                return False
+            self.p._handle_exitstatus(status)
+            self.rusage = rusage
+        self.reaped = True
+        return True
+
+    def finish(self):
+        # stragglers of a failed run that kept the pipe open
+        _signal_group(self.p.pid, signal.SIGKILL)
+        if self.fd is not None:
+            self.p.stdout.close()
+            self.fd = None
+        self.usage = rusage_usage(self.label, time.time() - self.start, self.rusage, self.peak_tree_rss)
+        self.finished = True
+        self.dispatcher.done(self)
+
+    def result(self):
+        """
+        (return code, resources.Usage); raises ValueError if the run timed
+        out, printed a fatal pattern or its handler failed.  Blocks the
+        calling thread until the process has been reaped and every line of
+        its output handled, so it must not be called from the loop's own
+        thread or from an output handler.
+        """
+        # a timeout keeps the wait interruptible by signals
+        while not self.done.wait(SAMPLE_INTERVAL):
+            pass
+        if self.failure is not None:
+            raise ValueError('{} {}\n\n{}'.format(self.label, self.failure, '\n'.join(self.tail)))
+        return self.p.returncode, self.usage
+
+
+class EventLoop(object):
+    """
+    Starts processes and drives all of their Runs from whichever single
+    thread (or greenlet) calls step(), run_until_done() or serve_forever().
+    select limits a loop to FD_SETSIZE (1024) concurrent runs.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.dispatcher = LogDispatcher()
+        self.runs = []
+        self._new = []
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        _set_nonblocking(self._wake_r)
+        _set_nonblocking(self._wake_w)
+        self._next_sample = 0
+
+    def spawn(self, cmd, label, log_line, cwd=None, timeout=None,
+              fatal_patterns=FATAL_PATTERNS, kill_grace=KILL_GRACE):
+        """Start cmd and hand it to the loop; safe to call from any thread."""
+        # close_fds so that no other run's child holds this pipe open
+        p = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             preexec_fn=os.setsid, close_fds=True)
+        run = Run(p, label, log_line, timeout,
+                  [re.compile(pattern) for pattern in fatal_patterns], kill_grace, self.dispatcher)
+        with self._lock:
+            self._new.append(run)
+        try:
+            os.write(self._wake_w, 'x')
+        except OSError as e:
+            # a full pipe wakes the loop just as well
+            if e.errno != errno.EAGAIN:
+                raise
+        return run
+
+    def _select_timeout(self, now, limit):
+        if not self.runs:
+            # idle until spawn() writes to the wake pipe
+            return limit
+        timeout = max(0, self._next_sample - now)
+        for run in self.runs:
+            for t in (run.deadline, run.kill_at):
+                if t is not None:
+                    timeout = min(timeout, max(0, t - now))
+        return timeout if limit is None else min(timeout, limit)
+
+    def step(self, limit=None):
+        """One round: wait for output or the next timer, at most limit seconds, then act on it."""
+        with self._lock:
+            self.runs.extend(self._new)
+            self._new = []
+        fds = dict((run.fd, run) for run in self.runs if run.fd is not None)
+        try:
+            readable, _, _ = select.select(list(fds) + [self._wake_r], [], [],
+                                           self._select_timeout(time.time(), limit))
+        except (select.error, IOError, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            readable = []
+        for fd in readable:
+            if fd == self._wake_r:
+                try:
+                    os.read(self._wake_r, READ_SIZE)
+                except OSError as e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+                continue
+            run = fds[fd]
+            try:
+                data = os.read(fd, READ_SIZE)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                raise
+            if data:
+                run.feed(data)
+            else:
+                run.end_of_output()
+
+        now = time.time()
+        sample = now >= self._next_sample
+        if sample:
+            self._next_sample = now + self.interval
+            parent_of = parents() if os.path.isdir('/proc') and self.runs else None
+        for run in list(self.runs):
+            if run.failure is None and run.handler_error is not None:
+                run.fail('stopped, output handler failed: {}'.format(run.handler_error))
+            if run.failure is None and run.deadline is not None and now >= run.deadline:
+                run.fail('timed out after {} s'.format(run.timeout))
+            if run.kill_at is not None and now >= run.kill_at:
+                _signal_group(run.p.pid, signal.SIGKILL)
+            if sample and parent_of is not None and not run.reaped:
+                run.peak_tree_rss = max(run.peak_tree_rss, tree_rss(run.p.pid, parent_of))
+            if run.reap() and (run.fd is None or run.failure is not None):
+                run.finish()
+                self.runs.remove(run)
+
+    def pending(self):
+        with self._lock:
+            return len(self.runs) + len(self._new)
+
+    def run_until_done(self, runs=None):
+        """
+        Step until runs (by default every run of the loop) have finished,
+        then wait for their output to be handled.
+        """
+        while True:
+            waiting = [run for run in runs if not run.finished] if runs is not None else self.pending()
+            if not waiting:
+                break
+            self.step()
+        self.dispatcher.flush()
+
+    def serve_forever(self):
+        while True:
+            try:
+                self.step()
+            except Exception as e:
+                # a loop that dies would strand every waiting Run
+                for run in self.runs:
+                    run.fail('stopped, supervisor loop failed: {}'.format(e))
+                    run.finish()
+                self.runs = []
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_loop():
+    """The process-wide EventLoop, served from a daemon thread started on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = EventLoop()
+            thread = threading.Thread(target=_shared.serve_forever, name='aligner-supervisor')
+            thread.daemon = True
+            thread.start()
+        return _shared
+
+
+class Supervisor(object):
+    """
+    Runs commands on loop, an EventLoop some thread serves, or by default
+    on shared_loop().
+    """
+
+    def __init__(self, timeout=None, fatal_patterns=FATAL_PATTERNS, kill_grace=KILL_GRACE, loop=None):
+        self.timeout = timeout
+        self.fatal_patterns = fatal_patterns
+        self.kill_grace = kill_grace
+        self.loop = loop
+
+    def start(self, cmd, label, log_line, cwd=None):
+        """Start cmd on the loop, passing each output line to log_line; returns its Run."""
+        loop = self.loop if self.loop is not None else shared_loop()
+        return loop.spawn(cmd, label, log_line, cwd=cwd, timeout=self.timeout,
+                          fatal_patterns=self.fatal_patterns, kill_grace=self.kill_grace)
+
+    def run(self, cmd, label, log_line, cwd=None):
+        """
+        Run cmd, passing each output line to log_line, and block until it
+        ends.  Returns (return code, resources.Usage); raises ValueError if
+        the run times out, prints a fatal pattern or log_line raises, after
+        stopping every process of the run.
+        """
+        return self.start(cmd, label, log_line, cwd).result()
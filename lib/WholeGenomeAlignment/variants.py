@@ -0,0 +1,180 @@
+"""
+Variant sites of an alignment against one reference genome, written as VCF.
+
+Blocks are turned around so the reference row is on the forward strand and
+then processed in chunks of columns as (genomes x columns) uint8 matrices.
+Substitutions are the gap-free columns where a called base differs from the
+reference; every maximal run of columns with a gap in any row becomes one
+indel record, anchored on the reference base before it as VCF requires.
+A run at the start of a block has no such base in the block, so it is only
+written (anchored on the base after it) when it starts the reference
+contig, the one place VCF allows that; otherwise it is skipped and counted
+in unanchored_indels.  Genomes are haploid, so each sample gets
+a single allele index, or '.' when it is absent from the block or an N.
+
+Records are written as each block is finished; feeding the blocks in
+reference order (AlignmentIndex.ordered_blocks) keeps the file sorted.
+"""
+import numpy as np
+
+from WholeGenomeAlignment.alignment_io import (AlignedRow, AlignmentBlock, column_positions,
+                                               mask_runs, reverse_complement)
+
+
+CHUNK_COLUMNS = 65536
+
+_GAP = ord('-')
+_N = ord('N')
+_UPPER = np.arange(256, dtype=np.uint8)
+_UPPER[ord('a'):ord('z') + 1] -= 32
+
+_HEADER = [
+    '##fileformat=VCFv4.2',
+    '##source=WholeGenomeAlignment',
+    '##reference={}',
+    '##INFO=<ID=NS,Number=1,Type=Integer,Description="Number of genomes with a call">',
+    '##INFO=<ID=TYPE,Number=1,Type=String,Description="snp or indel">',
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="Haploid genotype">'
+]
+
+
+def orient(block, genome):
+    """The block, reverse complemented if genome's row is on the minus strand."""
+    ref = block.row_for(genome)
+    if ref is None or ref.strand == '+':
+        return block
+    rows = [AlignedRow(row.genome, row.contig, row.start, row.end,
+                       '+' if row.strand == '-' else '-', row.src_size,
+                       reverse_complement(row.text))
+            for row in block.rows]
+    return AlignmentBlock(rows, block.offset, block.length)
+
+
+def _residues(text):
+    return text.replace('-', '').upper()
+
+
+class VariantWriter(object):
+    """
+    Streams VCF records for reference against samples (genome keys; the
+    reference should be one of them).  contig_offsets splits the positions
+    of rows without a contig (XMFA) back into contigs.
+    """
+
+    def __init__(self, vcf_file, reference, samples, contig_offsets=None,
+                 chunk_columns=CHUNK_COLUMNS):
+        self.vcf_file = vcf_file
+        self.reference = reference
+        self.samples = list(samples)
+        self.contig_offsets = contig_offsets
+        self.chunk_columns = chunk_columns
+        self.snps = 0
+        self.indels = 0
+        self.skipped_blocks = 0
+        self.unanchored_indels = 0
+        self._out = open(vcf_file, 'w')
+        for line in _HEADER:
+            self._out.write(line.format(reference) + '\n')
+        self._out.write('\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL',
+                                   'FILTER', 'INFO', 'FORMAT'] + self.samples) + '\n')
+
+    def _chrom(self, ref, pos):
+        if ref.contig is not None:
+            return ref.contig, pos
+        if self.contig_offsets is not None:
+            index, offset = self.contig_offsets.locate(pos)
+            return self.contig_offsets.contig_ids[index], offset
+        return ref.genome, pos
+
+    def _record(self, ref, pos, ref_allele, alleles, kind):
+        """alleles: one per sample, None when there is no call."""
+        alts = []
+        genotypes = []
+        for allele in alleles:
+            if allele is None:
+                genotypes.append('.')
+            elif allele == ref_allele:
+                genotypes.append('0')
+            else:
+                if allele not in alts:
+                    alts.append(allele)
+                genotypes.append(str(alts.index(allele) + 1))
+        if not alts:
+            return None
+        chrom, pos = self._chrom(ref, pos)
+        called = len(alleles) - alleles.count(None)
+        return '\t'.join([chrom, str(pos + 1), '.', ref_allele, ','.join(alts), '.', 'PASS',
+                          'NS={};TYPE={}'.format(called, kind), 'GT'] + genotypes)
+
+    def add_block(self, block):
+        block = orient(block, self.reference)
+        ref = block.row_for(self.reference)
+        if ref is None:
+            self.skipped_blocks += 1
+            return
+        rows = [block.row_for(genome) for genome in self.samples]
+        present = [i for i, row in enumerate(rows) if row is not None]
+        texts = [str(rows[i].text) for i in present]
+        ref_index = [rows[i] for i in present].index(ref)
+        positions = column_positions(ref)
+        width = len(ref.text)
+        gap_columns = np.zeros(width, dtype=bool)
+        records = []
+
+        for lo in range(0, width, self.chunk_columns):
+            hi = min(lo + self.chunk_columns, width)
+            matrix = _UPPER[np.array([np.frombuffer(text[lo:hi], dtype=np.uint8) for text in texts])]
+            gaps = matrix == _GAP
+            gap_columns[lo:hi] = gaps.any(axis=0)
+            called = ~gaps & (matrix != _N)
+            ref_bases = matrix[ref_index]
+            differs = (called & (matrix != ref_bases)).any(axis=0)
+            for c in np.flatnonzero(differs & ~gap_columns[lo:hi] & (ref_bases != _N)):
+                alleles = [None] * len(self.samples)
+                for k, i in enumerate(present):
+                    if called[k, c]:
+                        alleles[i] = chr(matrix[k, c])
+                record = self._record(ref, positions[lo + c], chr(ref_bases[c]), alleles, 'snp')
+                if record:
+                    records.append((positions[lo + c], record))
+                    self.snps += 1
+
+        for a, b in mask_runs(gap_columns):
+            # the columns either side of a maximal gap run have no gaps
+            leading = a == 0
+            if not leading:
+                a -= 1
+            elif b < width:
+                b += 1
+            ref_allele = _residues(ref.text[a:b])
+            if not ref_allele:
+                continue
+            span = positions[a:b]
+            pos = span[span >= 0].min()
+            if leading and (b == width or self._chrom(ref, pos)[1] != 0):
+                self.unanchored_indels += 1
+                continue
+            alleles = [None] * len(self.samples)
+            for k, i in enumerate(present):
+                allele = _residues(texts[k][a:b])
+                if allele and 'N' not in allele:
+                    alleles[i] = allele
+            record = self._record(ref, pos, ref_allele, alleles, 'indel')
+            if record:
+                records.append((pos, record))
+                self.indels += 1
+
+        records.sort(key=lambda r: r[0])
+        for _, record in records:
+            self._out.write(record + '\n')
+
+    def close(self):
+        self._out.close()
+
+
+def write_vcf(blocks, vcf_file, reference, samples, contig_offsets=None):
+    writer = VariantWriter(vcf_file, reference, samples, contig_offsets)
+    for block in blocks:
+        writer.add_block(block)
+    writer.close()
+    return writer
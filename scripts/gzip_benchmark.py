@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Bytes on the wire and latency of JSON-RPC sized payloads with and without
+gzip.  By default a local WSGI server serves synthetic payloads through
+GzipMiddleware, the layer gzip_server installs around the real server;
+with --url a JSON-RPC request from a file is replayed against a running
+service (scripts/start_server.sh), e.g. a get_alignment_region call.
+
+    PYTHONPATH=lib python scripts/gzip_benchmark.py [rows ...]
+    PYTHONPATH=lib python scripts/gzip_benchmark.py --url http://localhost:5000 request.json
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib2
+
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from WholeGenomeAlignment.compression import GzipMiddleware, gzip_bytes
+
+
+def region_response(rows, columns=200):
+    """A get_alignment_region style result with the given number of rows."""
+    rng = random.Random(rows)
+    base = ''.join(rng.choice('ACGT') for _ in range(columns))
+    segments = []
+    for i in range(rows):
+        seq = ''.join(c if rng.random() > 0.05 else rng.choice('ACGT-') for c in base)
+        segments.append({'genome': str(i % 10 + 1), 'contig': 'contig_{}'.format(i),
+                         'start': i * columns + 1, 'end': (i + 1) * columns,
+                         'strand': '+', 'sequence': seq})
+    return json.dumps({'version': '1.1', 'id': '1',
+                       'result': [{'blocks': [{'columns': columns, 'rows': segments}]}]})
+
+
+def payload_app(environ, start_response):
+    size = int(environ.get('CONTENT_LENGTH') or 0)
+    request = json.loads(environ['wsgi.input'].read(size))
+    body = region_response(request['rows'])
+    start_response('200 OK', [('content-type', 'application/json'),
+                              ('content-length', str(len(body)))])
+    return [body]
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def call(url, body, gzip_request, gzip_response, repeats=5, token=None):
+    headers = {'content-type': 'application/json'}
+    if token:
+        headers['Authorization'] = token
+    if gzip_request:
+        body = gzip_bytes(body)
+        headers['Content-Encoding'] = 'gzip'
+    if gzip_response:
+        headers['Accept-Encoding'] = 'gzip'
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        response = urllib2.urlopen(urllib2.Request(url, body, headers))
+        received = response.read()
+        times.append(time.time() - start)
+    return len(body), len(received), sorted(times)[len(times) // 2]
+
+
+def replay(url, request_file):
+    with open(request_file) as f:
+        body = f.read()
+    token = os.environ.get('KB_AUTH_TOKEN')
+    print('gzip\tsent bytes\treceived bytes\tmedian ms')
+    for gzipped in (False, True):
+        sent, received, latency = call(url, body, gzipped, gzipped, token=token)
+        print('{}\t{}\t{}\t{:.1f}'.format('yes' if gzipped else 'no', sent, received,
+                                          latency * 1000))
+
+
+def main(argv):
+    if argv[:1] == ['--url']:
+        return replay(argv[1], argv[2])
+    row_counts = [int(a) for a in argv] or [10, 1000, 10000]
+    server = make_server('127.0.0.1', 0, GzipMiddleware(payload_app),
+                         handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{}/'.format(server.server_port)
+
+    print('rows\tgzip\tsent bytes\treceived bytes\tmedian ms')
+    for rows in row_counts:
+        for gzipped in (False, True):
+            body = json.dumps({'rows': rows, 'padding': region_response(rows)})
+            sent, received, latency = call(url, body, gzipped, gzipped)
+            print('{}\t{}\t{}\t{}\t{:.1f}'.format(rows, 'yes' if gzipped else 'no',
+                                                  sent, received, latency * 1000))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.alignment_index import AlignmentIndex
+
+
+class AlignmentIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_maf_lookup(self):
+        maf = self.write('out.maf', '\n'.join([
+            '##maf version=1',
+            'a score=1',
+            's 1.chr 0 4 + 100 ACGT',
+            's 2.chr 10 4 + 100 ACGT',
+            '',
+            'a score=2',
+            's 1.chr 50 4 + 100 GGCC',
+            's 2.chr 2 4 - 100 GGCC',
+            '',
+            'a score=3',
+            's 1.chr 2 30 + 100 ' + 'A' * 30,
+            '']))
+        AlignmentIndex.build(maf).save()
+        index = AlignmentIndex.load(maf)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.genomes(), ['1', '2'])
+        self.assertEqual(len(index.query('1', 3, 10)), 2)
+        self.assertEqual(index.query('1', 40, 50), [])
+        blocks = list(index.read_blocks('2', 94, 95, contig='chr'))
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0].rows[0].text, 'GGCC')
+
+    def test_xmfa_lookup(self):
+        xmfa = self.write('out.xmfa', '\n'.join([
+            '#FormatVersion Mauve1',
+            '#Sequence1File\t/tmp/1.fa',
+            '#Sequence2File\t/tmp/2.fa',
+            '> 1:1-4 + /tmp/1.fa', 'ACGT',
+            '> 2:5-8 - /tmp/2.fa', 'ACGT',
+            '=',
+            '> 1:5-8 + /tmp/1.fa', 'TTTT',
+            '=', '']))
+        index = AlignmentIndex.build(xmfa)
+        blocks = list(index.read_blocks('1', 4, 5))
+        self.assertEqual([b.rows[0].text for b in blocks], ['TTTT'])
+        self.assertEqual(index.query('2', 0, 4), [])
@@ -0,0 +1,109 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.alignment_io import read_fasta_blocks, read_maf
+from WholeGenomeAlignment.alignment_merge import IncrementalMerge, block_of, blocks_from_contigs
+from WholeGenomeAlignment.region_query import row_location
+
+
+class AlignmentMergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.contigs = [{'id': '1.c:1-10', 'sequence': 'ACGTA-CGTAC'},
+                        {'id': '2.c:1-11', 'sequence': 'ACGTAACGTAC'},
+                        {'id': '1.c:20-25', 'sequence': 'GGGCCC'},
+                        {'id': '2.c:20-24', 'sequence': 'GGGCC-'}]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_blocks_from_contigs(self):
+        blocks = blocks_from_contigs(self.contigs)
+        self.assertEqual([len(b) for b in blocks], [2, 2])
+
+    def test_tagged_blocks(self):
+        # equal widths and disjoint genomes, but two blocks
+        contigs = [{'id': '1:1-4', 'sequence': 'ACGT', 'description': '1:1-4 + block=0'},
+                   {'id': '2:1-4', 'sequence': 'TTTT', 'description': '2:1-4 + block=1'},
+                   {'id': '3:1-4', 'sequence': 'TTTT', 'description': '3:1-4 + block=1'}]
+        self.assertEqual([len(b) for b in blocks_from_contigs(contigs)], [1, 2])
+        self.assertEqual([len(b) for b in blocks_from_contigs(contigs[:1] + [{'id': '2:1-4', 'sequence': 'TTTT'}])], [2])
+
+    def test_read_fasta_blocks(self):
+        path = self.write('aln.fasta', '>1:1-4 + a.fa\nAC\nGT\n>2:1-4 - b.fa\nACGT\n=\n>1:9-12 + a.fa\nGGGG\n=\n')
+        self.assertEqual(list(read_fasta_blocks(path)), [(0, '1:1-4 + a.fa', 'ACGT'),
+                                                         (0, '2:1-4 - b.fa', 'ACGT'),
+                                                         (1, '1:9-12 + a.fa', 'GGGG')])
+
+    def test_consensus(self):
+        merge = IncrementalMerge(self.contigs)
+        self.assertEqual(merge.genomes, ['1', '2'])
+        self.assertEqual(merge.new_genome_keys(2), ['3', '4'])
+        self.assertEqual(merge.consensus[0][0], 'ACGTAACGTAC')
+
+    def test_merge_with_insertion(self):
+        maf = self.write('out.maf', '\n'.join([
+            'a score=0',
+            's consensus.block0 0 10 + 11 ACGTA--ACGTA',
+            's 3.c1 5 12 + 40 ACGTATTACGTA',
+            '',
+            'a score=0',
+            's consensus.block1 0 6 + 6 GGGCCC',
+            's 3.c1 0 6 - 40 GGGCCC',
+            '']))
+        merge = IncrementalMerge(self.contigs)
+        for block in read_maf(maf):
+            merge.add_block(block, set(['3']))
+        rows = [(c['id'], c['sequence']) for c in merge.merged_contigs(['3'])]
+        self.assertEqual(rows, [('1.c:1-10', 'ACGTA---CGTAC'),
+                                ('2.c:1-11', 'ACGTA--ACGTAC'),
+                                ('3.c1:6-17', 'ACGTATTACGTA-'),
+                                ('1.c:20-25', 'GGGCCC'),
+                                ('2.c:20-24', 'GGGCC-'),
+                                ('3.c1:35-40', 'GGGCCC')])
+        self.assertEqual([block_of(c) for c in merge.merged_contigs(['3'])], [0, 0, 0, 1, 1, 1])
+
+    def test_leading_insertion(self):
+        maf = self.write('out.maf', '\n'.join([
+            'a score=0',
+            's consensus.block0 0 11 + 11 --ACGTAACGTAC',
+            's 3.c1 0 13 + 40 TTACGTAACGTAC',
+            '']))
+        merge = IncrementalMerge(self.contigs)
+        for block in read_maf(maf):
+            merge.add_block(block, set(['3']))
+        rows = [(c['id'], c['sequence']) for c in merge.merged_contigs(['3'])[:3]]
+        self.assertEqual(rows, [('1.c:1-10', '--ACGTA-CGTAC'),
+                                ('2.c:1-11', '--ACGTAACGTAC'),
+                                ('3.c1:1-13', 'TTACGTAACGTAC')])
+
+    def test_rows_per_contig_and_strand(self):
+        # one old block hit by two contigs of the new genome, one reversed
+        maf = self.write('out.maf', '\n'.join([
+            'a score=0',
+            's consensus.block0 0 5 + 11 ACGTA',
+            's 3.c1 100 5 + 200 ACGTA',
+            '',
+            'a score=0',
+            's consensus.block0 5 6 + 11 ACGTAC',
+            's 3.c2 37 6 - 50 ACGTAC',
+            '']))
+        merge = IncrementalMerge(self.contigs)
+        for block in read_maf(maf):
+            merge.add_block(block, set(['3']))
+        rows = merge.merged_contigs(['3'])[:4]
+        self.assertEqual([(c['id'], c['sequence']) for c in rows[2:]],
+                         [('3.c1:101-105', 'ACGTA------'),
+                          ('3.c2:8-13', '-----ACGTAC')])
+        self.assertEqual([row_location(c) for c in rows[2:]],
+                         [('3', 'c1', 100, 105, '+'), ('3', 'c2', 7, 13, '-')])
+        self.assertEqual([block_of(c) for c in rows], [0, 0, 0, 0])
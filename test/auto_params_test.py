@@ -0,0 +1,61 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from WholeGenomeAlignment.auto_params import (choose, default_seed_weight, fasta_size,
+                                              mbp_compared, seed_weight, tier_for)
+
+
+class AutoParamsTest(unittest.TestCase):
+
+    def test_tiers(self):
+        self.assertEqual(tier_for(0.001)[0], 'closely related strains')
+        self.assertEqual(tier_for(0.05)[0], 'same species')
+        self.assertEqual(tier_for(1.0)[0], 'divergent')
+
+    def test_seed_weight(self):
+        self.assertEqual(seed_weight([5000000, 5000000]), 15)
+        self.assertEqual(seed_weight([100000]), 11)
+        self.assertEqual(seed_weight([100]), 9)
+        self.assertEqual(seed_weight([10 ** 12]), 21)
+        # the weight follows the whole input set, not each input alone
+        self.assertNotEqual(seed_weight([100000, 100000]), seed_weight([100000, 20000000]))
+
+    def test_default_seed_weight(self):
+        self.assertEqual(default_seed_weight([5000000, 5000000]), 16)
+        self.assertEqual(default_seed_weight([100000]), 12)
+        self.assertEqual(default_seed_weight([100]), 5)
+        self.assertEqual(default_seed_weight([10 ** 12]), 27)
+        self.assertEqual(default_seed_weight([]), 5)
+
+    def test_choose(self):
+        d = np.array([[0, 0.01, 0.015], [0.01, 0, 0.012], [0.015, 0.012, 0]])
+        sizes = [2000000, 2100000, 1900000]
+        chosen, note = choose('mugsy', {'distance': 500}, sizes, d)
+        self.assertEqual(chosen, {'minlength': 100})
+        self.assertIn('set by the caller: distance', note)
+        self.assertIn('max 0.015', note)
+        self.assertIn('Mbp compared: 12.0', note)
+
+        chosen, _ = choose('mauve', {}, sizes, d * 20)
+        self.assertEqual(chosen['hmm_identity'], 0.6)
+
+        # 0 is a value the caller set; None is unset
+        chosen, note = choose('mugsy', {'minlength': 0, 'distance': None}, sizes, d)
+        self.assertEqual(chosen, {'distance': 1000})
+        self.assertIn('set by the caller: minlength', note)
+
+    def test_sizes(self):
+        self.assertEqual(mbp_compared('mugsy', [1e6, 1e6]), 2.0)
+        self.assertEqual(mbp_compared('mauve', [1e6, 1e6, 1e6, 1e6]), 8.0)
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'a.fa')
+            with open(path, 'w') as f:
+                f.write('>a desc\nACGT\nAC\n>b\nNNN\n')
+            self.assertEqual(fasta_size(path), 9)
+        finally:
+            shutil.rmtree(tmp)
@@ -0,0 +1,38 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.backbone import Backbone, summary_meta, summary_report
+
+
+class BackboneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.backbone = os.path.join(self.tmp, 'out.xmfa.backbone')
+        with open(self.backbone, 'w') as f:
+            f.write('seq0_leftend\tseq0_rightend\tseq1_leftend\tseq1_rightend\t'
+                    'seq2_leftend\tseq2_rightend\n')
+            f.write('1\t100\t1\t100\t1\t90\n')
+            f.write('101\t200\t101\t200\t91\t190\n')
+            f.write('201\t300\t-401\t-500\t191\t290\n')
+            f.write('301\t400\t-301\t-400\t291\t390\n')
+            f.write('401\t450\t0\t0\t391\t440\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_summary(self):
+        backbone = Backbone.load(self.backbone)
+        self.assertEqual((backbone.segments, backbone.genomes), (5, 3))
+        summary = backbone.summary()
+        self.assertEqual(summary['core_segments'], 4)
+        self.assertEqual(summary['lcb_count'], 2)
+        self.assertEqual(list(summary['lcb_weights']), [190, 200])
+        self.assertEqual(list(summary['core_bp']), [400, 400, 390])
+        self.assertEqual(list(summary['accessory_bp']), [50, 0, 50])
+        self.assertEqual(summary['shared_bp'][0, 2], 440)
+        self.assertEqual(list(summary['inversions'][0]), [0, 1, 0])
+        self.assertEqual(summary_meta(summary)['inverted_lcbs'], '0,1,0')
+        self.assertIn('Locally collinear blocks: 2', summary_report(summary, ['1', '2', '3']))
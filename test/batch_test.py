@@ -0,0 +1,83 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+
+from WholeGenomeAlignment.batch import SharedInputs, genome_refs_of, run_jobs, job_context
+
+
+class FakeWorkspace(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def get_objects(self, object_ids):
+        self.calls.append([o['ref'] for o in object_ids])
+        return [{'data': {'ref': o['ref']}, 'info': None} for o in object_ids]
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.shared = SharedInputs(os.path.join(self.tmp, 'batch'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_fetch_once(self):
+        ws = FakeWorkspace()
+        self.shared.prefetch(ws, ['1/2/3', '1/3/1', '1/2/3'])
+        self.shared.prefetch(ws, ['1/3/1'])
+        self.assertEqual(self.shared.get_object(ws, '1/2/3')['data']['ref'], '1/2/3')
+        self.shared.get_object(ws, '1/4/1')
+        self.assertEqual(ws.calls, [['1/2/3', '1/3/1'], ['1/4/1']])
+
+    def test_genome_refs(self):
+        genomesets = {'1/9/1': {'data': {'elements': {'a': {'ref': '1/2/3'}}}}}
+        params = {'input_genomeset_ref': '1/9/1', 'input_genome_refs': ['1/3/1', None]}
+        self.assertEqual(genome_refs_of(params, genomesets), ['1/2/3', '1/3/1'])
+
+    def test_prepare_once(self):
+        prepared = []
+
+        def prepare(path):
+            prepared.append(path)
+            with open(path, 'w') as f:
+                f.write('>c\nACGT\n')
+            return 'map'
+
+        def job(n):
+            dest = os.path.join(self.tmp, '{}.fa'.format(n))
+            result = self.shared.prepare_fasta(['1/2/3', None, None], dest, prepare)
+            with open(dest) as f:
+                self.assertEqual((result, f.read()), ('map', '>c\nACGT\n'))
+
+        threads = [threading.Thread(target=job, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual((len(prepared), self.shared.reused), (1, 3))
+
+    def test_run_jobs(self):
+        def run_job(job):
+            if job['params']['fail']:
+                raise ValueError('bad input')
+            return {'report_name': job['params']['output_alignment_name']}
+
+        jobs = [{'method': 'mugsy', 'params': {'output_alignment_name': str(n), 'fail': n == 1}}
+                for n in range(3)]
+        results = run_jobs(jobs, run_job, 2)
+        self.assertEqual([r.get('output') for r in results],
+                         [{'report_name': '0'}, None, {'report_name': '2'}])
+        self.assertIn('bad input', results[1]['error'])
+        self.assertTrue(all(r['elapsed'] >= 0 for r in results))
+
+    def test_job_context(self):
+        ctx = {'token': 't', 'provenance': [{'method': 'run_alignment_batch'}]}
+        job_ctx = job_context(ctx, mapping_processes=2)
+        job_ctx['provenance'][0]['description'] = 'changed'
+        self.assertEqual(ctx['provenance'][0], {'method': 'run_alignment_batch'})
+        self.assertEqual(job_ctx['mapping_processes'], 2)
@@ -0,0 +1,39 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.cache import FileCache
+
+
+class FileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_eviction(self):
+        cache = FileCache(os.path.join(self.tmp, 'small'), max_bytes=10)
+        for key in ('a', 'b'):
+            cache.put(key, lambda path: open(path, 'w').write('12345678'))
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('b'))
+
+    def test_corrupt_entry(self):
+        cache = FileCache(os.path.join(self.tmp, 'seeds'))
+        src = os.path.join(self.tmp, 'x.sslist')
+        with open(src, 'w') as f:
+            f.write('seeds')
+        cache.put_file('k', src)
+        dest = os.path.join(self.tmp, 'y.sslist')
+        self.assertTrue(cache.link('k', dest, verify=True))
+        with open(dest) as f:
+            self.assertEqual(f.read(), 'seeds')
+        path = cache.path_for('k')
+        os.chmod(path, 0o644)
+        with open(path, 'w') as f:
+            f.write('SEEDS')
+        self.assertFalse(cache.link('k', dest, verify=True))
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,71 @@
+import json
+import unittest
+
+from StringIO import StringIO
+
+from WholeGenomeAlignment.compression import (GzipMiddleware, accepts_gzip, decode_request,
+                                              encode_response, gzip_bytes, gunzip_bytes)
+
+
+def echo_app(environ, start_response):
+    size = int(environ.get('CONTENT_LENGTH') or 0)
+    body = environ['wsgi.input'].read(size) * 100
+    start_response('200 OK', [('content-type', 'application/json'),
+                              ('content-length', str(len(body)))])
+    return [body]
+
+
+def call(app, body, **environ):
+    environ.update({'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(body)),
+                    'wsgi.input': StringIO(body)})
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'], response['headers'] = status, dict(headers)
+    response['body'] = ''.join(app(environ, start_response))
+    return response
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip, deflate'))
+        self.assertTrue(accepts_gzip('deflate, *'))
+        self.assertFalse(accepts_gzip('gzip;q=0, deflate'))
+        self.assertFalse(accepts_gzip('identity'))
+        self.assertFalse(accepts_gzip(None))
+
+    def test_encode_response(self):
+        body = '{"result": [' + ', '.join(['"ACGT-ACGT"'] * 500) + ']}'
+        compressed, headers = encode_response({'HTTP_ACCEPT_ENCODING': 'gzip'}, body)
+        self.assertIn(('Content-Encoding', 'gzip'), headers)
+        self.assertTrue(len(compressed) < len(body) / 10)
+        self.assertEqual(gunzip_bytes(compressed), body)
+        self.assertEqual(encode_response({}, body), (body, []))
+        self.assertEqual(encode_response({'HTTP_ACCEPT_ENCODING': 'gzip'}, '{}'), ('{}', []))
+
+    def test_decode_request(self):
+        body = '{"method": "WholeGenomeAlignment.run_mugsy"}'
+        self.assertEqual(decode_request({'HTTP_CONTENT_ENCODING': 'gzip'}, gzip_bytes(body)), body)
+        self.assertEqual(decode_request({}, body), body)
+        with self.assertRaises(ValueError):
+            decode_request({'HTTP_CONTENT_ENCODING': 'gzip'}, body)
+        with self.assertRaises(ValueError):
+            decode_request({'HTTP_CONTENT_ENCODING': 'br'}, body)
+
+    def test_middleware(self):
+        app = GzipMiddleware(echo_app, 1024)
+        body = '{"params": ["ACGT"]}'
+        plain = call(app, body)
+        self.assertEqual(plain['body'], body * 100)
+        self.assertNotIn('Content-Encoding', plain['headers'])
+
+        zipped = call(app, gzip_bytes(body), HTTP_CONTENT_ENCODING='gzip',
+                      HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(zipped['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(int(zipped['headers']['content-length']), len(zipped['body']))
+        self.assertEqual(gunzip_bytes(zipped['body']), body * 100)
+
+        bad = call(app, body, HTTP_CONTENT_ENCODING='gzip')
+        self.assertTrue(bad['status'].startswith('500'))
+        self.assertEqual(json.loads(bad['body'])['error']['code'], -32700)
@@ -0,0 +1,31 @@
+import unittest
+
+from WholeGenomeAlignment.conditioning import Conditioner
+from WholeGenomeAlignment.coordinates import extract_regions
+
+
+class ConditioningTest(unittest.TestCase):
+
+    def setUp(self):
+        random_like = 'ACGTTGCAAGCTTCGAGATCCTGAACGTAGCT' * 20
+        self.contigs = [{'id': 'c1', 'sequence': random_like + 'N' * 150 + random_like},
+                        {'id': 'tiny', 'sequence': 'ACGT' * 20},
+                        {'id': 'c2', 'sequence': 'A' * 64 + random_like}]
+
+    def test_split_and_drop(self):
+        conditioner = Conditioner({'min_contig_length': 100, 'max_n_run': 100})
+        coord_map, records = extract_regions(self.contigs, None, conditioner)
+        records = list(records)
+        self.assertEqual([(p.contig, p.start, p.length) for p in coord_map.pieces],
+                         [('c1', 0, 640), ('c1', 790, 640), ('c2', 0, 704)])
+        self.assertEqual(coord_map.lift('r2', 5), ('c1', 795))
+        self.assertEqual(conditioner.dropped_contigs, 1)
+        self.assertEqual(records[0][1], self.contigs[0]['sequence'][:640])
+
+    def test_soft_mask(self):
+        conditioner = Conditioner({'min_contig_length': 100, 'mask_low_complexity': 1})
+        _, records = extract_regions(self.contigs[2:], None, conditioner)
+        text = list(records)[0][1]
+        self.assertEqual(text[:64], 'a' * 64)
+        self.assertEqual(text[64:], text[64:].upper())
+        self.assertEqual(conditioner.masked_bp, 64)
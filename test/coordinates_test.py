@@ -0,0 +1,99 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.coordinates import CoordinateMap, extract_regions, lift_backbone, lift_maf, lift_xmfa
+
+
+class CoordinatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.contigs = [{'id': 'chr', 'sequence': 'A' * 100},
+                        {'id': 'plasmid', 'sequence': 'C' * 50}]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_extract_regions(self):
+        coord_map, records = extract_regions(self.contigs, [
+            {'contig_id': 'plasmid'},
+            {'contig_id': 'chr', 'start': 11, 'end': 20},
+            {'contig_id': 'chr', 'start': 15, 'end': 30}])
+        records = list(records)
+        self.assertEqual([(r, len(s)) for r, s in records], [('r1', 20), ('r2', 50)])
+        self.assertEqual(coord_map.lift('r1', 0), ('chr', 10))
+        self.assertEqual(coord_map.lift_concatenated(20), 100)
+        self.assertRaises(ValueError, extract_regions, self.contigs,
+                          [{'contig_id': 'missing'}])
+
+    def test_lift_maf(self):
+        coord_map, records = extract_regions(self.contigs, [
+            {'contig_id': 'plasmid', 'start': 21, 'end': 40}])
+        list(records)
+        maf = self.write('out.maf', 'a score=1\ns 1.r1 2 5 + 20 CCCCC\n'
+                                    's 2.x 0 5 - 9 CCCCC\n')
+        lift_maf(maf, {'1': coord_map})
+        with open(maf) as f:
+            self.assertEqual(f.read().split('\n')[1], 's 1.plasmid 22 5 + 50 CCCCC')
+
+    def test_lift_xmfa(self):
+        coord_map, records = extract_regions(self.contigs, [
+            {'contig_id': 'plasmid', 'start': 21, 'end': 40}])
+        list(records)
+        xmfa = self.write('out.xmfa', '#FormatVersion Mauve1\n'
+                                      '> 1:3-7 - /tmp/1.fa\nCCCCC\n=\n')
+        lift_xmfa(xmfa, {'1': coord_map}, {'1': '1'})
+        with open(xmfa) as f:
+            self.assertEqual(f.read().split('\n')[1], '> 1:123-127 - /tmp/1.fa')
+
+    def test_lift_xmfa_row_across_cut(self):
+        coord_map, records = extract_regions(self.contigs, [
+            {'contig_id': 'chr', 'start': 11, 'end': 20},
+            {'contig_id': 'chr', 'start': 41, 'end': 50}])
+        list(records)
+        # written positions 6-15 run from piece r1 (1-10) into r2 (11-20)
+        xmfa = self.write('out.xmfa', '#FormatVersion Mauve1\n'
+                                      '> 1:6-15 + /tmp/1.fa\nAAA-AAAAAAA\n'
+                                      '> 2:1-11 - /tmp/2.fa\nCCCCCCCCCCC\n=\n')
+        cuts = lift_xmfa(xmfa, {'1': coord_map}, {'1': '1', '2': '2'})
+        with open(xmfa) as f:
+            self.assertEqual(f.read().split('\n')[1:], [
+                '> 1:16-20 + /tmp/1.fa', 'AAA-AA',
+                '> 2:6-11 - /tmp/2.fa', 'CCCCCC', '=',
+                '> 1:41-45 + /tmp/1.fa', 'AAAAA',
+                '> 2:1-5 - /tmp/2.fa', 'CCCCC', '=', ''])
+        self.assertEqual(cuts, {('1', 11): {'1': (10, 11), '2': (6, 5)}})
+
+        backbone = self.write('out.xmfa.backbone', 'seq0_leftend\tseq0_rightend\tseq1_leftend\tseq1_rightend\n'
+                                                   '6\t15\t-1\t-11\n')
+        lift_backbone(backbone, {'1': coord_map}, {'1': '1', '2': '2'}, cuts)
+        with open(backbone) as f:
+            self.assertEqual(f.read().split('\n')[1:3], ['16\t20\t-6\t-11', '41\t45\t-1\t-5'])
+
+    def test_lift_span(self):
+        coord_map, records = extract_regions(self.contigs, [
+            {'contig_id': 'chr', 'start': 11, 'end': 20},
+            {'contig_id': 'chr', 'start': 41, 'end': 50}])
+        list(records)
+        self.assertEqual(coord_map.lift_span(10, 15), (40, 45))
+        self.assertRaises(ValueError, coord_map.lift_span, 5, 15)
+
+    def test_json_round_trip(self):
+        coord_map, records = extract_regions(self.contigs, [
+            {'contig_id': 'chr', 'start': 11, 'end': 20},
+            {'contig_id': 'chr', 'start': 41, 'end': 50}])
+        list(records)
+        restored = CoordinateMap.from_json(json.loads(json.dumps(coord_map.to_json())))
+        self.assertEqual(len(restored), len(coord_map))
+        self.assertEqual(restored.lift('r2', 3), coord_map.lift('r2', 3))
+        self.assertEqual(restored.lift_span(10, 15), (40, 45))
+        self.assertEqual(restored.original.starts, coord_map.original.starts)
@@ -0,0 +1,40 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.alignment_io import read_maf
+from WholeGenomeAlignment.core_genome import extract_core
+
+
+class CoreGenomeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.maf = os.path.join(self.tmp, 'out.maf')
+        with open(self.maf, 'w') as f:
+            f.write('\n'.join([
+                'a score=1',
+                's 1.chr 0 8 + 20 ACGT-ACGT',
+                's 2.chr 0 9 + 12 ACGTTACGT',
+                '',
+                'a score=2',
+                's 1.chr 10 4 + 20 GGCC',
+                '']))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_extract_core(self):
+        extractor, accessory_bp = extract_core(read_maf(self.maf), ['1', '2'], self.tmp)
+        self.assertEqual((extractor.core_columns, extractor.core_blocks), (8, 2))
+        with open(extractor.fasta_file) as f:
+            self.assertEqual(f.read(), '>1\nACGTACGT\n>2\nACGTACGT\n')
+        with open(extractor.tsv_file) as f:
+            lines = f.read().split('\n')[1:-1]
+        self.assertEqual(lines, ['1\tchr\t9\t10\tunaligned',
+                                 '1\tchr\t11\t14\taligned',
+                                 '1\tchr\t15\t20\tunaligned',
+                                 '2\tchr\t5\t5\taligned',
+                                 '2\tchr\t10\t12\tunaligned'])
+        self.assertEqual(accessory_bp, {'1': 12, '2': 4})
@@ -0,0 +1,61 @@
+import unittest
+
+from WholeGenomeAlignment.alignment_merge import block_of
+from WholeGenomeAlignment.dedup import GenomeDeduplicator, contigset_md5, expand_rows, sequence_md5
+from WholeGenomeAlignment.region_query import row_location
+
+
+class DedupTest(unittest.TestCase):
+
+    def test_contigset_md5_ignores_order_and_case(self):
+        a = [{'id': 'x', 'sequence': 'ACGT'}, {'id': 'y', 'sequence': 'GG'}]
+        b = [{'id': 'y2', 'sequence': 'gg'}, {'id': 'x2', 'sequence': 'ACGT'}]
+        self.assertEqual(contigset_md5(a), contigset_md5(b))
+        self.assertNotEqual(contigset_md5(a), contigset_md5(a, [{'contig_id': 'x'}]))
+
+    def test_duplicates_are_copied(self):
+        dedup = GenomeDeduplicator()
+        contigs = [{'id': 'x', 'sequence': 'ACGT'}]
+        self.assertIsNone(dedup.check_ref(0, '1/2/3'))
+        self.assertEqual(dedup.check_ref(1, '1/2/3'), 0)
+        self.assertIsNone(dedup.check_sequence(0, contigs))
+        self.assertIsNone(dedup.check_ref(2, '1/5/1'))
+        self.assertEqual(dedup.check_sequence(2, contigs), 0)
+        key_of = {0: '1', 1: '2', 2: '3'}
+        self.assertEqual(dedup.copies(key_of), {'1': ['2', '3']})
+
+        rows = expand_rows([{'id': '1:1-4', 'sequence': 'AC-GT'},
+                            {'id': '4:1-4', 'sequence': 'ACG-T'}], dedup.copies(key_of))
+        self.assertEqual([r['id'] for r in rows], ['1:1-4', '2:1-4', '3:1-4', '4:1-4'])
+        self.assertEqual(rows[2]['sequence'], 'AC-GT')
+
+    def test_known_sequence_md5s(self):
+        # a staged input is checked by the md5s of its contigs, with its regions
+        dedup = GenomeDeduplicator()
+        contigs = [{'id': 'x', 'sequence': 'ACGT'}]
+        regions = [{'contig_id': 'x', 'start': 1, 'end': 2}]
+        self.assertIsNone(dedup.check_sequence(0, contigs, regions))
+        self.assertIsNone(dedup.check_sequence_md5s(1, [sequence_md5('ACGT')]))
+        self.assertEqual(dedup.check_sequence_md5s(2, [sequence_md5('ACGT')], regions), 0)
+
+    def test_ref_of_a_sequence_duplicate(self):
+        # ContigSet X, an identical ContigSet Y, then a Genome on Y
+        dedup = GenomeDeduplicator()
+        contigs = [{'id': 'x', 'sequence': 'ACGT'}]
+        self.assertIsNone(dedup.check_ref(0, '1/1/1'))
+        self.assertIsNone(dedup.check_sequence(0, contigs))
+        self.assertIsNone(dedup.check_ref(1, '1/2/1'))
+        self.assertEqual(dedup.check_sequence(1, contigs), 0)
+        self.assertEqual(dedup.check_ref(2, '1/2/1'), 0)
+        key_of = {0: '1', 1: '2', 2: '3'}
+        self.assertEqual(dedup.copies(key_of), {'1': ['2', '3']})
+        rows = expand_rows([{'id': '1:1-4', 'sequence': 'ACGT'}], dedup.copies(key_of))
+        self.assertEqual([r['id'] for r in rows], ['1:1-4', '2:1-4', '3:1-4'])
+
+    def test_copies_keep_the_strand(self):
+        row = {'id': '1.c:11-12', 'sequence': 'AC', 'description': '1.c:11-12 - 1.fa block=4'}
+        primary, copy = expand_rows([row], {'1': ['2']})
+        self.assertEqual(copy['description'], '2.c:11-12 - 1.fa block=4')
+        self.assertEqual(row_location(copy), ('2', 'c', 10, 12, '-'))
+        self.assertEqual(row_location(copy)[1:], row_location(primary)[1:])
+        self.assertEqual(block_of(copy), 4)
@@ -0,0 +1,38 @@
+import unittest
+import math
+
+import numpy as np
+
+from WholeGenomeAlignment.alignment_io import AlignedRow, AlignmentBlock
+from WholeGenomeAlignment.distance import DistanceCounter, neighbor_joining
+
+
+def block(*texts):
+    rows = [AlignedRow(str(i + 1), None, 0, len(t.replace('-', '')), '+', None, t)
+            for i, t in enumerate(texts) if t is not None]
+    return AlignmentBlock(rows, 0, 0)
+
+
+class DistanceTest(unittest.TestCase):
+
+    def test_counts(self):
+        counter = DistanceCounter(['1', '2', '3'], chunk_columns=5)
+        counter.add_block(block('ACGTACGTAC', 'ACGTTCGTAA', 'AC-TACGNAC'))
+        counter.add_block(block('GGGG', None, 'GGGC'))
+        d = counter.distances('p')
+        self.assertAlmostEqual(d[0, 1], 0.2)
+        # 8 columns with a base in both, none different; then 4 with one different
+        self.assertAlmostEqual(d[0, 2], 1 / 12.0)
+        self.assertAlmostEqual(d[1, 2], 2 / 8.0)
+        jc = counter.distances('jc')
+        self.assertAlmostEqual(jc[0, 1], -0.75 * math.log(1 - 0.2 / 0.75))
+        self.assertTrue((np.diag(jc) == 0).all())
+
+    def test_neighbor_joining(self):
+        d = np.array([[0, 5, 9, 9, 8],
+                      [5, 0, 10, 10, 9],
+                      [9, 10, 0, 8, 7],
+                      [9, 10, 8, 0, 3],
+                      [8, 9, 7, 3, 0]], dtype=float)
+        tree = neighbor_joining(d, ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(tree, '((c:4,(a:2,b:3):3):1,(d:2,e:1):1);')
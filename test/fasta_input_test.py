@@ -0,0 +1,83 @@
+import unittest
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.fasta_input import stage_fasta, user_roots
+
+
+class FastaInputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.staging = os.path.join(self.tmp, 'staging')
+        os.makedirs(self.staging)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text, compress=False):
+        path = os.path.join(self.staging, name)
+        with (gzip.open(path, 'wb') if compress else open(path, 'w')) as f:
+            f.write(text)
+        return path
+
+    def test_stage(self):
+        text = '>c1 first contig\nACGTAC\nGT\n>c2\nNNAC\n'
+        for name, compress in (('a.fa', False), ('b.fa.gz', True)):
+            dest = os.path.join(self.tmp, name + '.staged')
+            records = stage_fasta(self.write(name, text, compress), dest, [self.staging])
+            self.assertEqual(records, [['c1', 8, hashlib.md5('ACGTACGT').hexdigest()],
+                                       ['c2', 4, hashlib.md5('NNAC').hexdigest()]])
+            with open(dest) as f:
+                self.assertEqual(f.read(), text)
+            self.assertFalse(os.path.exists(dest + '.fai'))
+
+    def test_invalid(self):
+        dest = os.path.join(self.tmp, 'out.fa')
+        for text, message in (('ACGT\n', 'sequence before the first header'),
+                              ('>a\nAC\n>a\nGT\n', 'duplicate record id a'),
+                              ('>a\nAC-GT\n', 'invalid sequence characters'),
+                              ('>a\n>b\nAC\n', 'record a has no sequence'),
+                              ('', 'no FASTA records')):
+            with self.assertRaises(ValueError) as cm:
+                stage_fasta(self.write('bad.fa', text), dest, [self.staging])
+            self.assertIn(message, str(cm.exception))
+        self.assertFalse(os.path.exists(dest))
+
+    def test_roots(self):
+        outside = os.path.join(self.tmp, 'outside.fa')
+        with open(outside, 'w') as f:
+            f.write('>a\nACGT\n')
+        os.symlink(outside, os.path.join(self.staging, 'link.fa'))
+        for path in (outside, os.path.join(self.staging, 'link.fa'),
+                     os.path.join(self.staging, '..', 'outside.fa')):
+            with self.assertRaises(ValueError) as cm:
+                stage_fasta(path, os.path.join(self.tmp, 'out.fa'), [self.staging])
+            self.assertIn('not under an allowed input directory', str(cm.exception))
+        with self.assertRaises(ValueError) as cm:
+            stage_fasta(os.path.join(self.staging, 'missing.fa'), os.path.join(self.tmp, 'out.fa'),
+                        [self.staging])
+        self.assertIn('does not exist', str(cm.exception))
+
+    def test_user_roots(self):
+        roots = user_roots([self.staging], 'alice')
+        self.assertEqual(roots, [os.path.join(self.staging, 'alice')])
+        os.makedirs(roots[0])
+        os.makedirs(os.path.join(self.staging, 'bob'))
+        scratch = os.path.join(self.tmp, 'scratch')
+        os.makedirs(scratch)
+        text = '>a\nACGT\n'
+        own = self.write(os.path.join('alice', 'a.fa'), text)
+        dest = os.path.join(self.tmp, 'out.fa')
+        self.assertEqual(stage_fasta(own, dest, roots)[0][:2], ['a', 4])
+        for path in (self.write(os.path.join('bob', 'b.fa'), text),
+                     self.write(os.path.join('..', 'scratch', 'c.fa'), text)):
+            with self.assertRaises(ValueError) as cm:
+                stage_fasta(path, dest, roots)
+            self.assertIn('not under an allowed input directory', str(cm.exception))
+        for user_id in (None, '', '..', 'alice/../bob'):
+            with self.assertRaises(ValueError):
+                user_roots([self.staging], user_id)
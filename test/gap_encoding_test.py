@@ -0,0 +1,34 @@
+import unittest
+import random
+
+from WholeGenomeAlignment.gap_encoding import (encode_row, decode_row, decode_columns,
+                                               encode_contigs, decode_contigs)
+
+
+class GapEncodingTest(unittest.TestCase):
+
+    def test_encode_row(self):
+        residues, runs = encode_row('--AC---GT-')
+        self.assertEqual(residues, 'ACGT')
+        self.assertEqual(runs.tolist(), [[0, 2], [2, 3], [4, 1]])
+        self.assertEqual(decode_row(residues, runs), '--AC---GT-')
+        self.assertEqual(decode_row(*encode_row('ACGT')), 'ACGT')
+        self.assertEqual(decode_row(*encode_row('----')), '----')
+
+    def test_decode_columns(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            text = ''.join(rng.choice('AC---') for _ in range(rng.randint(1, 40)))
+            residues, runs = encode_row(text)
+            self.assertEqual(decode_row(residues, runs), text)
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, len(text))
+            self.assertEqual(decode_columns(residues, runs, start, end), text[start:end])
+
+    def test_contigs(self):
+        contigs = [{'id': '1', 'sequence': 'A--C'}, {'id': '2', 'sequence': 'AG-C'}]
+        encoded = encode_contigs(contigs)
+        self.assertEqual(encoded[0]['sequence'], 'AC')
+        self.assertEqual(encoded[0]['gaps'], [1, 2])
+        self.assertEqual(decode_contigs(encoded), contigs)
+        self.assertEqual(decode_contigs(contigs), contigs)
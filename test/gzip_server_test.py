@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from StringIO import StringIO
+
+from WholeGenomeAlignment.compression import GzipMiddleware, gzip_bytes, gunzip_bytes
+
+try:
+    from WholeGenomeAlignment import gzip_server
+except ImportError:
+    gzip_server = None
+
+
+@unittest.skipUnless(gzip_server, 'the generated server cannot be imported here')
+class GzipServerTest(unittest.TestCase):
+    """The middleware around the real JSON-RPC application."""
+
+    def call(self, app, body, **environ):
+        environ.update({'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(body)),
+                        'wsgi.input': StringIO(body), 'REMOTE_ADDR': '127.0.0.1'})
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, dict(headers)
+        response['body'] = ''.join(app(environ, start_response))
+        return response
+
+    def test_installed(self):
+        self.assertIs(gzip_server.application.app, gzip_server.server.application)
+
+    def test_gzip_round_trip(self):
+        # min_bytes=0 so the server's small error responses are compressed too
+        app = GzipMiddleware(gzip_server.server.application, 0)
+        request = json.dumps({'method': 'WholeGenomeAlignment.no_such_method',
+                              'params': [{}], 'version': '1.1', 'id': '1'})
+        response = self.call(app, gzip_bytes(request), HTTP_CONTENT_ENCODING='gzip',
+                             HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        reply = json.loads(gunzip_bytes(response['body']))
+        # The inflated request reached the server's dispatcher, not its parser
+        self.assertEqual(reply['id'], '1')
+        self.assertNotEqual(reply['error']['code'], -32700)
+
+        response = self.call(app, gzip_bytes('not json'), HTTP_CONTENT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response['headers'])
+        self.assertEqual(json.loads(response['body'])['error']['code'], -32700)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+Load test for the WholeGenomeAlignment JSON-RPC server.
+
+Runs the server against local stand-ins (see standin.py and
+stub_aligner.py), with token validation stubbed, and drives it with
+concurrent clients calling a weighted mix of methods.  Each server
+configuration given is started in turn, loaded for the same duration and
+stopped, and throughput and latency percentiles per method are printed for
+all of them together:
+
+    PYTHONPATH=lib python test/loadtest/loadtest.py \\
+        --server wsgiref --server uwsgi:processes=5,threads=5 \\
+        --server uwsgi:processes=2,gevent=100 \\
+        --clients 20 --duration 60 \\
+        --mix run_mugsy=1,run_mugsy_async=2,run_mugsy_check=4,get_alignment_region=8
+
+wsgiref is the server's own start_server(newprocess=True), one request at a
+time.  uwsgi configurations take processes, threads and gevent (async cores,
+which also sets gevent_monkeypatch_all) and need uwsgi on the PATH.
+*_check calls poll job ids returned by earlier *_async calls in the run.
+"""
+from __future__ import absolute_import
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib2
+
+from distutils.spawn import find_executable
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(HERE)), 'lib'))
+
+from loadtest.standin import WorkspaceStandIn, serve, WORKSPACE_NAME
+
+
+TOOLS = ['nucmer', 'delta-filter', 'delta2maf', 'mugsyWGA', 'maf2fasta.pl']
+SERVICE = 'WholeGenomeAlignment'
+SETUP_ALIGNMENT = 'loadtest_alignment'
+DEFAULT_MIX = 'run_mugsy=1,run_mugsy_async=2,run_mugsy_check=4,get_alignment_region=8'
+
+
+def parse_mix(text):
+    mix = []
+    for item in text.split(','):
+        method, _, weight = item.partition('=')
+        mix.append((method.strip(), float(weight or 1)))
+    return mix
+
+
+def parse_server(text):
+    """('wsgiref', {}) or ('uwsgi', {'processes': 5, ...}) from a --server value."""
+    kind, _, options = text.partition(':')
+    if kind not in ('wsgiref', 'uwsgi'):
+        raise ValueError('Unknown server kind {}'.format(kind))
+    settings = {}
+    for item in filter(None, options.split(',')):
+        name, _, value = item.partition('=')
+        if name not in ('processes', 'threads', 'gevent'):
+            raise ValueError('Unknown uwsgi setting {}'.format(name))
+        settings[name] = int(value)
+    return kind, settings
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class Environment(object):
+    """Scratch, stub tools and deploy.cfg shared by every server configuration."""
+
+    def __init__(self, standin_url, align_seconds):
+        self.root = tempfile.mkdtemp(prefix='wga_loadtest.')
+        self.bin_dir = os.path.join(self.root, 'bin')
+        os.makedirs(self.bin_dir)
+        for tool in TOOLS:
+            os.symlink(os.path.join(HERE, 'stub_aligner.py'), os.path.join(self.bin_dir, tool))
+        self.standin_url = standin_url
+        self.env = dict(os.environ)
+        self.env['PATH'] = self.bin_dir + os.pathsep + self.env.get('PATH', '')
+        self.env['LOADTEST_ALIGN_SECONDS'] = str(align_seconds)
+        self.env['PYTHONPATH'] = os.pathsep.join(sys.path[:2] + [self.env.get('PYTHONPATH', '')])
+
+    def write_config(self, name, gevent=False):
+        scratch = os.path.join(self.root, name, 'scratch')
+        os.makedirs(scratch)
+        config_file = os.path.join(self.root, name, 'deploy.cfg')
+        with open(config_file, 'w') as f:
+            f.write('[{}]\n'.format(SERVICE))
+            f.write('workspace-url = {}\n'.format(self.standin_url))
+            f.write('job-service-url = {}\n'.format(self.standin_url))
+            f.write('scratch = {}\n'.format(scratch))
+            f.write('mugsy-mapping-processes = 1\n')
+            if gevent:
+                f.write('gevent_monkeypatch_all = 1\n')
+        return config_file
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def start_wsgiref(environment, name):
+    """The server's own start_server(newprocess=True); returns (url, stop)."""
+    os.environ.update(environment.env)
+    os.environ['KB_DEPLOYMENT_CONFIG'] = environment.write_config(name)
+    from loadtest import server_entry
+    server = sys.modules['WholeGenomeAlignment.WholeGenomeAlignmentServer']
+    port = server.start_server(newprocess=True)
+    return 'http://localhost:{}'.format(port), server.stop_server
+
+
+def start_uwsgi(environment, name, settings):
+    uwsgi = find_executable('uwsgi')
+    if uwsgi is None:
+        raise ValueError('uwsgi is not on the PATH')
+    env = dict(environment.env)
+    env['KB_DEPLOYMENT_CONFIG'] = environment.write_config(name, 'gevent' in settings)
+    port = free_port()
+    cmd = [uwsgi, '--master', '--http', '127.0.0.1:{}'.format(port),
+           '--wsgi-file', os.path.join(HERE, 'server_entry.py'),
+           '--processes', str(settings.get('processes', 1)), '--disable-logging']
+    if settings.get('threads'):
+        cmd += ['--threads', str(settings['threads'])]
+    if settings.get('gevent'):
+        cmd += ['--gevent', str(settings['gevent'])]
+    log = open(os.path.join(environment.root, name, 'uwsgi.log'), 'w')
+    p = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = 'http://127.0.0.1:{}'.format(port)
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            break
+        except socket.error:
+            if p.poll() is not None or time.time() > deadline:
+                raise ValueError('uwsgi did not start, see {}'.format(log.name))
+            time.sleep(0.2)
+
+    def stop():
+        p.terminate()
+        p.wait()
+        log.close()
+    return url, stop
+
+
+class Client(object):
+
+    def __init__(self, url, token='loadtest-token'):
+        self.url = url
+        self.token = token
+        self._ids = itertools.count()
+
+    def call(self, method, params):
+        body = json.dumps({'version': '1.1', 'method': '{}.{}'.format(SERVICE, method),
+                           'params': [params], 'id': str(next(self._ids))})
+        req = urllib2.Request(self.url, body, {'Authorization': self.token,
+                                               'Content-Type': 'application/json'})
+        try:
+            resp = json.loads(urllib2.urlopen(req, timeout=600).read())
+        except urllib2.HTTPError as e:
+            resp = json.loads(e.read())
+        if resp.get('error'):
+            raise ValueError(resp['error'].get('message') or resp['error'])
+        return resp['result'][0]
+
+
+class Workload(object):
+    """Parameters for each method, and the job ids *_check calls poll."""
+
+    def __init__(self, genome_refs, seed=0):
+        self.genome_refs = genome_refs
+        self.job_ids = []
+        self.rng = random.Random(seed)
+        self._names = itertools.count()
+        self._lock = threading.Lock()
+
+    def mugsy_params(self):
+        with self._lock:
+            refs = self.rng.sample(self.genome_refs, self.rng.randint(2, min(3, len(self.genome_refs))))
+            name = 'aln_{}'.format(next(self._names))
+        return {'workspace_name': WORKSPACE_NAME, 'input_genome_refs': refs,
+                'output_alignment_name': name}
+
+    def params_for(self, method):
+        """(method actually called, params); checks fall back to async before any job exists."""
+        if method.endswith('_check'):
+            with self._lock:
+                if self.job_ids:
+                    return method, self.rng.choice(self.job_ids)
+            method = method[:-len('_check')] + '_async'
+        if method.startswith('run_mugsy'):
+            return method, self.mugsy_params()
+        if method.startswith('get_alignment_region'):
+            with self._lock:
+                start = self.rng.randint(1, 1500)
+            return method, {'alignment_ref': '{}/{}'.format(WORKSPACE_NAME, SETUP_ALIGNMENT),
+                            'genome': '1', 'start': start, 'end': start + 400}
+        raise ValueError('No parameters for method {}'.format(method))
+
+    def record(self, method, result):
+        if method.endswith('_async'):
+            with self._lock:
+                self.job_ids.append(result)
+
+
+def drive(client, workload, mix, clients, duration):
+    """Run clients threads for duration seconds; returns [(method, seconds, error)]."""
+    methods = [m for m, _ in mix]
+    weights = np.array([w for _, w in mix]) / sum(w for _, w in mix)
+    samples = []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker(seed):
+        rng = np.random.RandomState(seed)
+        while time.time() < deadline:
+            method, params = workload.params_for(methods[rng.choice(len(methods), p=weights)])
+            start = time.time()
+            error = None
+            try:
+                workload.record(method, client.call(method, params))
+            except Exception as e:
+                error = str(e)
+            with lock:
+                samples.append((method, time.time() - start, error))
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+
+def summarize(samples, elapsed):
+    """method -> (count, errors, requests/s, p50, p95, p99 ms), plus 'all'."""
+    rows = {}
+    by_method = {}
+    for method, seconds, error in samples:
+        by_method.setdefault(method, []).append((seconds, error))
+    by_method['all'] = [(seconds, error) for _, seconds, error in samples]
+    for method, values in by_method.items():
+        latencies = np.array([s for s, _ in values]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        rows[method] = (len(values), sum(1 for _, e in values if e),
+                        len(values) / elapsed, p50, p95, p99)
+    return rows
+
+
+def print_table(results, out=sys.stdout):
+    out.write('{:<32} {:<28} {:>7} {:>6} {:>8} {:>9} {:>9} {:>9}\n'.format(
+        'server', 'method', 'count', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, rows in results:
+        for method in sorted(rows, key=lambda m: (m == 'all', m)):
+            out.write('{:<32} {:<28} {:>7} {:>6} {:>8.2f} {:>9.1f} {:>9.1f} {:>9.1f}\n'.format(
+                name, method, *rows[method]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--server', action='append',
+                        help='wsgiref or uwsgi:processes=N,threads=N,gevent=N (repeatable)')
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--genomes', type=int, default=6)
+    parser.add_argument('--genome-length', type=int, default=20000)
+    parser.add_argument('--align-seconds', type=float, default=0.5,
+                        help='simulated aligner time per run_mugsy')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+    servers = [parse_server(s) for s in args.server or ['wsgiref']]
+    if sum(1 for kind, _ in servers if kind == 'wsgiref') > 1:
+        parser.error('wsgiref can only be given once per run')
+    mix = parse_mix(args.mix)
+
+    standin = WorkspaceStandIn()
+    genome_refs = standin.add_genomes(args.genomes, args.genome_length)
+    standin_server, standin_url = serve(standin)
+    environment = Environment(standin_url, args.align_seconds)
+    results = []
+    try:
+        for n, (kind, settings) in enumerate(servers):
+            name = kind + ''.join(',{}={}'.format(k, v) for k, v in sorted(settings.items()))
+            if kind == 'wsgiref':
+                url, stop = start_wsgiref(environment, 'server{}'.format(n))
+            else:
+                url, stop = start_uwsgi(environment, 'server{}'.format(n), settings)
+            try:
+                client = Client(url)
+                workload = Workload(genome_refs)
+                setup = workload.mugsy_params()
+                setup['output_alignment_name'] = SETUP_ALIGNMENT
+                client.call('run_mugsy', setup)
+                start = time.time()
+                samples = drive(client, workload, mix, args.clients, args.duration)
+                rows = summarize(samples, time.time() - start)
+                errors = [e for _, _, e in samples if e]
+                if errors:
+                    sys.stderr.write('{}: first error: {}\n'.format(name, errors[0]))
+            finally:
+                stop()
+            results.append((name, rows))
+    finally:
+        standin_server.shutdown()
+        environment.cleanup()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([{'server': name, 'methods': dict(
+                (method, dict(zip(['count', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'], row)))
+                for method, row in rows.items())} for name, rows in results], f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
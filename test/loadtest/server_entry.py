@@ -0,0 +1,18 @@
+"""
+uwsgi entry point for load tests: the server application with token
+validation stubbed out, so no auth service is needed.
+
+    uwsgi --http :5000 --wsgi-file test/loadtest/server_entry.py
+"""
+from WholeGenomeAlignment.WholeGenomeAlignmentServer import application
+
+
+LOADTEST_USER = 'loadtest'
+
+
+def stub_auth(app):
+    app.auth_client.validate_token = lambda token: (LOADTEST_USER, None, None)
+    return app
+
+
+application = stub_auth(application)
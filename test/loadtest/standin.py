@@ -0,0 +1,218 @@
+"""
+Offline stand-ins for the services WholeGenomeAlignment talks to.
+
+One JSON-RPC 1.1 WSGI application answers both the Workspace calls the
+Impl makes (get_objects, get_object_subset, get_object_info_new,
+save_objects) from an
+in-memory store seeded with synthetic genomes, and the KBaseJobService
+calls the server makes for *_async / *_check methods.  Async jobs are not
+executed: they are recorded and reported finished with an empty result, so
+load tests measure the server's own overhead for those calls.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+
+WORKSPACE_ID = 1
+WORKSPACE_NAME = 'loadtest'
+
+
+def mutate(seq, rate, rng):
+    return ''.join(rng.choice('ACGT') if rng.random() < rate else c for c in seq)
+
+
+def select(data, path):
+    """Copy of the parts of data on path, a list of keys where '[*]' is every element."""
+    if not path:
+        return data
+    key, rest = path[0], path[1:]
+    if key == '[*]':
+        return [select(item, rest) for item in data] if isinstance(data, list) else None
+    if not isinstance(data, dict) or key not in data:
+        return None
+    return {key: select(data[key], rest)}
+
+
+def merge(a, b):
+    if a is None:
+        return b
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key, value in b.items():
+            a[key] = merge(a.get(key), value)
+        return a
+    if isinstance(a, list) and isinstance(b, list):
+        return [merge(x, y) for x, y in zip(a, b)]
+    return b
+
+
+def included(data, paths):
+    """The subset of data get_object_subset returns for the included paths."""
+    result = {}
+    for path in paths:
+        result = merge(result, select(data, [key for key in path.split('/') if key]))
+    return result or {}
+
+
+class WorkspaceStandIn(object):
+
+    def __init__(self):
+        self.objects = []
+        self.names = {}
+        self.jobs = {}
+        self.calls = {}
+        self.bytes_out = {}
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+
+    # -- store --
+
+    def _info(self, objid, name, type_name, version, data):
+        return [objid, name, type_name, time.strftime('%Y-%m-%dT%H:%M:%S+0000'), version,
+                'loadtest', WORKSPACE_ID, WORKSPACE_NAME, '', len(json.dumps(data)), {}]
+
+    def save(self, name, type_name, data, meta=None):
+        with self._lock:
+            if name in self.names:
+                objid = self.names[name]
+                version = len(self.objects[objid - 1]) + 1
+            else:
+                self.objects.append([])
+                objid = len(self.objects)
+                self.names[name] = objid
+                version = 1
+            info = self._info(objid, name, type_name, version, data)
+            info[10] = meta or {}
+            self.objects[objid - 1].append({'data': data, 'info': info})
+        return info
+
+    def resolve(self, ref):
+        parts = str(ref).split('/')
+        if len(parts) < 2:
+            raise ValueError('Invalid object reference {}'.format(ref))
+        objid = int(parts[1]) if parts[1].isdigit() else self.names.get(parts[1])
+        if objid is None or objid > len(self.objects):
+            raise ValueError('No object with reference {}'.format(ref))
+        versions = self.objects[objid - 1]
+        version = int(parts[2]) if len(parts) > 2 else len(versions)
+        return versions[version - 1]
+
+    def add_genomes(self, count, length=20000, contigs=2, divergence=0.02, seed=1, features=0):
+        """
+        Save count related Genome/ContigSet pairs, each Genome with that many
+        synthetic features; returns the Genome refs.
+        """
+        rng = random.Random(seed)
+        base = ''.join(rng.choice('ACGT') for _ in range(length))
+        refs = []
+        for i in range(count):
+            seq = mutate(base, divergence, rng) if i else base
+            step = length // contigs
+            contig_list = [{'id': 'contig_{}'.format(c + 1), 'length': step,
+                            'sequence': seq[c * step:(c + 1) * step]} for c in range(contigs)]
+            cs_info = self.save('contigset_{}'.format(i + 1), 'KBaseGenomes.ContigSet-2.0',
+                                {'id': 'contigset_{}'.format(i + 1), 'contigs': contig_list})
+            cs_ref = '{}/{}/{}'.format(cs_info[6], cs_info[0], cs_info[4])
+            feature_list = [{'id': 'gene_{}'.format(f + 1), 'type': 'CDS',
+                             'location': [['contig_1', f * 90 + 1, '+', 90]],
+                             'function': 'hypothetical protein',
+                             'protein_translation': 'M' + 'A' * 29} for f in range(features)]
+            g_info = self.save('genome_{}'.format(i + 1), 'KBaseGenomes.Genome-8.0',
+                               {'scientific_name': 'Synthetic genome {}'.format(i + 1),
+                                'contigset_ref': cs_ref, 'features': feature_list})
+            refs.append('{}/{}/{}'.format(g_info[6], g_info[0], g_info[4]))
+        return refs
+
+    # -- JSON-RPC methods; each returns the result list --
+
+    def get_objects(self, object_ids):
+        return [[self.resolve(o['ref']) for o in object_ids]]
+
+    def get_object_subset(self, sub_object_ids):
+        objects = []
+        for o in sub_object_ids:
+            obj = self.resolve(o['ref'])
+            if 'included' in o:
+                obj = {'data': included(obj['data'], o['included']), 'info': obj['info']}
+            objects.append(obj)
+        return [objects]
+
+    def get_object_info_new(self, params):
+        return [[self.resolve(o['ref'])['info'] for o in params['objects']]]
+
+    def save_objects(self, params):
+        return [[self.save(o['name'], o['type'], o['data'], o.get('meta'))
+                 for o in params['objects']]]
+
+    def get_workspace_info(self, params):
+        return [[WORKSPACE_ID, WORKSPACE_NAME, 'loadtest', time.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                 len(self.objects), 'a', 'n', 'unlocked', {}]]
+
+    def run_job(self, params):
+        job_id = str(next(self._job_ids))
+        self.jobs[job_id] = params
+        return [job_id]
+
+    def check_job(self, job_id):
+        if job_id not in self.jobs:
+            raise ValueError('No job {}'.format(job_id))
+        return [{'job_id': job_id, 'finished': 1, 'job_state': 'completed',
+                 'result': [{}], 'error': None}]
+
+    METHODS = {
+        'Workspace.get_objects': 'get_objects',
+        'Workspace.get_object_subset': 'get_object_subset',
+        'Workspace.get_object_info_new': 'get_object_info_new',
+        'Workspace.save_objects': 'save_objects',
+        'Workspace.get_workspace_info': 'get_workspace_info',
+        'KBaseJobService.run_job': 'run_job',
+        'KBaseJobService.check_job': 'check_job'
+    }
+
+    def __call__(self, environ, start_response):
+        size = int(environ.get('CONTENT_LENGTH') or 0)
+        req = json.loads(environ['wsgi.input'].read(size))
+        method = req.get('method')
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        try:
+            if method not in self.METHODS:
+                raise ValueError('Unknown method {}'.format(method))
+            result = getattr(self, self.METHODS[method])(*req['params'])
+            body = json.dumps({'version': '1.1', 'id': req.get('id'), 'result': result})
+            status = '200 OK'
+        except Exception as e:
+            body = json.dumps({'version': '1.1', 'id': req.get('id'),
+                               'error': {'name': 'JSONRPCError', 'code': -32500,
+                                         'message': str(e), 'error': str(e)}})
+            status = '500 Internal Server Error'
+        with self._lock:
+            self.bytes_out[method] = self.bytes_out.get(method, 0) + len(body)
+        start_response(status, [('content-type', 'application/json'),
+                                ('content-length', str(len(body)))])
+        return [body]
+
+
+class _ThreadingServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(app, host='127.0.0.1', port=0):
+    """Serve app from a background thread; returns (server, url)."""
+    server = make_server(host, port, app, server_class=_ThreadingServer,
+                         handler_class=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://{}:{}/'.format(host, server.server_port)
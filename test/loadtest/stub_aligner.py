@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Stand-in for the external aligner tools, dispatched on the name it is run as.
+
+The load test links this script into a bin directory on the server's PATH
+as nucmer, delta-filter, delta2maf, mugsyWGA and maf2fasta.pl.  mugsyWGA
+writes a single block aligning the start of the first contig of every
+genome, which is enough for the server to save, index and query an
+alignment.  LOADTEST_ALIGN_SECONDS adds a sleep to mugsyWGA to stand in for
+real alignment time.
+"""
+import os
+import sys
+import time
+
+
+BLOCK_COLUMNS = 2000
+
+
+def read_fasta(path):
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                records.append([line[1:].split()[0], []])
+            elif records:
+                records[-1][1].append(line.strip())
+    return [(name, ''.join(seq)) for name, seq in records]
+
+
+def nucmer(args):
+    prefix = [a for a in args if a.startswith('--prefix=')][0][len('--prefix='):]
+    with open(prefix + '.delta', 'w') as out:
+        out.write('{}\nNUCMER\n'.format(' '.join(args[-2:])))
+
+
+def delta_filter(args):
+    with open(args[-1], 'r') as f:
+        sys.stdout.write(f.read())
+
+
+def delta2maf(args):
+    sys.stdout.write('##maf version=1 scoring=mugsy\n')
+
+
+def mugsy_wga(args):
+    time.sleep(float(os.environ.get('LOADTEST_ALIGN_SECONDS') or 0))
+    outfile = args[args.index('--outfile') + 1]
+    firsts = []
+    seen = set()
+    for name, seq in read_fasta(args[args.index('--seq') + 1]):
+        genome = name.split('.')[0]
+        if genome not in seen:
+            seen.add(genome)
+            firsts.append((name, seq))
+    columns = min([BLOCK_COLUMNS] + [len(seq) for _, seq in firsts])
+    with open(outfile + '.maf', 'w') as out:
+        out.write('##maf version=1 scoring=mugsy\na score=0 label=1 mult={}\n'.format(len(firsts)))
+        for name, seq in firsts:
+            out.write('s {} 0 {} + {} {}\n'.format(name, columns, len(seq), seq[:columns]))
+        out.write('\n')
+
+
+def maf2fasta(args):
+    in_block = False
+    for line in sys.stdin:
+        if line.startswith('s '):
+            _, src, start, size, _, _, text = line.split()
+            sys.stdout.write('>{}:{}-{}\n{}\n'.format(
+                src, int(start) + 1, int(start) + int(size), text))
+            in_block = True
+        elif not line.strip() and in_block:
+            sys.stdout.write('=\n')
+            in_block = False
+
+
+TOOLS = {
+    'nucmer': nucmer,
+    'delta-filter': delta_filter,
+    'delta2maf': delta2maf,
+    'mugsyWGA': mugsy_wga,
+    'maf2fasta.pl': maf2fasta
+}
+
+
+if __name__ == '__main__':
+    TOOLS[os.path.basename(sys.argv[0])](sys.argv[1:])
@@ -0,0 +1,83 @@
+import unittest
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import urllib2
+
+from loadtest.standin import WorkspaceStandIn, serve
+from loadtest.loadtest import parse_mix, parse_server, summarize, Workload
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoadTestTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = WorkspaceStandIn()
+        cls.refs = cls.standin.add_genomes(3, length=1000)
+        cls.server, cls.url = serve(cls.standin)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def call(self, method, *params):
+        body = json.dumps({'version': '1.1', 'method': method, 'params': list(params), 'id': '1'})
+        try:
+            resp = urllib2.urlopen(urllib2.Request(self.url, body)).read()
+        except urllib2.HTTPError as e:
+            resp = e.read()
+        return json.loads(resp)
+
+    def test_workspace(self):
+        genome = self.call('Workspace.get_objects', [{'ref': self.refs[1]}])['result'][0][0]
+        contigset = self.standin.resolve(genome['data']['contigset_ref'])
+        self.assertEqual(len(contigset['data']['contigs']), 2)
+        info = self.call('Workspace.save_objects', {'id': 1, 'objects': [
+            {'type': 'T', 'name': 'genome_2', 'data': {}}]})['result'][0][0]
+        self.assertEqual(info[4], 2)
+        info = self.call('Workspace.get_object_info_new', {'objects': [{'ref': 'loadtest/genome_2'}]})
+        self.assertEqual(info['result'][0][0][4], 2)
+        self.assertIn('error', self.call('Workspace.get_objects', [{'ref': '1/99'}]))
+
+    def test_jobs(self):
+        job_id = self.call('KBaseJobService.run_job', {'method': 'M.m', 'params': [{}]})['result'][0]
+        state = self.call('KBaseJobService.check_job', job_id)['result'][0]
+        self.assertEqual(state['finished'], 1)
+
+    def test_stub_aligner(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            for tool in ('mugsyWGA', 'maf2fasta.pl'):
+                os.symlink(os.path.join(HERE, 'loadtest', 'stub_aligner.py'), os.path.join(tmp, tool))
+            fasta = os.path.join(tmp, 'all.fasta')
+            with open(fasta, 'w') as f:
+                f.write('>1.a\nACGTACGT\n>1.b\nTT\n>2.a\nACGAAC\n')
+            subprocess.check_call([os.path.join(tmp, 'mugsyWGA'), '--outfile', os.path.join(tmp, 'out'),
+                                   '--seq', fasta, '--aln', fasta])
+            with open(os.path.join(tmp, 'out.maf')) as f:
+                out = subprocess.Popen([os.path.join(tmp, 'maf2fasta.pl')], stdin=f,
+                                       stdout=subprocess.PIPE).communicate()[0]
+            self.assertEqual(out, '>1.a:1-6\nACGTAC\n>2.a:1-6\nACGAAC\n=\n')
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_settings(self):
+        self.assertEqual(parse_mix('run_mugsy=1,run_mugsy_check'), [('run_mugsy', 1.0), ('run_mugsy_check', 1.0)])
+        self.assertEqual(parse_server('uwsgi:processes=5,threads=5'), ('uwsgi', {'processes': 5, 'threads': 5}))
+        self.assertRaises(ValueError, parse_server, 'uwsgi:workers=2')
+
+    def test_workload(self):
+        workload = Workload(self.refs)
+        method, params = workload.params_for('run_mugsy_check')
+        self.assertEqual(method, 'run_mugsy_async')
+        workload.record(method, '7')
+        self.assertEqual(workload.params_for('run_mugsy_check'), ('run_mugsy_check', '7'))
+        rows = summarize([('a', 0.1, None), ('a', 0.3, 'boom'), ('b', 0.2, None)], 2.0)
+        self.assertEqual(rows['a'][:3], (2, 1, 1.0))
+        self.assertEqual(rows['all'][0], 3)
+        self.assertAlmostEqual(rows['all'][3], 200.0)
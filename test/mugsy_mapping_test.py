@@ -0,0 +1,154 @@
+import unittest
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from distutils.spawn import find_executable
+
+from WholeGenomeAlignment import mugsy_mapping
+from WholeGenomeAlignment.cache import FileCache
+from WholeGenomeAlignment.mugsy_mapping import PairwiseMapper, chain_command, concatenate
+
+
+# stands in for nucmer, delta-filter and delta2maf: a one-block MAF of the
+# first records of the pair; fails on the first attempt at prefixes ending
+# with a suffix given as the fourth argument, counting attempts in the fifth
+FAKE_MAPPING = """
+import sys
+fasta_a, fasta_b, prefix = sys.argv[1:4]
+if len(sys.argv) > 4:
+    with open(sys.argv[5], 'a') as f:
+        f.write(prefix + '\\n')
+    with open(sys.argv[5]) as f:
+        tries = f.read().split().count(prefix)
+    if prefix.endswith(sys.argv[4]) and tries < 2:
+        sys.exit('nucmer crashed')
+names = []
+for fasta in (fasta_a, fasta_b):
+    with open(fasta) as f:
+        names.append(f.readline()[1:].strip())
+with open(prefix + '.maf', 'w') as out:
+    out.write('##maf version=1\\na\\ns {} 0 4 + 4 ACGT\\ns {} 0 4 + 4 ACGT\\n\\n'.format(*names))
+"""
+
+
+def fake_pair_command(*extra):
+    return lambda fasta_a, fasta_b, prefix: [sys.executable, '-c', FAKE_MAPPING,
+                                             fasta_a, fasta_b, prefix] + list(extra)
+
+
+def maf_blocks(maf_file):
+    """Sorted 's' lines of each block, sorted, for comparing alignments."""
+    blocks = []
+    with open(maf_file) as f:
+        for line in f:
+            if line.startswith('a'):
+                blocks.append([])
+            elif line.startswith('s ') and blocks:
+                blocks[-1].append(' '.join(line.split()))
+    return sorted(sorted(block) for block in blocks)
+
+
+class MugsyMappingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.inputs = []
+        for key, seq in (('1', 'ACGT'), ('2', 'ACGA'), ('3', 'TCGA')):
+            path = os.path.join(self.tmp, '{}.fa'.format(key))
+            with open(path, 'w') as f:
+                f.write('>contig.{}\n{}\n'.format(key, seq))
+            self.inputs.append((key, path))
+        self.pair_command = mugsy_mapping.pair_command
+        mugsy_mapping.pair_command = fake_pair_command()
+
+    def tearDown(self):
+        mugsy_mapping.pair_command = self.pair_command
+        shutil.rmtree(self.tmp)
+
+    def mapper(self, name):
+        work_dir = os.path.join(self.tmp, name)
+        os.makedirs(work_dir)
+        return PairwiseMapper(FileCache(os.path.join(self.tmp, 'cache')), work_dir)
+
+    def test_cached_pairs_are_renamed(self):
+        mapper = self.mapper('job1')
+        fasta_files, maf_files = mapper.map_all(self.inputs[:2])
+        self.assertEqual((mapper.hits, mapper.misses), (0, 1))
+        with open(fasta_files[0]) as f:
+            self.assertEqual(f.readline(), '>1.contig.1\n')
+
+        # genome 3 becomes key 1 in the next job: only its pairs are new,
+        # and the cached pair comes back under that job's keys
+        mapper = self.mapper('job2')
+        inputs = [('1', self.inputs[2][1]), ('2', self.inputs[0][1]), ('3', self.inputs[1][1])]
+        fasta_files, maf_files = mapper.map_all(inputs)
+        self.assertEqual((mapper.hits, mapper.misses), (1, 2))
+        with open(maf_files[2]) as f:
+            rows = [line.split()[1] for line in f if line.startswith('s ')]
+        self.assertEqual(rows, ['2.contig.1', '3.contig.2'])
+
+    def test_parallel_failures(self):
+        attempts = os.path.join(self.tmp, 'attempts')
+        # fails for the first attempt at every pair with genome 3
+        mugsy_mapping.pair_command = fake_pair_command('-3', attempts)
+        mapper = self.mapper('job')
+        mapper.processes = 3
+        fasta_files, maf_files = mapper.map_all(self.inputs)
+        self.assertEqual((mapper.misses, mapper.retried), (3, 2))
+        self.assertTrue(all(os.path.exists(maf) for maf in maf_files))
+
+        mugsy_mapping.pair_command = lambda *args: ['false']
+        mapper = self.mapper('failing')
+        mapper.cache = FileCache(os.path.join(self.tmp, 'empty'))
+        with self.assertRaises(ValueError) as cm:
+            mapper.map_all(self.inputs)
+        self.assertIn('3 of 3 pairs', str(cm.exception))
+        self.assertEqual(len(mapper.usages), 6)
+
+    def test_wrapper_command_lines(self):
+        command = self.pair_command('1.fa', '2.fa', 'map/1-2')
+        self.assertEqual(command[:2], ['sh', '-c'])
+        self.assertIn('nucmer -l 15 --prefix="$3" "$1" "$2"', command[2])
+        self.assertIn('delta-filter -1 "$3.delta" > "$3.filtered.delta"', command[2])
+        self.assertIn('delta2maf "$3.filtered.delta" > "$3.maf"', command[2])
+        self.assertEqual(command[4:], ['1.fa', '2.fa', 'map/1-2'])
+        self.assertEqual(chain_command('out', 'x', 'all.fa', 'all.maf')[-4:],
+                         ['--distance', '1000', '--minlength', '30'])
+        self.assertEqual(chain_command('out', 'x', 'all.fa', 'all.maf', 0, 500)[-4:],
+                         ['--distance', '500', '--minlength', '0'])
+
+    @unittest.skipUnless(find_executable('mugsy') and find_executable('mugsyWGA'),
+                         'mugsy is not installed')
+    def test_matches_the_mugsy_wrapper(self):
+        mugsy_mapping.pair_command = self.pair_command
+        rng = random.Random(3)
+        base = ''.join(rng.choice('ACGT') for _ in range(20000))
+        inputs = []
+        for key in ('1', '2', '3'):
+            seq = list(base)
+            for _ in range(200):
+                seq[rng.randrange(len(seq))] = rng.choice('ACGT')
+            path = os.path.join(self.tmp, 'genomes', '{}.fa'.format(key))
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('>contig\n{}\n'.format(''.join(seq)))
+            inputs.append((key, path))
+
+        wrapper_dir = os.path.join(self.tmp, 'wrapper')
+        os.makedirs(wrapper_dir)
+        subprocess.check_call(['mugsy', '--directory', wrapper_dir, '--prefix', 'out'] +
+                              [path for _, path in inputs])
+
+        mapper = self.mapper('mapped')
+        mapper.processes = 2
+        fasta_files, maf_files = mapper.map_all(inputs)
+        cmd = chain_command(mapper.work_dir, 'out',
+                            concatenate(fasta_files, os.path.join(mapper.work_dir, 'all.fasta')),
+                            concatenate(maf_files, os.path.join(mapper.work_dir, 'pairwise.maf')))
+        subprocess.check_call(cmd)
+        self.assertEqual(maf_blocks(os.path.join(mapper.work_dir, 'out.maf')),
+                         maf_blocks(os.path.join(wrapper_dir, 'out.maf')))
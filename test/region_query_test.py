@@ -0,0 +1,74 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.region_query import RegionCache, query_region
+
+
+class RegionQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.contigs = [{'id': '1:1-10', 'sequence': 'ACGTA-CGTAC',
+                         'description': '1:1-10 + /kb/1.fa'},
+                        {'id': '2:11-21', 'sequence': 'ACGTAACGTAC',
+                         'description': '2:11-21 - /kb/2.fa'},
+                        {'id': '1:20-25', 'sequence': 'GGGCCC'},
+                        {'id': '2:1-5', 'sequence': 'GGGCC-'}]
+        self.fetched = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def fetch(self):
+        self.fetched += 1
+        return self.contigs
+
+    def test_window_and_cache(self):
+        cache = RegionCache(self.tmp)
+        info = [7, 'aln', 'ComparativeGenomics.WholeGenomeAlignment-1.0', '', 3, '', 5]
+        index = cache.index_for(info, self.fetch)
+        region = query_region(index, '1', 2, 6)
+        self.assertEqual(len(region['blocks']), 1)
+        rows = region['blocks'][0]['rows']
+        self.assertEqual([(r['start'], r['end'], r['sequence']) for r in rows],
+                         [(3, 6, 'GTA-C'), (15, 19, 'GTAAC')])
+
+        cache.index_for(info, self.fetch)
+        RegionCache(self.tmp).index_for(info, self.fetch)
+        self.assertEqual(self.fetched, 1)
+
+    def test_limits(self):
+        infos = [[i, 'aln', '', '', 1, '', 1] for i in range(3)]
+        cache = RegionCache(self.tmp, max_bytes=0, max_indexes=2)
+        for info in infos:
+            cache.index_for(info, self.fetch)
+        self.assertEqual(list(cache.indexes), [cache.path_for(info) for info in infos[1:]])
+        # only the copies still loaded are kept over the byte budget
+        self.assertFalse(os.path.exists(cache.path_for(infos[0])))
+        self.assertTrue(all(os.path.exists(cache.path_for(info)) for info in infos[1:]))
+        cache.index_for(infos[0], self.fetch)
+        self.assertEqual(self.fetched, 4)
+
+    def test_pages(self):
+        index = RegionCache(self.tmp).index_for([1, 'a', '', '', 1, '', 1], self.fetch)
+        region = query_region(index, '2', 0, 30, page_size=4, page=1)
+        self.assertEqual((region['total_columns'], region['pages']), (16, 4))
+        self.assertEqual([b['columns'] for b in region['blocks']], [1, 3])
+        self.assertEqual(region['blocks'][1]['rows'][1]['start'], 19)
+
+    def test_page_out_of_range(self):
+        index = RegionCache(self.tmp).index_for([1, 'a', '', '', 1, '', 1], self.fetch)
+        self.assertRaises(ValueError, query_region, index, '2', 0, 30, page_size=4, page=4)
+        self.assertRaises(ValueError, query_region, index, '2', 0, 30, page_size=4, page=-1)
+        self.assertRaises(ValueError, query_region, index, '2', 0, 30, page=1)
+
+    def test_rows_without_coordinates(self):
+        self.contigs[1] = {'id': '2.chr', 'sequence': 'ACGTAACGTAC'}
+        index = RegionCache(self.tmp).index_for([1, 'a', '', '', 2, '', 1], self.fetch)
+        rows = query_region(index, '1', 2, 6)['blocks'][0]['rows']
+        self.assertEqual([(r['genome'], r['start'], r['end'], r['sequence']) for r in rows],
+                         [('1', 3, 6, 'GTA-C'), ('2', 0, 0, 'GTAAC')])
+        # the unplaced row is not indexed, so only 2:1-5 could anchor a query
+        self.assertEqual(query_region(index, '2', 5, 100)['blocks'], [])
@@ -0,0 +1,38 @@
+import unittest
+import subprocess
+import sys
+
+from WholeGenomeAlignment import resources
+from WholeGenomeAlignment.resources import ProcessMonitor, Usage
+
+
+# a child that waits for a grandchild holding about 50 MB
+GRANDCHILD = ('import subprocess, sys; subprocess.check_call([sys.executable, "-c", '
+              '"import time; x = bytearray(50 << 20); time.sleep(1.5)"])')
+
+
+class ResourcesTest(unittest.TestCase):
+
+    def test_cpu_and_returncode(self):
+        p = subprocess.Popen([sys.executable, '-c', 'sum(range(3000000)); raise SystemExit(3)'])
+        monitor = ProcessMonitor(p, 'python')
+        self.assertEqual(monitor.wait(), 3)
+        self.assertEqual(p.returncode, 3)
+        self.assertGreater(monitor.usage.user + monitor.usage.sys, 0)
+        self.assertGreater(monitor.usage.peak_rss, 0)
+
+    def test_tree_peak(self):
+        usage = resources.check_call([sys.executable, '-c', GRANDCHILD], 'tree')
+        self.assertGreater(usage.peak_rss, 50 << 20)
+        self.assertGreaterEqual(usage.wall, 1.5)
+        with self.assertRaises(subprocess.CalledProcessError):
+            resources.check_call('exit 2', shell=True)
+
+    def test_total(self):
+        usages = [Usage('a', wall=1, user=2, peak_rss=10, read_bytes=4),
+                  Usage('b', wall=2, sys=1, peak_rss=30, write_bytes=5)]
+        t = resources.total(usages)
+        self.assertEqual((t.wall, t.user, t.sys, t.peak_rss, t.read_bytes, t.write_bytes, t.processes),
+                         (3, 2, 1, 30, 4, 5, 2))
+        self.assertEqual(resources.format_bytes(3 << 20), '3.0 MB')
+        self.assertIn('peak RSS 30 B', t.describe())
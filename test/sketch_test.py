@@ -0,0 +1,50 @@
+import unittest
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+
+from WholeGenomeAlignment.alignment_io import reverse_complement
+from WholeGenomeAlignment.cache import FileCache
+from WholeGenomeAlignment.sketch import SketchCache, kmer_hashes, leaf_order, mash_distance
+
+
+def mutate(seq, rate, rng):
+    return ''.join(rng.choice('ACGT') if rng.random() < rate else c for c in seq)
+
+
+class SketchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = random.Random(1)
+        base = ''.join(rng.choice('ACGT') for _ in range(20000))
+        self.files = []
+        for i, seq in enumerate([base, mutate(base, 0.01, rng), mutate(base, 0.1, rng)]):
+            path = os.path.join(self.tmp, '{}.fa'.format(i + 1))
+            with open(path, 'w') as f:
+                f.write('>c1\n{}\n>c2\n{}\n'.format(seq[:12000], seq[12000:]))
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_canonical(self):
+        seq = 'ACGTTGCANNACGGTACCATGACAGTTACA'
+        self.assertTrue(np.array_equal(np.sort(kmer_hashes(seq, 5)),
+                                       np.sort(kmer_hashes(reverse_complement(seq), 5))))
+        self.assertEqual(len(kmer_hashes(seq, 5)), len(seq) - 4 - 6)
+
+    def test_guide_tree(self):
+        cache = SketchCache(FileCache(os.path.join(self.tmp, 'cache')))
+        d, tree, hits, misses = cache.guide_tree(self.files, ['seq1', 'seq2', 'seq3'])
+        self.assertEqual((hits, misses), (0, 3))
+        self.assertTrue(d[0, 1] < d[0, 2])
+        self.assertAlmostEqual(d[0, 1], 0.01, delta=0.005)
+        self.assertEqual(sorted(leaf_order(tree)), ['seq1', 'seq2', 'seq3'])
+        hits, misses = cache.guide_tree(self.files, ['seq1', 'seq2', 'seq3'])[2:]
+        self.assertEqual((hits, misses), (3, 0))
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        self.assertEqual(mash_distance(cache.sketch(self.files[0]), cache.sketch(self.files[0])), 0)
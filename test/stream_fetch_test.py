@@ -0,0 +1,55 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from WholeGenomeAlignment import stream_fetch
+from WholeGenomeAlignment.dedup import GenomeDeduplicator
+from loadtest.standin import WorkspaceStandIn, serve
+
+
+@unittest.skipUnless(stream_fetch.available(), 'ijson is not installed')
+class StreamFetchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = WorkspaceStandIn()
+        cls.refs = cls.standin.add_genomes(2, length=1000)
+        cls.server, cls.url = serve(cls.standin)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_same_fasta_as_seqio(self):
+        contigset_ref = self.standin.resolve(self.refs[0])['data']['contigset_ref']
+        obj = self.standin.resolve(contigset_ref)
+        obj['info'][10] = {'source': 'test'}
+        streamed = os.path.join(self.tmp, 'streamed.fa')
+        info, md5s = stream_fetch.stream_contigset_fasta(self.url, 'token', contigset_ref, streamed)
+        self.assertEqual(info, obj['info'])
+
+        written = os.path.join(self.tmp, 'seqio.fa')
+        SeqIO.write((SeqRecord(Seq(c['sequence']), id=c['id'], description='')
+                     for c in obj['data']['contigs']), written, 'fasta')
+        with open(streamed) as a, open(written) as b:
+            self.assertEqual(a.read(), b.read())
+
+        dedup = GenomeDeduplicator()
+        dedup.check_sequence(0, obj['data']['contigs'])
+        self.assertEqual(dedup.check_sequence_md5s(1, md5s), 0)
+
+    def test_error(self):
+        with self.assertRaises(ValueError) as cm:
+            stream_fetch.stream_contigset_fasta(self.url, 'token', '1/99', os.path.join(self.tmp, 'x.fa'))
+        self.assertIn('No object with reference 1/99', str(cm.exception))
@@ -0,0 +1,104 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.batch import SharedInputs
+from WholeGenomeAlignment.stream_fetch import post
+from WholeGenomeAlignment.subset_fetch import fetch_inputs, fetch_subsets, subset_spec, type_name
+from loadtest.standin import WorkspaceStandIn, serve
+
+
+class WorkspaceClient(object):
+    """Workspace.<name>(*params) over JSON-RPC, as the generated client calls it."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def __getattr__(self, name):
+        def call(*params):
+            response = post(self.url, 'token', 'Workspace.' + name, list(params))
+            try:
+                return json.load(response)['result'][0]
+            finally:
+                response.close()
+        return call
+
+
+class SubsetFetchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = WorkspaceStandIn()
+        cls.refs = cls.standin.add_genomes(2, length=1000, features=200)
+        cls.server, cls.url = serve(cls.standin)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.standin.calls.clear()
+        self.standin.bytes_out.clear()
+        self.ws = WorkspaceClient(self.url)
+
+    def test_type_specs(self):
+        genome = self.standin.resolve(self.refs[0])
+        contigset = self.standin.resolve(genome['data']['contigset_ref'])
+        self.assertEqual(type_name(genome['info']), 'Genome')
+        self.assertEqual(subset_spec('1/2/1', genome['info'])['included'],
+                         ['scientific_name', 'contigset_ref'])
+        self.assertEqual(subset_spec('1/1/1', contigset['info'])['included'],
+                         ['contigs/[*]/id', 'contigs/[*]/sequence'])
+        info = list(genome['info'])
+        info[2] = 'KBaseSearch.GenomeSet-2.0'
+        self.assertEqual(subset_spec('1/5/1', info), {'ref': '1/5/1'})
+
+    def test_only_included_paths(self):
+        contigset_ref = self.standin.resolve(self.refs[0])['data']['contigset_ref']
+        genome, contigset = fetch_subsets(self.ws, [self.refs[0], contigset_ref])
+        self.assertEqual(sorted(genome['data']), ['contigset_ref', 'scientific_name'])
+        self.assertEqual(genome['data']['contigset_ref'], contigset_ref)
+        self.assertEqual(sorted(contigset['data']), ['contigs'])
+        full = self.standin.resolve(contigset_ref)['data']['contigs']
+        self.assertEqual(contigset['data']['contigs'],
+                         [{'id': c['id'], 'sequence': c['sequence']} for c in full])
+        self.assertEqual(self.standin.calls, {'Workspace.get_object_info_new': 1,
+                                              'Workspace.get_object_subset': 1})
+
+    def test_fewer_bytes(self):
+        self.ws.get_objects([{'ref': ref} for ref in self.refs])
+        fetch_subsets(self.ws, self.refs)
+        subset = (self.standin.bytes_out['Workspace.get_object_info_new'] +
+                  self.standin.bytes_out['Workspace.get_object_subset'])
+        self.assertLess(subset * 10, self.standin.bytes_out['Workspace.get_objects'])
+
+    def test_inputs_without_contigs(self):
+        contigset_ref = self.standin.resolve(self.refs[0])['data']['contigset_ref']
+        genome, contigset = fetch_inputs(self.ws, [self.refs[0], contigset_ref])
+        self.assertEqual(sorted(genome['data']), ['contigset_ref', 'scientific_name'])
+        self.assertIsNone(contigset['data'])
+        self.assertEqual(type_name(contigset['info']), 'ContigSet')
+        self.assertEqual(self.standin.calls, {'Workspace.get_object_info_new': 1,
+                                              'Workspace.get_object_subset': 1})
+        self.assertEqual(fetch_inputs(self.ws, []), [])
+
+    def test_shared_prefetch(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            shared = SharedInputs(os.path.join(tmp, 'batch'))
+            contigset_ref = self.standin.resolve(self.refs[0])['data']['contigset_ref']
+            objects = shared.prefetch(self.ws, self.refs + [contigset_ref], subset=True)
+            self.assertEqual([sorted(g['data']) for g in objects[:2]],
+                             [['contigset_ref', 'scientific_name']] * 2)
+            # ContigSets are not held; their FASTA is written when first used
+            self.assertIsNone(objects[2]['data'])
+            self.assertEqual(fetch_subsets(self.ws, []), [])
+            self.assertNotIn('Workspace.get_objects', self.standin.calls)
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from WholeGenomeAlignment.supervisor import EventLoop, Supervisor
+from WholeGenomeAlignment.checkpoint import JobCheckpoint, JobLock, job_dir, load_json, save_json
+
+
+def running(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            # killed orphans can linger as zombies until init reaps them
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except IOError:
+        return False
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_output_and_returncode(self):
+        lines = []
+        returncode, usage = Supervisor(timeout=30).run(
+            ['sh', '-c', 'echo one; echo two >&2; exit 4'], 'sh', lines.append)
+        self.assertEqual((returncode, lines), (4, ['one', 'two']))
+        self.assertEqual(usage.label, 'sh')
+
+    def test_timeout_kills_group(self):
+        pid_file = os.path.join(self.tmp, 'pid')
+        # the background sleep keeps running after its shell is killed
+        # unless the whole process group is stopped
+        cmd = ['sh', '-c', 'sleep 30 & echo $! > {}; echo started; wait'.format(pid_file)]
+        start = time.time()
+        with self.assertRaises(ValueError) as cm:
+            Supervisor(timeout=1, kill_grace=1).run(cmd, 'sleeper', lambda line: None)
+        self.assertLess(time.time() - start, 10)
+        self.assertIn('sleeper timed out after 1 s', str(cm.exception))
+        with open(pid_file) as f:
+            pid = int(f.read())
+        time.sleep(0.2)
+        self.assertFalse(running(pid))
+
+    def test_fatal_output(self):
+        cmd = ['sh', '-c', 'echo working; echo "std::bad_alloc"; sleep 30']
+        start = time.time()
+        with self.assertRaises(ValueError) as cm:
+            Supervisor().run(cmd, 'aligner', lambda line: None)
+        self.assertLess(time.time() - start, 10)
+        self.assertIn('fatal output matching "std::bad_alloc"', str(cm.exception))
+        self.assertIn('working', str(cm.exception))
+
+    def test_many_runs_one_loop(self):
+        loop = EventLoop()
+        supervisor = Supervisor(timeout=30, loop=loop)
+        threads = threading.active_count()
+        outputs = [[] for _ in range(20)]
+        start = time.time()
+        runs = [supervisor.start(['sh', '-c', 'sleep 1; echo run {}; printf tail'.format(i)],
+                                 'sh', outputs[i].append) for i in range(20)]
+        loop.run_until_done(runs)
+        # concurrent, and without a thread per process
+        self.assertLess(time.time() - start, 8)
+        self.assertEqual(threading.active_count(), threads)
+        for i, run in enumerate(runs):
+            returncode, usage = run.result()
+            self.assertEqual(returncode, 0)
+            self.assertEqual(outputs[i], ['run {}'.format(i), 'tail'])
+            self.assertGreaterEqual(usage.wall, 1)
+        self.assertEqual(loop.pending(), 0)
+
+    def test_timeout_among_runs(self):
+        loop = EventLoop()
+        quick = Supervisor(timeout=30, loop=loop).start(['sh', '-c', 'echo quick'], 'quick',
+                                                        lambda line: None)
+        slow = Supervisor(timeout=1, kill_grace=1, loop=loop).start(['sleep', '30'], 'slow',
+                                                                    lambda line: None)
+        loop.run_until_done()
+        self.assertEqual(quick.result()[0], 0)
+        with self.assertRaises(ValueError) as cm:
+            slow.result()
+        self.assertIn('slow timed out after 1 s', str(cm.exception))
+
+    def test_handlers_off_the_loop(self):
+        loop = EventLoop()
+        supervisor = Supervisor(timeout=30, loop=loop)
+        release = threading.Event()
+        slow_lines = []
+
+        def slow(line):
+            release.wait(10)
+            slow_lines.append(line)
+        blocked = supervisor.start(['sh', '-c', 'echo one; echo two'], 'blocked', slow)
+        quick_lines = []
+        quick = supervisor.start(['sh', '-c', 'sleep 0.5; echo quick'], 'quick', quick_lines.append)
+        # the loop keeps reaping other runs while a handler is stuck
+        while not quick.finished:
+            loop.step(0.1)
+        self.assertFalse(blocked.done.is_set())
+        release.set()
+        loop.run_until_done()
+        self.assertEqual(blocked.result()[0], 0)
+        self.assertEqual(slow_lines, ['one', 'two'])
+        self.assertEqual(quick_lines, ['quick'])
+
+    def test_handler_failure(self):
+        def fail(line):
+            raise IOError('log closed')
+        with self.assertRaises(ValueError) as cm:
+            Supervisor(timeout=30, kill_grace=1).run(['sh', '-c', 'echo one; sleep 30'], 'sh', fail)
+        self.assertIn('output handler failed: log closed', str(cm.exception))
+
+    def test_checkpoint(self):
+        params = {'output_alignment_name': 'a', 'input_genome_refs': ['1/genome']}
+        path = job_dir(self.tmp, 'run_mugsy', params, ['1/2/3'])
+        self.assertEqual(job_dir(self.tmp, 'run_mugsy', dict(params, resume=1, timeout=5), ['1/2/3']), path)
+        self.assertNotEqual(job_dir(self.tmp, 'run_mauve', params, ['1/2/3']), path)
+        # the same ref by name, now resolving to a new version
+        self.assertNotEqual(job_dir(self.tmp, 'run_mugsy', params, ['1/2/4']), path)
+
+        out = os.path.join(path, 'out.maf')
+        with open(out, 'w') as f:
+            f.write('##maf\n')
+        JobCheckpoint(path).complete('align', [out])
+        self.assertTrue(JobCheckpoint(path).done('align'))
+        self.assertFalse(JobCheckpoint(path).done('fasta'))
+        with open(out, 'a') as f:
+            f.write('a score=1\n')
+        self.assertFalse(JobCheckpoint(path).done('align'))
+
+    def test_fetch_checkpoint(self):
+        path = job_dir(self.tmp, 'run_mauve', {}, [])
+        fasta = os.path.join(path, '1.fa')
+        with open(fasta, 'w') as f:
+            f.write('>a\nACGT\n')
+        state_file = os.path.join(path, 'fetch.json')
+        save_json(state_file, {'fasta_files': [fasta], 'key_of': [[0, '1'], [1, '2']]})
+        JobCheckpoint(path).complete('fetch', [fasta, state_file])
+        self.assertTrue(JobCheckpoint(path).done('fetch'))
+        self.assertEqual(load_json(state_file)['key_of'], [[0, '1'], [1, '2']])
+        os.remove(fasta)
+        self.assertFalse(JobCheckpoint(path).done('fetch'))
+
+    def test_job_lock(self):
+        path = job_dir(self.tmp, 'run_mugsy', {}, [])
+        lock = JobLock(path)
+        with self.assertRaises(ValueError) as cm:
+            JobLock(path)
+        self.assertIn('in use by another run', str(cm.exception))
+        lock.release()
+        JobLock(path).release()
@@ -0,0 +1,77 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from WholeGenomeAlignment.alignment_index import AlignmentIndex
+from WholeGenomeAlignment.alignment_io import read_maf
+from WholeGenomeAlignment.variants import write_vcf
+
+
+class VariantsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.maf = os.path.join(self.tmp, 'out.maf')
+        with open(self.maf, 'w') as f:
+            f.write('\n'.join([
+                'a score=1',
+                's 1.chr 20 8 + 40 ACGTACGT',
+                's 2.chr 0 7 - 10 ACGAA-GT',
+                '',
+                'a score=2',
+                's 1.chr 0 8 + 40 ACGT--ACGT',
+                's 2.chr 0 10 + 10 ACGTTTACNT',
+                's 3.chr 0 8 + 8 ACGTAC--TT',
+                '']))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def records(self, vcf_file):
+        with open(vcf_file) as f:
+            lines = [line.rstrip('\n').split('\t') for line in f if not line.startswith('##')]
+        return lines[0], lines[1:]
+
+    def test_write_vcf(self):
+        index = AlignmentIndex.build(self.maf)
+        vcf_file = os.path.join(self.tmp, 'out.vcf')
+        writer = write_vcf(index.ordered_blocks('1'), vcf_file, '1', ['1', '2', '3'])
+        self.assertEqual((writer.snps, writer.indels), (2, 2))
+        header, records = self.records(vcf_file)
+        self.assertEqual(header[-3:], ['1', '2', '3'])
+        self.assertEqual([r[:5] + r[-3:] for r in records], [
+            ['chr', '4', '.', 'TAC', 'TTTAC', '0', '1', '0'],
+            ['chr', '7', '.', 'G', 'T', '0', '.', '1'],
+            ['chr', '24', '.', 'T', 'A', '0', '1', '.'],
+            ['chr', '25', '.', 'AC', 'A', '0', '1', '.'],
+        ])
+
+    def test_minus_strand_reference(self):
+        vcf_file = os.path.join(self.tmp, 'out.vcf')
+        block = next(read_maf(self.maf))
+        write_vcf([block], vcf_file, '2', ['2', '1'])
+        _, records = self.records(vcf_file)
+        self.assertEqual([r[:5] + r[-2:] for r in records], [
+            ['chr', '5', '.', 'C', 'CG', '0', '1'],
+            ['chr', '7', '.', 'T', 'A', '0', '1'],
+        ])
+
+    def test_indel_at_block_start(self):
+        maf = os.path.join(self.tmp, 'lead.maf')
+        with open(maf, 'w') as f:
+            f.write('\n'.join([
+                'a score=1',
+                's 1.chr 0 4 + 40 -ACGT',
+                's 2.chr 0 5 + 10 TACGT',
+                '',
+                'a score=1',
+                's 1.chr 20 4 + 40 -ACGT',
+                's 2.chr 5 5 + 10 GACGT',
+                '']))
+        vcf_file = os.path.join(self.tmp, 'out.vcf')
+        writer = write_vcf(read_maf(maf), vcf_file, '1', ['1', '2'])
+        _, records = self.records(vcf_file)
+        # only the first starts the reference contig and may be right-anchored
+        self.assertEqual([r[:5] for r in records], [['chr', '1', '.', 'A', 'TA']])
+        self.assertEqual(writer.unanchored_indels, 1)